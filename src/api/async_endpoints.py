@@ -0,0 +1,207 @@
+"""
+Async variant of the fraud API routes
+
+Database I/O goes through an AsyncSession, so a worker keeps serving other
+requests while it waits on the database instead of tying up a threadpool
+thread per request. Scoring is CPU-bound and still runs in the threadpool,
+to keep it off the event loop.
+
+Only the detection and reporting routes are ported. The remaining routes
+(listings, metrics and rule administration) are served by the sync handlers
+of endpoints.router. The fraud detector, rule cache and scoring pool are
+shared with the sync routes.
+"""
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+import time
+import uuid
+
+from ..database import async_crud
+from ..database.async_database import get_async_db
+from ..models.combined_model import decision_threshold
+from ..models.scoring_pool import score_transactions
+from . import endpoints, schemas
+from .endpoints import describe_fraud_reason, fraud_detector, rule_cache, score_transaction, transaction_record
+
+# Create router
+router = APIRouter()
+
+async def store_records(db, records):
+    """
+    Store transaction rows in one transaction, logging (not raising) database errors
+
+    If the rows cannot be inserted together (e.g. a duplicate transaction ID),
+    they are stored one by one so that only the failing rows are lost.
+
+    Args:
+        db (AsyncSession): Database session
+        records (list): Column values from endpoints.transaction_record()
+    """
+    writer = endpoints.transaction_writer
+    if writer is not None:
+        # Only wait (in the threadpool) when the write-behind queue is full
+        remaining = writer.try_submit(records)
+        if remaining:
+            await run_in_threadpool(writer.submit, remaining)
+        return
+
+    try:
+        await async_crud.create_transactions(db, records)
+        return
+    except Exception as e:
+        await db.rollback()
+        if len(records) == 1:
+            print(f"Error storing transaction {records[0]['transaction_id']}: {str(e)}")
+            return
+        print(f"Bulk insert of {len(records)} transactions failed, storing them one by one: {str(e)}")
+    for record in records:
+        try:
+            await async_crud.create_transactions(db, [record])
+        except Exception as e:
+            await db.rollback()
+            print(f"Error storing transaction {record['transaction_id']}: {str(e)}")
+
+@router.post("/detect", response_model=schemas.TransactionResponse)
+async def detect_fraud(transaction: schemas.TransactionCreate, explain: bool = False,
+                       db: AsyncSession = Depends(get_async_db)):
+    """
+    Detect fraud for a single transaction
+
+    Args:
+        transaction (schemas.TransactionCreate): Transaction data
+        explain (bool): Include the reason for the decision in the response
+        db (AsyncSession): Database session
+
+    Returns:
+        schemas.TransactionResponse: Fraud detection result
+    """
+    transaction_dict = transaction.dict()
+
+    # Pin the latest active custom rules and score off the event loop
+    rules = fraud_detector.rules_for(await rule_cache.get_snapshot_async(db))
+    is_fraud, fraud_score, prediction_time_ms, fraud_reason = await run_in_threadpool(
+        score_transaction, transaction_dict, rules, explain)
+
+    await store_records(db, [transaction_record(transaction_dict, is_fraud, fraud_score, prediction_time_ms)])
+
+    return schemas.TransactionResponse(
+        **dict(transaction_dict, additional_data=transaction_dict.get("additional_data") or {}),
+        is_fraud_predicted=is_fraud,
+        fraud_score=fraud_score,
+        prediction_time_ms=prediction_time_ms,
+        fraud_reason=fraud_reason
+    )
+
+@router.post("/batch-detect", response_model=schemas.BatchTransactionResponse)
+async def batch_detect_fraud(batch_request: schemas.BatchTransactionRequest, explain: bool = False,
+                             db: AsyncSession = Depends(get_async_db)):
+    """
+    Batch fraud detection for multiple transactions
+
+    Pass explain=true to include the reason for each decision.
+    """
+    start_time = time.time()
+
+    transaction_dicts = [transaction.dict() for transaction in batch_request.transactions]
+    rules = fraud_detector.rules_for(await rule_cache.get_snapshot_async(db))
+    if endpoints.scoring_pool is not None:
+        # Velocity is counted here; the pool's processes keep no counters
+        scored = await run_in_threadpool(endpoints.scoring_pool.score, transaction_dicts, explain, rules=rules,
+                                         velocity_counts=fraud_detector.count_velocity(transaction_dicts, rules))
+    else:
+        scored = await run_in_threadpool(score_transactions, fraud_detector, transaction_dicts, explain, rules)
+
+    await store_records(db, [transaction_record(transaction_dict, is_fraud, fraud_score, prediction_time_ms)
+                             for transaction_dict, (is_fraud, fraud_score, _, _, _, _, prediction_time_ms)
+                             in zip(transaction_dicts, scored)])
+
+    results = {}
+    for transaction_dict, (is_fraud, fraud_score, _, _, _, fraud_reason, prediction_time_ms) in zip(
+            transaction_dicts, scored):
+        results[transaction_dict["transaction_id"]] = schemas.TransactionResponse(
+            **transaction_dict,
+            is_fraud_predicted=is_fraud,
+            fraud_score=fraud_score,
+            prediction_time_ms=prediction_time_ms,
+            fraud_reason=fraud_reason
+        )
+
+    return schemas.BatchTransactionResponse(
+        results=results,
+        total_time_ms=int((time.time() - start_time) * 1000)
+    )
+
+@router.post("/report", response_model=schemas.FraudReportResponse)
+async def report_fraud(report: schemas.FraudReportCreate, db: AsyncSession = Depends(get_async_db)):
+    """
+    Report a fraudulent transaction
+    """
+    # Check if transaction exists
+    if not await async_crud.get_transaction_by_id(db, report.transaction_id):
+        raise HTTPException(status_code=404, detail="Transaction not found")
+
+    # Check if fraud report already exists
+    if await async_crud.get_fraud_report_by_transaction_id(db, report.transaction_id):
+        raise HTTPException(status_code=400, detail="Fraud report already exists for this transaction")
+
+    db_report = await async_crud.create_fraud_report(db, report.dict())
+
+    return schemas.FraudReportResponse(
+        id=db_report.id,
+        transaction_id=db_report.transaction_id,
+        reporting_entity_id=db_report.reporting_entity_id,
+        fraud_details=db_report.fraud_details,
+        is_fraud_reported=db_report.is_fraud_reported,
+        reported_at=db_report.reported_at
+    )
+
+@router.post("/detect-json", response_model=schemas.DetailedFraudResponse)
+async def detect_fraud_json(transaction_input: schemas.JsonTransactionInput,
+                            db: AsyncSession = Depends(get_async_db)):
+    """
+    Detect fraud for a single transaction provided in JSON format
+
+    Args:
+        transaction_input (schemas.JsonTransactionInput): Transaction data in JSON format
+        db (AsyncSession): Database session
+
+    Returns:
+        schemas.DetailedFraudResponse: Detailed fraud detection result
+    """
+    transaction_data = transaction_input.transaction_data
+
+    # Ensure transaction_id exists
+    if "transaction_id" not in transaction_data:
+        transaction_data["transaction_id"] = str(uuid.uuid4())
+
+    rules = fraud_detector.rules_for(await rule_cache.get_snapshot_async(db))
+
+    def score():
+        start_time = time.time()
+        is_fraud, combined_score, rule_score, ai_score, reasons = fraud_detector.detect_fraud(
+            transaction_data, threshold=decision_threshold(transaction_data), rules=rules)
+        prediction_time_ms = int((time.time() - start_time) * 1000)
+        fraud_source, fraud_reason = describe_fraud_reason(transaction_data, rule_score, ai_score, reasons, rules)
+        return is_fraud, combined_score, prediction_time_ms, fraud_source, fraud_reason
+
+    is_fraud, combined_score, prediction_time_ms, fraud_source, fraud_reason = await run_in_threadpool(score)
+
+    # Store transaction in database if it contains required fields
+    required_fields = ["amount", "payer_id", "payee_id", "payment_mode", "channel"]
+    if all(field in transaction_data for field in required_fields):
+        await store_records(db, [transaction_record(transaction_data, is_fraud, combined_score, prediction_time_ms)])
+
+    return schemas.DetailedFraudResponse(
+        transaction_id=transaction_data["transaction_id"],
+        is_fraud=is_fraud,
+        fraud_source=fraud_source,
+        fraud_reason=fraud_reason,
+        fraud_score=combined_score
+    )
+
+# Serve the routes that are not ported with their sync handlers
+_ported = {(route.path, method) for route in router.routes for method in route.methods}
+for _route in endpoints.router.routes:
+    if not any((_route.path, method) in _ported for method in _route.methods):
+        router.routes.append(_route)
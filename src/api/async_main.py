@@ -0,0 +1,61 @@
+"""
+FastAPI app serving the async variant of the API
+
+Run it like main.py, e.g. `gunicorn async_main:app -c gunicorn_conf.py`
+from this directory. It sets up the same startup tasks as main.py and adds
+the async database engine.
+"""
+from fastapi import FastAPI
+from fastapi.middleware.cors import CORSMiddleware
+import os
+import sys
+
+# Add the parent directory to sys.path to fix import issues
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from src.api import async_endpoints, main
+from src.database import async_database
+
+# Create FastAPI app
+app = FastAPI(
+    title=main.app.title,
+    description=main.app.description,
+    version=main.app.version
+)
+
+# Add CORS middleware
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],  # In production, replace with specific origins
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+# Include routers
+app.include_router(async_endpoints.router, prefix="/api", tags=["fraud"])
+
+# Same startup and shutdown tasks as the sync app (tables, lookup tables, scoring pool)
+for handler in main.app.router.on_startup:
+    app.router.add_event_handler("startup", handler)
+for handler in main.app.router.on_shutdown:
+    app.router.add_event_handler("shutdown", handler)
+
+@app.on_event("shutdown")
+async def close_async_engine():
+    await async_database.async_engine.dispose()
+
+@app.get("/")
+async def read_root():
+    return main.read_root()
+
+# Health check endpoint for Azure
+@app.get("/health")
+async def health_check():
+    return {"status": "healthy"}
+
+if __name__ == "__main__":
+    import uvicorn
+    port = int(os.environ.get("PORT", 8001))
+    host = os.environ.get("HOST", "0.0.0.0")
+    uvicorn.run(app, host=host, port=port)
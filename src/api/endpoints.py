@@ -1,79 +1,236 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 from typing import List
 import time
-import concurrent.futures
 from datetime import datetime
 import json
 from typing import Optional
 import uuid
 
 from ..database import crud, database, models
-from ..models.combined_model import CombinedFraudDetector
-from . import schemas
+from ..database.rule_cache import RuleSnapshotCache
+from ..database.write_behind import WRITE_BEHIND_ENABLED, TransactionWriter
+from ..models.combined_model import CombinedFraudDetector, decision_threshold
+from ..models.scoring_pool import SCORING_POOL_WORKERS, ScoringPool, score_transactions
+from . import schemas, scoring_jobs
 import os
 
 # Create router
 router = APIRouter()
 
+# Transactions scored together by /batch-detect/stream
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", "1000"))
+
 # Initialize fraud detector with pre-trained model
 model_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 
                           "models", "trained", "fraud_model.pkl")
-fraud_detector = CombinedFraudDetector(ai_model_path=model_path if os.path.exists(model_path) else None)
+# AI_BATCHING=true makes concurrent requests share batched AI predictions;
+# AI_SKIP_DECIDED=true skips the model when the rules and amount floors already
+# decide the verdict (AI_AUDIT_SKIPPED=true still scores those in the background).
+# The scoring pool's detectors are built with the same options
+detector_options = {
+    "batch_ai": os.getenv("AI_BATCHING", "false").lower() == "true",
+    "skip_decided_ai": os.getenv("AI_SKIP_DECIDED", "false").lower() == "true",
+    "audit_skipped_ai": os.getenv("AI_AUDIT_SKIPPED", "false").lower() == "true",
+}
+fraud_detector = CombinedFraudDetector(ai_model_path=model_path if os.path.exists(model_path) else None,
+                                       **detector_options)
+
+# Cache of the active custom rules; the detector is only updated when it changes
+rule_cache = RuleSnapshotCache()
+rule_cache.subscribe(lambda snapshot: fraud_detector.set_custom_rules(list(snapshot.rules), snapshot.version))
+
+# Process pool for CPU-bound batch scoring; see start_scoring_pool()
+scoring_pool = None
+
+def start_scoring_pool():
+    """
+    Start the scoring process pool if SCORING_POOL_WORKERS is set
+    
+    Called from the app's startup event, so that every server worker
+    process starts its own pool after forking.
+    """
+    global scoring_pool
+    if SCORING_POOL_WORKERS <= 0 or scoring_pool is not None:
+        return
+    pool = ScoringPool(SCORING_POOL_WORKERS, model_path if os.path.exists(model_path) else None,
+                       **detector_options)
+    rule_cache.subscribe(lambda snapshot: pool.update_rules(snapshot.version, snapshot.rules))
+    pool.warm_up()
+    scoring_pool = pool
+
+def stop_scoring_pool():
+    """
+    Stop the scoring process pool, if one was started
+    """
+    global scoring_pool
+    if scoring_pool is not None:
+        scoring_pool.close()
+        scoring_pool = None
+
+# Write-behind storage of scored transactions (WRITE_BEHIND=true); see start_transaction_writer()
+transaction_writer = None
+
+def start_transaction_writer():
+    """
+    Start the write-behind writer thread if WRITE_BEHIND is set
+    
+    Called from the app's startup event, so that every server worker
+    process runs its own writer thread.
+    """
+    global transaction_writer
+    if WRITE_BEHIND_ENABLED and transaction_writer is None:
+        writer = TransactionWriter()
+        writer.start()
+        transaction_writer = writer
+
+def stop_transaction_writer():
+    """
+    Write out the queued transactions and stop the writer thread
+    """
+    global transaction_writer
+    if transaction_writer is not None:
+        transaction_writer.close()
+        transaction_writer = None
+
+# Background scoring jobs (SCORING_JOBS); see start_scoring_job_runner()
+scoring_job_runner = None
+
+# Detector used by scoring jobs, kept apart from fraud_detector so that job
+# rows never reach the velocity counters of live traffic
+job_detector = None
+
+def score_job_chunk(transaction_dicts, explain=False):
+    """
+    Score a chunk of a scoring job with the latest active custom rules
+    
+    Args:
+        transaction_dicts (list): Transaction data
+        explain (bool): Whether to render the reason for each decision
+        
+    Returns:
+        list: Results in input order, as returned by score_transactions()
+    """
+    db = database.SessionLocal()
+    try:
+        snapshot = rule_cache.get_snapshot(db)
+    finally:
+        db.close()
+    return score_transactions(job_detector, transaction_dicts, explain=explain,
+                              rules=job_detector.rules_for(snapshot))
+
+def start_scoring_job_runner():
+    """
+    Start running scoring jobs in this process if SCORING_JOBS is set
+    
+    Called from the app's startup event, so that every server worker
+    process runs its own runner thread. Jobs are scored without velocity
+    checks: the rows of a file are not live traffic, and a resumed job
+    would otherwise restart with empty counters and score differently.
+    """
+    global scoring_job_runner, job_detector
+    if scoring_jobs.SCORING_JOBS_ENABLED and scoring_job_runner is None:
+        os.makedirs(scoring_jobs.SCORING_JOB_DIR, exist_ok=True)
+        job_detector = CombinedFraudDetector(ai_model_path=model_path if os.path.exists(model_path) else None,
+                                             **dict(detector_options, batch_ai=False, velocity=False))
+        runner = scoring_jobs.ScoringJobRunner(score_job_chunk)
+        runner.start()
+        scoring_job_runner = runner
+
+def stop_scoring_job_runner():
+    """
+    Stop the runner thread; its unfinished job is queued again
+    """
+    global scoring_job_runner, job_detector
+    if scoring_job_runner is not None:
+        scoring_job_runner.close()
+        scoring_job_runner = None
+    if job_detector is not None:
+        job_detector.close()
+        job_detector = None
 
 # Dependency to get the database session
 def get_db():
     return next(database.get_db())
 
-def process_transaction(transaction_dict, db):
+def describe_fraud_reason(transaction_dict, rule_score, ai_score, reasons, rules=None):
     """
-    Process a transaction and detect fraud
+    Render the source and reason of a fraud decision
+    
+    The rule explanation in reasons is only turned into text here, so callers
+    that do not need a reason never pay for formatting it.
     
     Args:
         transaction_dict (dict): Transaction data
-        db (Session): Database session
+        rule_score (float): Rule-based score
+        ai_score (float): AI model score
+        reasons (dict): Reasons returned by CombinedFraudDetector.detect_fraud
+        rules (RuleContext): Rules the decision was made with
         
     Returns:
-        tuple: (is_fraud, fraud_score, prediction_time_ms, transaction_id)
+        tuple: (fraud_source (str), fraud_reason (str))
     """
-    start_time = time.time()
-    
-    # Get all active custom rules
-    custom_rules = crud.get_all_custom_rules(db, active_only=True)
-    
-    # Update fraud detector with custom rules
-    fraud_detector.set_custom_rules(custom_rules)
+    return fraud_detector.describe_reason(transaction_dict, rule_score, ai_score, reasons, rules)
+
+def transaction_record(transaction_dict, is_fraud, fraud_score, prediction_time_ms):
+    """
+    Column values of the fraud_detection row for a scored transaction
     
-    # Detect fraud with a lower threshold for high-value transactions
-    threshold = 0.05 if transaction_dict.get("amount", 0) > 10000 else 0.5
-    is_fraud, fraud_score, rule_score, ai_score, reasons = fraud_detector.detect_fraud(transaction_dict, threshold=threshold)
+    Args:
+        transaction_dict (dict): Transaction data
+        is_fraud (bool): Fraud decision
+        fraud_score (float): Combined fraud score
+        prediction_time_ms (int): Time taken to score the transaction
+        
+    Returns:
+        dict: Column values for models.Transaction
+    """
+    # Convert additional_data to JSON string if it's a dict
+    additional_data = transaction_dict.get("additional_data", {})
+    if isinstance(additional_data, dict):
+        additional_data_str = json.dumps(additional_data)
+    else:
+        additional_data_str = None
+    
+    return {
+        "transaction_id": transaction_dict["transaction_id"],
+        # Set here rather than by the database, so rows written late (queued
+        # or spilled by the write-behind writer) keep the time of the decision
+        "timestamp": datetime.utcnow(),
+        "amount": transaction_dict["amount"],
+        "payer_id": transaction_dict["payer_id"],
+        "payee_id": transaction_dict["payee_id"],
+        "payment_mode": transaction_dict["payment_mode"],
+        "channel": transaction_dict["channel"],
+        "bank": transaction_dict.get("bank"),
+        "additional_data": additional_data_str,
+        "is_fraud_predicted": is_fraud,
+        "fraud_score": fraud_score,
+        "prediction_time_ms": prediction_time_ms
+    }
+
+def store_transaction(db, transaction_dict, is_fraud, fraud_score, prediction_time_ms):
+    """
+    Store a scored transaction, logging (not raising) database errors
     
-    # Calculate prediction time
-    prediction_time_ms = int((time.time() - start_time) * 1000)
+    Args:
+        db (Session): Database session
+        transaction_dict (dict): Transaction data
+        is_fraud (bool): Fraud decision
+        fraud_score (float): Combined fraud score
+        prediction_time_ms (int): Time taken to score the transaction
+    """
+    if transaction_writer is not None:
+        transaction_writer.submit([transaction_record(transaction_dict, is_fraud, fraud_score, prediction_time_ms)])
+        return
     
-    # Store transaction in database
     try:
-        # Convert additional_data to JSON string if it's a dict
-        additional_data = transaction_dict.get("additional_data", {})
-        if isinstance(additional_data, dict):
-            additional_data_str = json.dumps(additional_data)
-        else:
-            additional_data_str = None
-            
         # Create a new transaction record
         transaction = models.Transaction(
-            transaction_id=transaction_dict["transaction_id"],
-            amount=transaction_dict["amount"],
-            payer_id=transaction_dict["payer_id"],
-            payee_id=transaction_dict["payee_id"],
-            payment_mode=transaction_dict["payment_mode"],
-            channel=transaction_dict["channel"],
-            bank=transaction_dict.get("bank"),
-            additional_data=additional_data_str,
-            is_fraud_predicted=is_fraud,
-            fraud_score=fraud_score,
-            prediction_time_ms=prediction_time_ms
-        )
+            **transaction_record(transaction_dict, is_fraud, fraud_score, prediction_time_ms))
         
         # Add and commit
         db.add(transaction)
@@ -81,16 +238,195 @@ def process_transaction(transaction_dict, db):
     except Exception as e:
         db.rollback()
         print(f"Error storing transaction {transaction_dict['transaction_id']}: {str(e)}")
+
+def store_transactions(db, transaction_dicts, scored):
+    """
+    Store a batch of scored transactions with one bulk insert
+    
+    If the batch cannot be inserted as a whole (e.g. a duplicate transaction
+    ID), it is stored row by row so that only the failing rows are lost.
     
-    return is_fraud, fraud_score, prediction_time_ms, transaction_dict["transaction_id"]
+    Args:
+        db (Session): Database session
+        transaction_dicts (list): Transaction data
+        scored (list): (is_fraud, fraud_score, prediction_time_ms) for each transaction
+    """
+    records = [transaction_record(transaction_dict, is_fraud, fraud_score, prediction_time_ms)
+               for transaction_dict, (is_fraud, fraud_score, prediction_time_ms) in zip(transaction_dicts, scored)]
+    if not records:
+        return
+    if transaction_writer is not None:
+        transaction_writer.submit(records)
+        return
+    try:
+        db.execute(insert(models.Transaction), records)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"Bulk insert of {len(records)} transactions failed, storing them one by one: {str(e)}")
+        for transaction_dict, (is_fraud, fraud_score, prediction_time_ms) in zip(transaction_dicts, scored):
+            store_transaction(db, transaction_dict, is_fraud, fraud_score, prediction_time_ms)
+
+def score_transaction(transaction_dict, rules, explain=False):
+    """
+    Score a transaction against pinned rules, without touching the database
+    
+    Args:
+        transaction_dict (dict): Transaction data
+        rules (RuleContext): Rules pinned with fraud_detector.rules_for()
+        explain (bool): Whether to render the reason for the decision
+        
+    Returns:
+        tuple: (is_fraud, fraud_score, prediction_time_ms, fraud_reason)
+            where fraud_reason is None unless explain is set
+    """
+    start_time = time.time()
+    
+    # Detect fraud with a lower threshold for high-value transactions
+    threshold = decision_threshold(transaction_dict)
+    is_fraud, fraud_score, rule_score, ai_score, reasons = fraud_detector.detect_fraud(
+        transaction_dict, threshold=threshold, rules=rules)
+    
+    # Calculate prediction time
+    prediction_time_ms = int((time.time() - start_time) * 1000)
+    
+    # Render the explanation only when the caller asked for it
+    fraud_reason = None
+    if explain:
+        fraud_reason = describe_fraud_reason(transaction_dict, rule_score, ai_score, reasons, rules)[1]
+    
+    return is_fraud, fraud_score, prediction_time_ms, fraud_reason
+
+def score_batch(transaction_dicts, db, explain=False):
+    """
+    Score a batch of transactions against one rule snapshot and store them
+    
+    The batch is scored in the process pool when one is running, with the
+    velocity checks counted in this process, and all rows are stored with
+    one bulk insert.
+    
+    Args:
+        transaction_dicts (list): Transaction data
+        db (Session): Database session
+        explain (bool): Whether to render the reason for each decision
+        
+    Returns:
+        list: schemas.TransactionResponse for each transaction, in order
+    """
+    rules = fraud_detector.rules_for(rule_cache.get_snapshot(db))
+    if scoring_pool is not None:
+        scored = scoring_pool.score(transaction_dicts, explain=explain, rules=rules,
+                                    velocity_counts=fraud_detector.count_velocity(transaction_dicts, rules))
+    else:
+        scored = score_transactions(fraud_detector, transaction_dicts, explain=explain, rules=rules)
+    
+    # Store all transactions in one transaction
+    store_transactions(db, transaction_dicts, [(is_fraud, fraud_score, prediction_time_ms)
+                                               for is_fraud, fraud_score, _, _, _, _, prediction_time_ms in scored])
+    
+    return [
+        schemas.TransactionResponse(
+            **transaction_dict,
+            is_fraud_predicted=is_fraud,
+            fraud_score=fraud_score,
+            prediction_time_ms=prediction_time_ms,
+            fraud_reason=fraud_reason
+        )
+        for transaction_dict, (is_fraud, fraud_score, _, _, _, fraud_reason, prediction_time_ms)
+        in zip(transaction_dicts, scored)
+    ]
+
+def score_stream_chunk(items, explain=False):
+    """
+    Score one chunk of /batch-detect/stream and render its result lines
+    
+    Args:
+        items (list): (line number, transaction dict or validation error message) in input order
+        explain (bool): Whether to render the reason for each decision
+        
+    Returns:
+        str: One JSON line per item, in input order
+    """
+    transaction_dicts = [item for _, item in items if isinstance(item, dict)]
+    db = database.SessionLocal()
+    try:
+        responses = iter(score_batch(transaction_dicts, db, explain) if transaction_dicts else [])
+    finally:
+        db.close()
+    lines = []
+    for line_number, item in items:
+        if isinstance(item, dict):
+            lines.append(next(responses).json())
+        else:
+            lines.append(json.dumps({"line": line_number, "error": item}))
+    return "\n".join(lines) + "\n"
+
+async def iter_lines(stream):
+    """
+    Split an async stream of byte chunks into lines, holding at most one partial line
+    
+    Args:
+        stream: Async iterator of bytes, e.g. Request.stream()
+        
+    Yields:
+        bytes: Each line without its line terminator
+    """
+    pending = b""
+    async for chunk in stream:
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line
+    if pending:
+        yield pending
+
+class NDJSONStreamingResponse(StreamingResponse):
+    """
+    Streaming NDJSON response that leaves the request body to its iterator
+    
+    StreamingResponse reads from the client while it streams (to notice a
+    disconnect), which would take the request body chunks that the body
+    iterator is still reading.
+    """
+    
+    media_type = "application/x-ndjson"
+    
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+def process_transaction(transaction_dict, db, explain=False):
+    """
+    Process a transaction and detect fraud
+    
+    Args:
+        transaction_dict (dict): Transaction data
+        db (Session): Database session
+        explain (bool): Whether to render the reason for the decision
+        
+    Returns:
+        tuple: (is_fraud, fraud_score, prediction_time_ms, transaction_id, fraud_reason)
+            where fraud_reason is None unless explain is set
+    """
+    # Pin the latest active custom rules for this transaction
+    rules = fraud_detector.rules_for(rule_cache.get_snapshot(db))
+    
+    is_fraud, fraud_score, prediction_time_ms, fraud_reason = score_transaction(transaction_dict, rules, explain)
+    
+    # Store transaction in database
+    store_transaction(db, transaction_dict, is_fraud, fraud_score, prediction_time_ms)
+    
+    return is_fraud, fraud_score, prediction_time_ms, transaction_dict["transaction_id"], fraud_reason
 
 @router.post("/detect", response_model=schemas.TransactionResponse)
-def detect_fraud(transaction: schemas.TransactionCreate, db: Session = Depends(get_db)):
+def detect_fraud(transaction: schemas.TransactionCreate, explain: bool = False, db: Session = Depends(get_db)):
     """
     Detect fraud for a single transaction
     
     Args:
         transaction (schemas.TransactionCreate): Transaction data
+        explain (bool): Include the reason for the decision in the response
         db (Session): Database session
         
     Returns:
@@ -100,7 +436,8 @@ def detect_fraud(transaction: schemas.TransactionCreate, db: Session = Depends(g
     transaction_dict = transaction.dict()
     
     # Process transaction
-    is_fraud, fraud_score, prediction_time_ms, transaction_id = process_transaction(transaction_dict, db)
+    is_fraud, fraud_score, prediction_time_ms, transaction_id, fraud_reason = process_transaction(
+        transaction_dict, db, explain=explain)
     
     # Convert additional_data from string to dict if needed
     additional_data = transaction_dict.get("additional_data", {})
@@ -119,53 +456,24 @@ def detect_fraud(transaction: schemas.TransactionCreate, db: Session = Depends(g
         additional_data=additional_data,
         is_fraud_predicted=is_fraud,
         fraud_score=fraud_score,
-        prediction_time_ms=prediction_time_ms
+        prediction_time_ms=prediction_time_ms,
+        fraud_reason=fraud_reason
     )
 
 @router.post("/batch-detect", response_model=schemas.BatchTransactionResponse)
-def batch_detect_fraud(batch_request: schemas.BatchTransactionRequest, db: Session = Depends(get_db)):
+def batch_detect_fraud(batch_request: schemas.BatchTransactionRequest, explain: bool = False, db: Session = Depends(get_db)):
     """
     Batch fraud detection for multiple transactions
+    
+    Pass explain=true to include the reason for each decision.
     """
     # Record start time
     start_time = time.time()
     
-    # Process transactions in parallel
+    transaction_dicts = [transaction.dict() for transaction in batch_request.transactions]
     results = {}
-    
-    def process_single_transaction(transaction):
-        # Convert Pydantic model to dict
-        transaction_dict = transaction.dict()
-        
-        # Process transaction
-        is_fraud, fraud_score, prediction_time_ms, transaction_id = process_transaction(transaction_dict, db)
-        
-        # Create response
-        response = schemas.TransactionResponse(
-            transaction_id=transaction_id,
-            amount=transaction_dict["amount"],
-            payer_id=transaction_dict["payer_id"],
-            payee_id=transaction_dict["payee_id"],
-            payment_mode=transaction_dict["payment_mode"],
-            channel=transaction_dict["channel"],
-            bank=transaction_dict.get("bank"),
-            additional_data=transaction_dict.get("additional_data", {}),
-            is_fraud_predicted=is_fraud,
-            fraud_score=fraud_score,
-            prediction_time_ms=prediction_time_ms
-        )
-        
-        return transaction_id, response
-    
-    # Use ThreadPoolExecutor to process transactions in parallel
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        futures = [executor.submit(process_single_transaction, tx) for tx in batch_request.transactions]
-        for future in concurrent.futures.as_completed(futures):
-            try:
-                transaction_id, response = future.result()
-                results[transaction_id] = response
-            except Exception as e:
-                print(f"Error processing transaction: {str(e)}")
+    for response in score_batch(transaction_dicts, db, explain):
+        results[response.transaction_id] = response
     
     # Calculate total processing time
     total_time_ms = int((time.time() - start_time) * 1000)
@@ -176,6 +484,120 @@ def batch_detect_fraud(batch_request: schemas.BatchTransactionRequest, db: Sessi
         total_time_ms=total_time_ms
     )
 
+@router.post("/batch-detect/stream")
+async def stream_detect_fraud(request: Request, explain: bool = False):
+    """
+    Score newline-delimited JSON transactions while they are uploaded
+    
+    The request body holds one transaction (as for /detect) per line. Lines
+    are scored and stored in chunks of STREAM_CHUNK_SIZE as they arrive,
+    and one line is streamed back per input line, in order: the
+    TransactionResponse, or {"line": n, "error": ...} for a line that is not
+    a valid transaction. Memory use does not depend on the size of the
+    upload. Clients must read the response while they are still sending.
+    
+    Args:
+        request (Request): The request, read incrementally
+        explain (bool): Include the reason for each decision
+        
+    Returns:
+        NDJSONStreamingResponse: One JSON result per input line
+    """
+    async def results():
+        items = []
+        line_number = 0
+        async for line in iter_lines(request.stream()):
+            line_number += 1
+            if not line.strip():
+                continue
+            try:
+                items.append((line_number, schemas.TransactionBase.parse_raw(line).dict()))
+            except ValueError as e:
+                items.append((line_number, str(e)))
+            if len(items) >= STREAM_CHUNK_SIZE:
+                yield await run_in_threadpool(score_stream_chunk, items, explain)
+                items = []
+        if items:
+            yield await run_in_threadpool(score_stream_chunk, items, explain)
+    
+    return NDJSONStreamingResponse(results())
+
+def create_job_record(job_id, input_path, input_format, explain):
+    """
+    Count the rows of an uploaded job file and queue the job
+    
+    Returns:
+        schemas.ScoringJobResponse: The queued job
+    """
+    total_rows = scoring_jobs.count_rows(input_path, input_format)
+    db = database.SessionLocal()
+    try:
+        job = crud.create_scoring_job(db, {
+            "id": job_id,
+            "input_format": input_format,
+            "explain": explain,
+            "input_path": input_path,
+            "output_path": os.path.join(scoring_jobs.SCORING_JOB_DIR, f"{job_id}.results.jsonl"),
+            "chunk_size": scoring_jobs.SCORING_JOB_CHUNK_SIZE,
+            "total_rows": total_rows
+        })
+        return scoring_jobs.job_response(job)
+    finally:
+        db.close()
+
+@router.post("/jobs", response_model=schemas.ScoringJobResponse, status_code=202)
+async def create_scoring_job(request: Request, format: Optional[str] = None, explain: bool = False):
+    """
+    Submit a file of transactions to be scored in the background
+    
+    The request body is the file itself: one transaction (as for /detect) per
+    line in JSONL, or a CSV file with a header row. The format is taken from
+    the format parameter, or from the Content-Type (text/csv for CSV).
+    
+    Args:
+        request (Request): The request, whose body is the input file
+        format (str): "jsonl" or "csv"
+        explain (bool): Include the reason for each decision in the results
+        
+    Returns:
+        schemas.ScoringJobResponse: The queued job; poll /jobs/{job_id} for progress
+    """
+    input_format = format or ("csv" if request.headers.get("content-type", "").startswith("text/csv") else "jsonl")
+    if input_format not in scoring_jobs.JOB_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Format must be one of: {', '.join(scoring_jobs.JOB_FORMATS)}")
+    
+    job_id = uuid.uuid4().hex
+    os.makedirs(scoring_jobs.SCORING_JOB_DIR, exist_ok=True)
+    input_path = os.path.join(scoring_jobs.SCORING_JOB_DIR, f"{job_id}.{input_format}")
+    await scoring_jobs.save_upload(request.stream(), input_path)
+    return await run_in_threadpool(create_job_record, job_id, input_path, input_format, explain)
+
+@router.get("/jobs/{job_id}", response_model=schemas.ScoringJobResponse)
+def get_scoring_job(job_id: str, db: Session = Depends(get_db)):
+    """
+    Get the progress of a scoring job
+    """
+    job = crud.get_scoring_job(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return scoring_jobs.job_response(job)
+
+@router.get("/jobs/{job_id}/results")
+def get_scoring_job_results(job_id: str, db: Session = Depends(get_db)):
+    """
+    Download the results of a completed scoring job
+    
+    One JSON line per input row, in input order: the transaction's scores and
+    verdict, or {"line": n, "error": ...} for a row that is not a valid
+    transaction.
+    """
+    job = crud.get_scoring_job(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status != "completed":
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    return FileResponse(job.output_path, media_type="application/x-ndjson", filename=f"{job_id}.results.jsonl")
+
 @router.post("/report", response_model=schemas.FraudReportResponse)
 def report_fraud(report: schemas.FraudReportCreate, db: Session = Depends(get_db)):
     """
@@ -343,70 +765,23 @@ def detect_fraud_json(transaction_input: schemas.JsonTransactionInput, db: Sessi
     if "transaction_id" not in transaction_data:
         transaction_data["transaction_id"] = str(uuid.uuid4())
     
-    # Get all active custom rules
-    custom_rules = crud.get_all_custom_rules(db, active_only=True)
-    
-    # Update fraud detector with custom rules
-    fraud_detector.set_custom_rules(custom_rules)
+    # Pin the latest active custom rules for this transaction
+    rules = fraud_detector.rules_for(rule_cache.get_snapshot(db))
     
     # Process transaction using the fraud detector
     start_time = time.time()
-    threshold = 0.05 if transaction_data.get("amount", 0) > 10000 else 0.5
-    is_fraud, combined_score, rule_score, ai_score, reasons = fraud_detector.detect_fraud(transaction_data, threshold=threshold)
+    threshold = decision_threshold(transaction_data)
+    is_fraud, combined_score, rule_score, ai_score, reasons = fraud_detector.detect_fraud(
+        transaction_data, threshold=threshold, rules=rules)
     prediction_time_ms = int((time.time() - start_time) * 1000)
     
     # Determine fraud source and reason
-    fraud_source = "model" if ai_score > rule_score else "rule"
-    
-    # Generate fraud reason based on source
-    if fraud_source == "rule":
-        if reasons and isinstance(reasons, dict) and "rule_reason" in reasons:
-            fraud_reason = reasons["rule_reason"]
-        elif reasons and isinstance(reasons, list) and len(reasons) > 0:
-            fraud_reason = reasons[0]
-        elif transaction_data.get("amount", 0) > fraud_detector.rule_detector.config["amount_threshold"]:
-            fraud_reason = "High transaction amount"
-        elif transaction_data.get("channel") in fraud_detector.rule_detector.config["high_risk_channels"]:
-            fraud_reason = "High-risk channel"
-        elif transaction_data.get("payment_mode") in fraud_detector.rule_detector.config["high_risk_payment_modes"]:
-            fraud_reason = "High-risk payment mode"
-        else:
-            fraud_reason = "Multiple risk factors"
-    else:
-        fraud_reason = "AI model detection"
+    fraud_source, fraud_reason = describe_fraud_reason(transaction_data, rule_score, ai_score, reasons, rules)
     
     # Store transaction in database if it contains required fields
     required_fields = ["amount", "payer_id", "payee_id", "payment_mode", "channel"]
     if all(field in transaction_data for field in required_fields):
-        try:
-            # Convert additional_data to JSON string if it's a dict
-            additional_data = transaction_data.get("additional_data", {})
-            if isinstance(additional_data, dict):
-                additional_data_str = json.dumps(additional_data)
-            else:
-                additional_data_str = None
-                
-            # Create a new transaction record
-            transaction = models.Transaction(
-                transaction_id=transaction_data["transaction_id"],
-                amount=transaction_data["amount"],
-                payer_id=transaction_data["payer_id"],
-                payee_id=transaction_data["payee_id"],
-                payment_mode=transaction_data["payment_mode"],
-                channel=transaction_data["channel"],
-                bank=transaction_data.get("bank"),
-                additional_data=additional_data_str,
-                is_fraud_predicted=is_fraud,
-                fraud_score=combined_score,
-                prediction_time_ms=prediction_time_ms
-            )
-            
-            # Add and commit
-            db.add(transaction)
-            db.commit()
-        except Exception as e:
-            db.rollback()
-            print(f"Error storing transaction {transaction_data['transaction_id']}: {str(e)}")
+        store_transaction(db, transaction_data, is_fraud, combined_score, prediction_time_ms)
     
     # Return detailed response
     return schemas.DetailedFraudResponse(
@@ -430,7 +805,9 @@ def create_rule(rule: schemas.CustomRuleCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=400, detail="Rule with this name already exists")
     
     # Create the rule
-    return crud.create_custom_rule(db, rule.dict())
+    db_rule = crud.create_custom_rule(db, rule.dict())
+    rule_cache.invalidate()
+    return db_rule
 
 @router.get("/rules", response_model=List[schemas.CustomRuleResponse])
 def get_rules(skip: int = 0, limit: int = 100, active_only: bool = False, db: Session = Depends(get_db)):
@@ -469,6 +846,7 @@ def update_rule(rule_id: int, rule_update: schemas.CustomRuleUpdate, db: Session
     updated_rule = crud.update_custom_rule(db, rule_id, rule_update.dict(exclude_unset=True))
     if not updated_rule:
         raise HTTPException(status_code=400, detail="Failed to update rule")
+    rule_cache.invalidate()
     
     return updated_rule
 
@@ -480,6 +858,7 @@ def delete_rule(rule_id: int, db: Session = Depends(get_db)):
     success = crud.delete_custom_rule(db, rule_id)
     if not success:
         raise HTTPException(status_code=404, detail="Rule not found")
+    rule_cache.invalidate()
     return success
 
 @router.patch("/rules/{rule_id}/activate", response_model=schemas.CustomRuleResponse)
@@ -490,6 +869,7 @@ def activate_rule(rule_id: int, db: Session = Depends(get_db)):
     rule = crud.activate_deactivate_rule(db, rule_id, True)
     if not rule:
         raise HTTPException(status_code=404, detail="Rule not found")
+    rule_cache.invalidate()
     return rule
 
 @router.patch("/rules/{rule_id}/deactivate", response_model=schemas.CustomRuleResponse)
@@ -500,4 +880,5 @@ def deactivate_rule(rule_id: int, db: Session = Depends(get_db)):
     rule = crud.activate_deactivate_rule(db, rule_id, False)
     if not rule:
         raise HTTPException(status_code=404, detail="Rule not found")
+    rule_cache.invalidate()
     return rule
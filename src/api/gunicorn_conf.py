@@ -0,0 +1,37 @@
+"""
+Gunicorn configuration for the API
+
+With PRELOAD_APP=true (the default) the master imports the app, and with it
+the fraud model, once before forking. Workers then share those pages
+copy-on-write instead of each unpickling a private copy. Garbage collection
+is disabled while the app is imported and the surviving objects are frozen
+before every fork, so collections in the workers do not write to (and
+un-share) the inherited pages.
+"""
+import gc
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8001)}"
+workers = int(os.environ.get("WEB_CONCURRENCY", 4))
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = 120
+preload_app = os.environ.get("PRELOAD_APP", "true").lower() == "true"
+
+if preload_app:
+    # Avoid collections while the app is imported; they leave freed gaps
+    # in memory pages that the workers would later fill and copy
+    gc.disable()
+
+
+def pre_fork(server, worker):
+    if preload_app:
+        # Move everything allocated so far out of reach of the collector
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    if preload_app:
+        gc.enable()
+        # Connections must not be shared with the master; drop any inherited ones
+        from src.database import database
+        database.engine.dispose(close=False)
@@ -7,7 +7,7 @@ import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 from src.api import endpoints
-from src.database import models, database
+from src.database import models, database, crud
 
 # Create FastAPI app
 app = FastAPI(
@@ -33,6 +33,46 @@ app.include_router(endpoints.router, prefix="/api", tags=["fraud"])
 def startup_db_client():
     models.Base.metadata.create_all(bind=database.engine)
 
+# Build AI amount lookup tables for the feature combinations seen recently
+@app.on_event("startup")
+def precompile_ai_lookup_tables():
+    db = database.SessionLocal()
+    try:
+        profiles = crud.get_transaction_profiles(db)
+        built = endpoints.fraud_detector.ai_detector.precompile_lookup_tables(profiles)
+        print(f"Precompiled {built} AI lookup tables")
+    except Exception as e:
+        print(f"Error precompiling AI lookup tables: {e}")
+    finally:
+        db.close()
+
+# Run background scoring jobs (SCORING_JOBS)
+@app.on_event("startup")
+def start_scoring_job_runner():
+    endpoints.start_scoring_job_runner()
+
+@app.on_event("shutdown")
+def stop_scoring_job_runner():
+    endpoints.stop_scoring_job_runner()
+
+# Start the scoring process pool (SCORING_POOL_WORKERS) in each server worker
+@app.on_event("startup")
+def start_scoring_pool():
+    endpoints.start_scoring_pool()
+
+@app.on_event("shutdown")
+def stop_scoring_pool():
+    endpoints.stop_scoring_pool()
+
+# Store scored transactions through the write-behind queue (WRITE_BEHIND)
+@app.on_event("startup")
+def start_transaction_writer():
+    endpoints.start_transaction_writer()
+
+@app.on_event("shutdown")
+def stop_transaction_writer():
+    endpoints.stop_transaction_writer()
+
 @app.get("/")
 def read_root():
     return {
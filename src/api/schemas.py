@@ -26,6 +26,7 @@ class TransactionResponse(TransactionBase):
     fraud_score: float = Field(..., description="Fraud score between 0 and 1")
     prediction_time_ms: int = Field(..., description="Time taken to make the prediction in milliseconds")
     timestamp: Optional[datetime] = Field(None, description="Timestamp when the transaction was created")
+    fraud_reason: Optional[str] = Field(None, description="Reason for the decision (only with explain=true)")
 
 class BatchTransactionRequest(BaseModel):
     transactions: List[TransactionBase] = Field(..., description="List of transactions to process")
@@ -77,6 +78,22 @@ class DetailedFraudResponse(BaseModel):
     fraud_reason: str = Field(..., description="Reason for fraud detection")
     fraud_score: float = Field(..., description="Fraud score between 0 and 1")
 
+class ScoringJobResponse(BaseModel):
+    """Schema for the status of a scoring job"""
+    job_id: str = Field(..., description="Unique identifier for the job")
+    status: str = Field(..., description="queued, running, completed or failed")
+    input_format: str = Field(..., description="Format of the input file (jsonl or csv)")
+    total_rows: int = Field(..., description="Number of rows in the input file")
+    rows_done: int = Field(..., description="Number of rows scored so far")
+    invalid_rows: int = Field(..., description="Number of rows that are not valid transactions")
+    progress: float = Field(..., description="Fraction of the rows scored so far")
+    rows_per_second: Optional[float] = Field(None, description="Scoring throughput so far")
+    eta_seconds: Optional[float] = Field(None, description="Estimated seconds until the job completes")
+    error: Optional[str] = Field(None, description="Why the job failed")
+    created_at: Optional[datetime] = Field(None, description="Timestamp when the job was submitted")
+    started_at: Optional[datetime] = Field(None, description="Timestamp when the job was first started")
+    finished_at: Optional[datetime] = Field(None, description="Timestamp when the job completed or failed")
+
 # Custom Rule Schemas
 
 class RuleOperator(str):
@@ -0,0 +1,230 @@
+"""
+Background scoring jobs for files too large for one request
+
+A job's input file is stored under SCORING_JOB_DIR and its state in the
+scoring_jobs table. With SCORING_JOBS=true, every API worker process runs a
+ScoringJobRunner thread that claims queued jobs and scores them chunk by chunk, appending one result
+line per input row to the job's output file. After each chunk the output is
+synced to disk and the progress committed, including the input offset
+reached, so a job whose worker stops is taken over by another worker (or
+the restarted one) and resumes after its last completed chunk without
+re-reading the rows before it. Jobs are scored without velocity checks, so a
+resumed job gives the same results, and results are not stored in
+fraud_detection.
+"""
+import itertools
+import json
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+from ..database import crud
+from ..database.database import SessionLocal
+from ..models.score_file import read_rows, read_rows_from, result_rows, validate_rows
+from . import schemas
+
+# Whether this process runs scoring jobs
+SCORING_JOBS_ENABLED = os.getenv("SCORING_JOBS", "false").lower() == "true"
+
+# Input and result files; must be shared by every worker that runs jobs
+SCORING_JOB_DIR = os.path.abspath(os.getenv(
+    "SCORING_JOB_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "scoring_jobs")
+))
+
+# Rows scored (and progress committed) at a time
+SCORING_JOB_CHUNK_SIZE = int(os.getenv("SCORING_JOB_CHUNK_SIZE", "5000"))
+
+# Seconds between looks for a job while idle
+POLL_INTERVAL = float(os.getenv("SCORING_JOB_POLL_INTERVAL", "2"))
+
+# A running job whose worker has not reported for this long is taken over
+STALE_SECONDS = float(os.getenv("SCORING_JOB_STALE_SECONDS", "60"))
+
+JOB_FORMATS = ("jsonl", "csv")
+
+
+def count_rows(path, input_format):
+    """
+    Count the rows read_rows() yields for a file
+    """
+    return sum(1 for _ in read_rows(path, input_format))
+
+
+async def save_upload(stream, path):
+    """
+    Write an uploaded request body to a file as it arrives
+
+    Args:
+        stream: Async iterator of bytes, e.g. Request.stream()
+        path (str): File to create
+    """
+    with open(path + ".tmp", "wb") as f:
+        async for chunk in stream:
+            f.write(chunk)
+    os.replace(path + ".tmp", path)
+
+
+def job_response(job):
+    """
+    Progress of a job, with its throughput and estimated time to completion
+
+    Args:
+        job (models.ScoringJob): The job
+
+    Returns:
+        schemas.ScoringJobResponse: Job status
+    """
+    rows_done = job.rows_done or 0
+    rows_per_second = rows_done / job.processing_seconds if job.processing_seconds else None
+    eta_seconds = None
+    if job.status in ("queued", "running") and rows_per_second:
+        eta_seconds = (job.total_rows - rows_done) / rows_per_second
+    return schemas.ScoringJobResponse(
+        job_id=job.id,
+        status=job.status,
+        input_format=job.input_format,
+        total_rows=job.total_rows,
+        rows_done=rows_done,
+        invalid_rows=job.invalid_rows or 0,
+        progress=rows_done / job.total_rows if job.total_rows else 1.0,
+        rows_per_second=rows_per_second,
+        eta_seconds=eta_seconds,
+        error=job.error,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at
+    )
+
+
+class ScoringJobRunner:
+    """
+    Thread that claims scoring jobs from the database and runs them
+
+    Progress is recorded with the attempt number the job was claimed with;
+    when another worker has taken the job over, the update matches no row
+    and this runner drops the job.
+    """
+
+    def __init__(self, score_chunk, session_factory=SessionLocal, poll_interval=POLL_INTERVAL,
+                 stale_seconds=STALE_SECONDS):
+        """
+        Args:
+            score_chunk (callable): Called as score_chunk(transactions, explain); returns
+                score_transactions() results in input order
+            session_factory (callable): Returns a new database session
+            poll_interval (float): Seconds between looks for a job while idle
+            stale_seconds (float): Running jobs not heard from for this long are taken over
+        """
+        self.score_chunk = score_chunk
+        self.session_factory = session_factory
+        self.poll_interval = poll_interval
+        self.stale_seconds = stale_seconds
+        self.worker = f"{socket.gethostname()}:{os.getpid()}"
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Start the runner thread
+        """
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="scoring-jobs", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """
+        Stop after the current chunk; an unfinished job is queued again
+        """
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            job = None
+            db = self.session_factory()
+            try:
+                stale_before = datetime.utcnow() - timedelta(seconds=self.stale_seconds)
+                job = crud.claim_scoring_job(db, self.worker, stale_before)
+                if job is not None:
+                    self._process(db, job)
+            except Exception as e:
+                print(f"Error running scoring job {job.id if job is not None else ''}: {str(e)}")
+            finally:
+                db.close()
+            if job is None:
+                self._stop.wait(self.poll_interval)
+
+    def _process(self, db, job):
+        """
+        Score a claimed job from its last completed chunk to the end
+        """
+        if job.rows_done:
+            print(f"Resuming scoring job {job.id} at row {job.rows_done} of {job.total_rows}")
+        progress = {
+            "rows_done": job.rows_done or 0,
+            "invalid_rows": job.invalid_rows or 0,
+            "output_bytes": job.output_bytes or 0,
+            "input_bytes": job.input_bytes or 0,
+            "input_lines": job.input_lines or 0,
+            "processing_seconds": job.processing_seconds or 0.0,
+        }
+        try:
+            mode = "r+b" if os.path.exists(job.output_path) else "wb"
+            with open(job.output_path, mode) as out:
+                # Drop anything written after the last recorded chunk
+                out.truncate(progress["output_bytes"])
+                out.seek(progress["output_bytes"])
+                # Continue right after the last scored row, without re-reading the input before it
+                rows = read_rows_from(job.input_path, job.input_format,
+                                      (progress["input_bytes"], progress["input_lines"]))
+                while True:
+                    chunk = list(itertools.islice(rows, job.chunk_size))
+                    if not chunk:
+                        break
+                    if self._stop.is_set():
+                        # Let another worker (or this one, once restarted) carry on
+                        crud.update_scoring_job(db, job.id, job.attempt, {"status": "queued"})
+                        return
+                    start_time = time.perf_counter()
+                    lines, invalid = self._score([(line_number, row) for line_number, row, _ in chunk], job.explain)
+                    out.write(lines.encode())
+                    out.flush()
+                    os.fsync(out.fileno())
+                    progress["rows_done"] += len(chunk)
+                    progress["invalid_rows"] += invalid
+                    progress["output_bytes"] = out.tell()
+                    progress["input_bytes"], progress["input_lines"] = chunk[-1][2]
+                    progress["processing_seconds"] += time.perf_counter() - start_time
+                    if not crud.update_scoring_job(db, job.id, job.attempt, progress):
+                        print(f"Scoring job {job.id} was taken over by another worker")
+                        return
+        except Exception as e:
+            if self._stop.is_set():
+                # The chunk was interrupted by the shutdown
+                crud.update_scoring_job(db, job.id, job.attempt, {"status": "queued"})
+                return
+            print(f"Scoring job {job.id} failed: {str(e)}")
+            crud.update_scoring_job(db, job.id, job.attempt, {"status": "failed", "error": str(e),
+                                                              "finished_at": datetime.utcnow()})
+            return
+        crud.update_scoring_job(db, job.id, job.attempt, {"status": "completed", "finished_at": datetime.utcnow()})
+
+    def _score(self, chunk, explain):
+        """
+        Score one chunk of rows
+
+        Returns:
+            tuple: (one JSON result line per row, number of invalid rows)
+        """
+        items, transaction_dicts = validate_rows(chunk)
+        scored = self.score_chunk(transaction_dicts, explain) if transaction_dicts else []
+        lines = "".join(json.dumps(result) + "\n" for result in result_rows(items, scored, explain))
+        return lines, len(items) - len(transaction_dicts)
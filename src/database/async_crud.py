@@ -0,0 +1,64 @@
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import models
+
+async def create_transactions(db: AsyncSession, records: list):
+    """
+    Insert transaction rows with a single executemany and commit them
+
+    Args:
+        db (AsyncSession): Database session
+        records (list): Column values for models.Transaction, one dict per row
+    """
+    if records:
+        await db.execute(insert(models.Transaction), records)
+    await db.commit()
+
+async def create_fraud_report(db: AsyncSession, report_data: dict):
+    """
+    Create a new fraud report in the database
+    """
+    db_report = models.FraudReport(
+        transaction_id=report_data["transaction_id"],
+        reporting_entity_id=report_data["reporting_entity_id"],
+        fraud_details=report_data["fraud_details"],
+        is_fraud_reported=True
+    )
+    db.add(db_report)
+    await db.commit()
+    await db.refresh(db_report)
+    return db_report
+
+async def get_transaction_by_id(db: AsyncSession, transaction_id: str):
+    """
+    Get a transaction by its ID
+    """
+    result = await db.execute(
+        select(models.Transaction).where(models.Transaction.transaction_id == transaction_id).limit(1))
+    return result.scalars().first()
+
+async def get_fraud_report_by_transaction_id(db: AsyncSession, transaction_id: str):
+    """
+    Get a fraud report by transaction ID
+    """
+    result = await db.execute(
+        select(models.FraudReport).where(models.FraudReport.transaction_id == transaction_id).limit(1))
+    return result.scalars().first()
+
+async def get_active_custom_rules(db: AsyncSession):
+    """
+    Get every active custom rule, highest priority first
+    """
+    result = await db.execute(
+        select(models.CustomRule)
+        .where(models.CustomRule.is_active == True)
+        .order_by(models.CustomRule.priority.desc(), models.CustomRule.id)
+    )
+    return result.scalars().all()
+
+async def get_rule_version(db: AsyncSession):
+    """
+    Get the current custom rule version counter (0 if rules were never changed)
+    """
+    version = await db.scalar(select(models.RuleVersion.version).where(models.RuleVersion.id == 1))
+    return version or 0
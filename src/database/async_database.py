@@ -0,0 +1,47 @@
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+import os
+
+from .database import DATABASE_URL
+
+def async_database_url(url):
+    """
+    Rewrite a database URL to use the asyncio driver of its backend
+
+    SQLite goes through aiosqlite and PostgreSQL through asyncpg. URLs that
+    already name a driver are returned unchanged.
+
+    Args:
+        url (str): Synchronous database URL
+
+    Returns:
+        str: Database URL for create_async_engine
+    """
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url[len("sqlite://"):]
+    if url.startswith("postgresql://") or url.startswith("postgresql+psycopg2://"):
+        url = "postgresql+asyncpg://" + url.split("://", 1)[1]
+        # asyncpg takes "ssl" where libpq takes "sslmode"
+        return url.replace("sslmode=", "ssl=")
+    return url
+
+# ASYNC_DATABASE_URL overrides the URL derived from DATABASE_URL
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or async_database_url(DATABASE_URL)
+
+# aiosqlite defaults to opening a connection per session. SQLite allows one
+# writer at a time, so a single pooled connection queues the requests in the
+# pool instead of having them retry on the database lock
+engine_options = {"poolclass": AsyncAdaptedQueuePool, "pool_size": 1, "max_overflow": 0, "pool_timeout": 300} \
+    if ASYNC_DATABASE_URL.startswith("sqlite") else {}
+
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **engine_options)
+
+# Objects stay usable after commit, so responses can be built without another round trip
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+async def get_async_db():
+    """
+    Dependency function to get an async database session
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -87,6 +87,33 @@ def get_transactions(
     
     return query.order_by(models.Transaction.timestamp.desc()).offset(skip).limit(limit).all()
 
+def get_transaction_profiles(db: Session, limit: int = 10000):
+    """
+    Get the distinct non-amount feature values of the most recent transactions
+    
+    Used to precompile the AI model's amount lookup tables for the feature
+    combinations that actually occur.
+    """
+    recent = db.query(
+        models.Transaction.payment_mode,
+        models.Transaction.channel,
+        models.Transaction.payer_id,
+        models.Transaction.payee_id,
+        models.Transaction.bank
+    ).order_by(models.Transaction.id.desc()).limit(limit).all()
+    profiles = {}
+    for payment_mode, channel, payer_id, payee_id, bank in recent:
+        profile = {
+            "amount": 0.0,
+            "payment_mode": payment_mode,
+            "channel": channel,
+            "payer_id": payer_id or "",
+            "payee_id": payee_id or "",
+            "bank": bank
+        }
+        profiles[(payment_mode, channel, len(profile["payer_id"]), len(profile["payee_id"]), bool(bank))] = profile
+    return list(profiles.values())
+
 def get_fraud_reports(db: Session, skip: int = 0, limit: int = 100):
     """
     Get fraud reports
@@ -200,6 +227,7 @@ def create_custom_rule(db: Session, rule_data: dict):
         advanced_config=rule_data.get("advanced_config")
     )
     db.add(db_rule)
+    bump_rule_version(db)
     db.commit()
     db.refresh(db_rule)
     return db_rule
@@ -219,6 +247,8 @@ def get_custom_rule_by_name(db: Session, name: str):
 def get_all_custom_rules(db: Session, skip: int = 0, limit: int = 100, active_only: bool = False):
     """
     Get all custom rules with optional pagination and filtering
+    
+    Pass limit=None to fetch every matching rule.
     """
     query = db.query(models.CustomRule)
     
@@ -226,7 +256,45 @@ def get_all_custom_rules(db: Session, skip: int = 0, limit: int = 100, active_on
         query = query.filter(models.CustomRule.is_active == True)
     
     # Order by priority (highest first) and then by ID
-    return query.order_by(models.CustomRule.priority.desc(), models.CustomRule.id).offset(skip).limit(limit).all()
+    query = query.order_by(models.CustomRule.priority.desc(), models.CustomRule.id).offset(skip)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
+def get_rule_version(db: Session):
+    """
+    Get the current custom rule version counter (0 if rules were never changed)
+    """
+    row = db.query(models.RuleVersion.version).filter(models.RuleVersion.id == 1).first()
+    return row[0] if row else 0
+
+def bump_rule_version(db: Session):
+    """
+    Increment the custom rule version counter
+    
+    The caller is responsible for committing, so the bump lands in the same
+    transaction as the rule change it announces.
+    """
+    def bump():
+        return db.query(models.RuleVersion).filter(models.RuleVersion.id == 1).update(
+            {models.RuleVersion.version: models.RuleVersion.version + 1},
+            synchronize_session=False
+        )
+    
+    if not bump():
+        # The row is created with the table; databases created before that
+        # get it here. Two workers may get here at once, so the insert
+        # leaves an existing row alone and the update is then retried
+        dialect = db.get_bind().dialect.name
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        elif dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            db.add(models.RuleVersion(id=1, version=1))
+            return
+        db.execute(insert(models.RuleVersion).values(id=1, version=0).on_conflict_do_nothing(index_elements=["id"]))
+        bump()
 
 def update_custom_rule(db: Session, rule_id: int, rule_data: dict):
     """
@@ -245,6 +313,7 @@ def update_custom_rule(db: Session, rule_id: int, rule_data: dict):
         elif key == "score":
             setattr(db_rule, key, float(value))
     
+    bump_rule_version(db)
     db.commit()
     db.refresh(db_rule)
     return db_rule
@@ -258,6 +327,7 @@ def delete_custom_rule(db: Session, rule_id: int):
         return False
     
     db.delete(db_rule)
+    bump_rule_version(db)
     db.commit()
     return True
 
@@ -270,6 +340,82 @@ def activate_deactivate_rule(db: Session, rule_id: int, is_active: bool):
         return None
     
     db_rule.is_active = is_active
+    bump_rule_version(db)
     db.commit()
     db.refresh(db_rule)
     return db_rule
+
+# Scoring job operations
+
+def create_scoring_job(db: Session, job_data: dict):
+    """
+    Create a queued scoring job
+    """
+    db_job = models.ScoringJob(status="queued", **job_data)
+    db.add(db_job)
+    db.commit()
+    db.refresh(db_job)
+    return db_job
+
+def get_scoring_job(db: Session, job_id: str):
+    """
+    Get a scoring job by its ID
+    """
+    return db.query(models.ScoringJob).filter(models.ScoringJob.id == job_id).first()
+
+def claim_scoring_job(db: Session, worker: str, stale_before: datetime):
+    """
+    Claim the oldest queued job, or a running job whose worker stopped reporting
+    
+    The claim is a conditional update on the job's attempt counter, so two
+    workers never claim the same attempt.
+    
+    Args:
+        db (Session): Database session
+        worker (str): Name of the claiming worker
+        stale_before (datetime): Running jobs last heard from before this are taken over
+        
+    Returns:
+        models.ScoringJob: The claimed job, or None
+    """
+    candidates = db.query(models.ScoringJob).filter(
+        (models.ScoringJob.status == "queued") |
+        ((models.ScoringJob.status == "running") & (models.ScoringJob.heartbeat_at < stale_before))
+    ).order_by(models.ScoringJob.created_at).limit(10).all()
+    for job in candidates:
+        now = datetime.utcnow()
+        claimed = db.query(models.ScoringJob).filter(
+            models.ScoringJob.id == job.id,
+            models.ScoringJob.attempt == job.attempt
+        ).update({
+            models.ScoringJob.status: "running",
+            models.ScoringJob.attempt: job.attempt + 1,
+            models.ScoringJob.worker: worker,
+            models.ScoringJob.heartbeat_at: now,
+            models.ScoringJob.started_at: job.started_at or now
+        }, synchronize_session=False)
+        db.commit()
+        if claimed:
+            db.refresh(job)
+            return job
+    return None
+
+def update_scoring_job(db: Session, job_id: str, attempt: int, values: dict):
+    """
+    Record the progress or outcome of a claimed job
+    
+    Args:
+        db (Session): Database session
+        job_id (str): Job ID
+        attempt (int): Attempt the caller claimed
+        values (dict): Column values to set
+        
+    Returns:
+        bool: False if the job was claimed by another worker in the meantime
+    """
+    updated = db.query(models.ScoringJob).filter(
+        models.ScoringJob.id == job_id,
+        models.ScoringJob.attempt == attempt
+    ).update(dict(values, heartbeat_at=datetime.utcnow()), synchronize_session=False)
+    db.commit()
+    return bool(updated)
@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, DateTime, Float, ForeignKey, Integer, String, Text, JSON
+from sqlalchemy import DDL, BigInteger, Boolean, Column, DateTime, Float, ForeignKey, Integer, String, Text, JSON, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 
@@ -49,3 +49,47 @@ class CustomRule(Base):
     
     # JSON field for storing complex conditions or additional configuration
     advanced_config = Column(JSON, nullable=True)
+
+class RuleVersion(Base):
+    __tablename__ = "rule_version"
+
+    # Single-row counter bumped on every custom rule change so that every API
+    # worker can cheaply detect that its in-memory rule snapshot is stale
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+# Create the counter row along with the table, so that the first rule changes
+# of concurrent workers all find a row to update
+event.listen(RuleVersion.__table__, "after_create",
+             DDL("INSERT INTO rule_version (id, version, updated_at) VALUES (1, 0, CURRENT_TIMESTAMP)"))
+
+class ScoringJob(Base):
+    __tablename__ = "scoring_jobs"
+
+    id = Column(String(32), primary_key=True)
+    status = Column(String(20), index=True, nullable=False, default="queued")  # queued, running, completed, failed
+    input_format = Column(String(10), nullable=False)  # "jsonl" or "csv"
+    explain = Column(Boolean, default=False)
+    input_path = Column(String(255), nullable=False)
+    output_path = Column(String(255), nullable=False)
+    chunk_size = Column(Integer, nullable=False)
+    total_rows = Column(Integer, nullable=False)
+    
+    # Progress up to the last completed chunk; a resumed job continues from here
+    rows_done = Column(Integer, default=0)
+    invalid_rows = Column(Integer, default=0)
+    output_bytes = Column(BigInteger, default=0)
+    input_bytes = Column(BigInteger, default=0)  # Offset of the first input row not yet scored
+    input_lines = Column(Integer, default=0)  # Input lines up to that offset, for result line numbers
+    processing_seconds = Column(Float, default=0.0)
+    
+    # Bumped every time a worker claims the job; progress is only recorded by
+    # the worker holding the current attempt
+    attempt = Column(Integer, default=0)
+    worker = Column(String(100), nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=func.now())
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
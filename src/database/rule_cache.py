@@ -0,0 +1,178 @@
+import asyncio
+import os
+import threading
+import time
+from types import MappingProxyType
+
+from . import async_crud, crud
+
+# How often (in seconds) a worker re-reads the rule version counter
+DEFAULT_POLL_INTERVAL = float(os.getenv("RULE_CACHE_POLL_SECONDS", "1.0"))
+
+RULE_FIELDS = ("id", "name", "description", "rule_type", "field", "operator", "value",
+               "score", "is_active", "priority", "advanced_config")
+
+
+def freeze_rule(rule):
+    """
+    Copy a custom rule (ORM row or dict) into a read-only mapping
+
+    Args:
+        rule: models.CustomRule instance or rule dictionary
+
+    Returns:
+        MappingProxyType: Immutable view of the rule fields
+    """
+    if isinstance(rule, dict):
+        data = {key: rule.get(key) for key in RULE_FIELDS}
+    else:
+        data = {key: getattr(rule, key, None) for key in RULE_FIELDS}
+    return MappingProxyType(data)
+
+
+class RuleSnapshot:
+    """
+    An immutable, versioned view of the active custom rules
+    """
+
+    __slots__ = ("version", "rules", "loaded_at")
+
+    def __init__(self, version, rules):
+        object.__setattr__(self, "version", version)
+        object.__setattr__(self, "rules", tuple(freeze_rule(r) for r in rules))
+        object.__setattr__(self, "loaded_at", time.time())
+
+    def __setattr__(self, name, value):
+        raise AttributeError("RuleSnapshot is immutable")
+
+    def __len__(self):
+        return len(self.rules)
+
+
+class RuleSnapshotCache:
+    """
+    Process-local cache of the active custom rules
+
+    The rules are only reloaded when the rule version counter in the database
+    moves, which every rule CRUD operation bumps in the same transaction. The
+    counter is polled at most once per poll interval, so all workers converge on
+    the same snapshot without querying custom_rules on every request.
+    """
+
+    def __init__(self, poll_interval=None):
+        """
+        Initialize an empty cache
+
+        Args:
+            poll_interval (float): Minimum seconds between version checks
+        """
+        self.poll_interval = DEFAULT_POLL_INTERVAL if poll_interval is None else poll_interval
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        # Coroutines wait on their own lock: holding the thread lock across an
+        # await would block every other request on the event loop. It is
+        # created in the loop that uses it (see _get_async_lock)
+        self._async_lock = None
+        self._async_lock_loop = None
+        self._listeners = []
+
+    def subscribe(self, callback):
+        """
+        Register a callback invoked with every newly loaded snapshot
+
+        Args:
+            callback (callable): Function taking a RuleSnapshot
+        """
+        self._listeners.append(callback)
+        if self._snapshot is not None:
+            callback(self._snapshot)
+
+    def invalidate(self):
+        """
+        Force the next get_snapshot call to re-check the rule version
+        """
+        self._checked_at = 0.0
+
+    def get_snapshot(self, db):
+        """
+        Get the current rule snapshot, reloading it if the rules changed
+
+        Args:
+            db (Session): Database session
+
+        Returns:
+            RuleSnapshot: The active custom rules
+        """
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._checked_at < self.poll_interval:
+            return snapshot
+
+        with self._lock:
+            # Another thread may have refreshed while we waited for the lock
+            if self._snapshot is not None and time.monotonic() - self._checked_at < self.poll_interval:
+                return self._snapshot
+
+            version = crud.get_rule_version(db)
+            if self._snapshot is None or self._snapshot.version != version:
+                self._publish(RuleSnapshot(version, crud.get_all_custom_rules(db, limit=None, active_only=True)))
+            self._checked_at = time.monotonic()
+            return self._snapshot
+    
+    async def get_snapshot_async(self, db):
+        """
+        Async version of get_snapshot for an AsyncSession
+        
+        Args:
+            db (AsyncSession): Database session
+            
+        Returns:
+            RuleSnapshot: The active custom rules
+        """
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._checked_at < self.poll_interval:
+            return snapshot
+        
+        async with self._get_async_lock():
+            if self._snapshot is not None and time.monotonic() - self._checked_at < self.poll_interval:
+                return self._snapshot
+            
+            version = await async_crud.get_rule_version(db)
+            if self._snapshot is None or self._snapshot.version != version:
+                rules = await async_crud.get_active_custom_rules(db)
+                # Subscribers compile the rules and write files, so they are
+                # notified from a worker thread rather than on the event loop
+                await asyncio.get_running_loop().run_in_executor(
+                    None, self._publish_locked, RuleSnapshot(version, rules))
+            self._checked_at = time.monotonic()
+            return self._snapshot
+    
+    def _get_async_lock(self):
+        """
+        The asyncio lock of the running event loop
+        
+        An asyncio.Lock made outside a loop (e.g. at import, in a gunicorn
+        master with preloading) can end up bound to a different loop than
+        the one that waits on it.
+        """
+        loop = asyncio.get_running_loop()
+        if self._async_lock is None or self._async_lock_loop is not loop:
+            self._async_lock = asyncio.Lock()
+            self._async_lock_loop = loop
+        return self._async_lock
+    
+    def _publish_locked(self, snapshot):
+        """
+        Take the thread lock and install a snapshot, unless it is already current
+        """
+        with self._lock:
+            if self._snapshot is None or self._snapshot.version != snapshot.version:
+                self._publish(snapshot)
+    
+    def _publish(self, snapshot):
+        """
+        Install a new snapshot and notify the subscribers (called with the lock held)
+        """
+        self._snapshot = snapshot
+        for callback in self._listeners:
+            callback(snapshot)
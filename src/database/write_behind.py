@@ -0,0 +1,352 @@
+import glob
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import insert
+from sqlalchemy.exc import DataError, IntegrityError
+
+from . import models
+from .database import SessionLocal
+
+# Whether the API stores scored transactions through a TransactionWriter
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND", "false").lower() == "true"
+
+# Scored transactions waiting to be written
+DEFAULT_QUEUE_SIZE = int(os.getenv("WRITE_BEHIND_QUEUE_SIZE", "10000"))
+
+# A batch is committed when it reaches this many rows ...
+DEFAULT_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "500"))
+
+# ... or when its oldest row has waited this long
+DEFAULT_MAX_DELAY_MS = float(os.getenv("WRITE_BEHIND_MAX_DELAY_MS", "50"))
+
+# How long a full queue blocks a producer before the rows go to the spill file
+DEFAULT_PUT_TIMEOUT = float(os.getenv("WRITE_BEHIND_PUT_TIMEOUT", "5"))
+
+# Spill files are "<base>.<pid>.jsonl", one per process. The default is in the
+# project root rather than the working directory (src/api under startup.sh)
+DEFAULT_SPILL_BASE = os.path.abspath(os.getenv(
+    "WRITE_BEHIND_SPILL_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "write_behind_spill")
+))
+
+# Seconds between attempts to replay spilled rows while the database is down
+RETRY_INTERVAL = 5.0
+
+_STOP = object()
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _dump_record(record):
+    """
+    Spill file line for a row; the timestamp is written in ISO 8601
+    """
+    return json.dumps(record, default=_encode_value)
+
+
+def _load_record(line):
+    """
+    Row from a spill file line, with its timestamp parsed back
+    """
+    record = json.loads(line)
+    if isinstance(record.get("timestamp"), str):
+        record["timestamp"] = datetime.fromisoformat(record["timestamp"])
+    return record
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
+class TransactionWriter:
+    """
+    Write-behind storage of scored transactions with group commit
+
+    Producers enqueue fraud_detection rows and return immediately. A writer
+    thread inserts them in batches, each with one executemany and one commit,
+    so a decision never waits on the database.
+
+    When the queue is full, producers block for up to put_timeout
+    (backpressure), and rows that still do not fit are appended to the spill
+    file. If the database is unavailable, whole batches are spilled too. The
+    file is replayed, in order and before any newer batch, once the
+    database is back. Spill files left behind by processes that no longer run
+    are replayed on start. Rows the database rejects (e.g. a duplicate
+    transaction ID) are logged and dropped, as with direct inserts. Rows
+    that can be neither written nor spilled (e.g. the disk is full) are
+    logged and counted in failed.
+    """
+
+    def __init__(self, session_factory=SessionLocal, queue_size=DEFAULT_QUEUE_SIZE, batch_size=DEFAULT_BATCH_SIZE,
+                 max_delay_ms=DEFAULT_MAX_DELAY_MS, put_timeout=DEFAULT_PUT_TIMEOUT, spill_base=DEFAULT_SPILL_BASE):
+        """
+        Args:
+            session_factory (callable): Returns a new database session
+            queue_size (int): Maximum number of queued rows
+            batch_size (int): Rows per commit
+            max_delay_ms (float): Maximum time a row waits for its batch to fill
+            put_timeout (float): Seconds a producer blocks on a full queue
+            spill_base (str): Path prefix of the spill files
+        """
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.max_delay = max_delay_ms / 1000
+        self.put_timeout = put_timeout
+        self.spill_base = spill_base
+        self.spill_path = f"{spill_base}.{os.getpid()}.jsonl"
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._spill_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._thread = None
+        self._retry_at = 0.0
+        # written includes rows replayed from the spill file
+        self.written = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.rejected = 0
+        self.failed = 0
+
+    def start(self):
+        """
+        Replay orphaned spill files and start the writer thread
+        """
+        if self._thread is not None:
+            return
+        self._replay_orphans()
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def submit(self, records):
+        """
+        Queue rows for writing, blocking while the queue is full
+
+        Args:
+            records (list): Column values for models.Transaction, one dict per row
+        """
+        for position, record in enumerate(records):
+            try:
+                self._queue.put(record, timeout=self.put_timeout)
+            except queue.Full:
+                # The writer cannot keep up; keep the rows on disk instead
+                print(f"Write-behind queue full, spilling {len(records) - position} transactions")
+                self._spill_or_fail(records[position:])
+                return
+
+    def try_submit(self, records):
+        """
+        Queue as many rows as fit without blocking
+
+        Args:
+            records (list): Column values for models.Transaction
+
+        Returns:
+            list: The rows that did not fit (pass them to submit())
+        """
+        for position, record in enumerate(records):
+            try:
+                self._queue.put_nowait(record)
+            except queue.Full:
+                return records[position:]
+        return []
+
+    def flush(self):
+        """
+        Wait until every queued row has been written or spilled
+        """
+        self._queue.join()
+
+    def close(self):
+        """
+        Write out the queue and stop the writer thread
+        """
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        batch = []
+        deadline = None
+        stopping = False
+        while not stopping:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if timeout is None and os.path.exists(self.spill_path):
+                timeout = RETRY_INTERVAL
+            try:
+                item = self._queue.get(timeout=timeout)
+                if item is _STOP:
+                    stopping = True
+                else:
+                    batch.append(item)
+                    if deadline is None:
+                        deadline = time.monotonic() + self.max_delay
+            except queue.Empty:
+                pass
+            if batch and (stopping or len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                try:
+                    self._write_batch(batch)
+                except Exception as e:
+                    print(f"Error writing {len(batch)} transactions, spilling them: {str(e)}")
+                    self._spill_or_fail(batch)
+                for _ in batch:
+                    self._queue.task_done()
+                batch = []
+                deadline = None
+            elif not batch and os.path.exists(self.spill_path):
+                try:
+                    self._replay_own_spill()
+                except Exception as e:
+                    print(f"Error replaying spilled transactions: {str(e)}")
+        self._queue.task_done()
+
+    def _write_batch(self, batch):
+        if time.monotonic() < self._retry_at:
+            self._spill(batch)
+            return
+        # Older, spilled rows go first; while they cannot be written, neither can newer ones
+        if os.path.exists(self.spill_path) and not self._replay_own_spill(force=True):
+            self._spill(batch)
+            return
+        if not self._insert(batch):
+            self._spill(batch)
+
+    def _insert(self, records):
+        """
+        Insert rows in one transaction
+
+        If the database fails part-way through, all the rows are reported as
+        not written; the ones that were will be rejected as duplicates when
+        they are replayed.
+
+        Returns:
+            bool: False if the database could not be reached
+        """
+        db = self.session_factory()
+        try:
+            try:
+                db.execute(insert(models.Transaction), records)
+                db.commit()
+                with self._stats_lock:
+                    self.written += len(records)
+            except (IntegrityError, DataError):
+                db.rollback()
+                self._insert_each(db, records)
+            return True
+        except Exception as e:
+            db.rollback()
+            print(f"Database unavailable, spilling {len(records)} transactions: {str(e)}")
+            self._retry_at = time.monotonic() + RETRY_INTERVAL
+            return False
+        finally:
+            db.close()
+
+    def _insert_each(self, db, records):
+        # Only the rows the database rejects are lost
+        for record in records:
+            try:
+                db.execute(insert(models.Transaction), [record])
+                db.commit()
+                with self._stats_lock:
+                    self.written += 1
+            except (IntegrityError, DataError) as e:
+                db.rollback()
+                with self._stats_lock:
+                    self.rejected += 1
+                print(f"Error storing transaction {record['transaction_id']}: {str(e)}")
+
+    def _spill(self, records):
+        with self._spill_lock:
+            with open(self.spill_path, "a") as f:
+                f.write("".join(_dump_record(record) + "\n" for record in records))
+                f.flush()
+                os.fsync(f.fileno())
+        with self._stats_lock:
+            self.spilled += len(records)
+
+    def _spill_or_fail(self, records):
+        try:
+            self._spill(records)
+        except Exception as e:
+            with self._stats_lock:
+                self.failed += len(records)
+            print(f"Error spilling {len(records)} transactions, they are lost: {str(e)}")
+
+    def _replay_own_spill(self, force=False):
+        """
+        Replay this process's spill file
+
+        Args:
+            force (bool): Try even if the last failure was less than RETRY_INTERVAL ago
+
+        Returns:
+            bool: True if the file was replayed (or did not exist)
+        """
+        if not force and time.monotonic() < self._retry_at:
+            return False
+        # Holding the lock keeps overflowing producers from appending mid-replay
+        with self._spill_lock:
+            return self._replay_file(self.spill_path)
+
+    def _replay_orphans(self):
+        for path in sorted(glob.glob(f"{glob.escape(self.spill_base)}.*.jsonl")):
+            # "<base>.<pid>.jsonl", or "<base>.<pid>.<source>.jsonl" once claimed by process pid
+            name = path[len(self.spill_base) + 1:-len(".jsonl")]
+            pid = name.split(".")[0]
+            if path == self.spill_path or (pid.isdigit() and not _pid_alive(int(pid))):
+                # Claim the file so that no other worker replays it as well.
+                # The name is unique per source file, and if this process
+                # dies before replaying it, another one claims it in turn
+                claimed = f"{self.spill_base}.{os.getpid()}.{name}.jsonl"
+                try:
+                    os.replace(path, claimed)
+                except OSError:
+                    continue
+                if not self._replay_file(claimed):
+                    with self._spill_lock:
+                        with open(claimed) as f, open(self.spill_path, "a") as out:
+                            out.write(f.read())
+                    os.remove(claimed)
+
+    def _replay_file(self, path):
+        if not os.path.exists(path):
+            return True
+        records = []
+        with open(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    records.append(_load_record(line))
+                except ValueError:
+                    # E.g. the last line of a process that died mid-write
+                    with self._stats_lock:
+                        self.failed += 1
+                    print(f"Skipping unreadable spilled transaction in {path}: {line[:100]!r}")
+        for start in range(0, len(records), self.batch_size):
+            if not self._insert(records[start:start + self.batch_size]):
+                # Keep what is left for the next attempt
+                with open(path + ".tmp", "w") as f:
+                    f.write("".join(_dump_record(record) + "\n" for record in records[start:]))
+                os.replace(path + ".tmp", path)
+                return False
+            with self._stats_lock:
+                self.replayed += min(self.batch_size, len(records) - start)
+        os.remove(path)
+        print(f"Replayed {len(records)} spilled transactions from {path}")
+        return True
@@ -4,6 +4,11 @@ import numpy as np
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.preprocessing import StandardScaler
 
+from .compiled_forest import CompiledForest, ROW_LOOP_MAX_ROWS, compiled_path, file_digest
+from .amount_lookup import AmountLookupTables, LOOKUP_TABLES_ENABLED
+from .features import extract_feature_matrix, extract_feature_row
+from .cascade import CASCADE_ENABLED, ScreeningModel, screening_path
+
 class AIFraudDetector:
     """
     An AI-based fraud detection model using a Random Forest classifier
@@ -19,6 +24,14 @@ class AIFraudDetector:
         self.model_path = model_path
         self.model = None
         self.scaler = None
+        # Flattened copy of the trained forest used for scoring
+        self.forest = None
+        # Per-combination amount breakpoint tables built from the forest
+        self.amount_tables = None
+        # Cheap screening model that decides when the forest is needed
+        self.screen = None
+        self.screened = 0
+        self.escalated = 0
         
         if model_path and os.path.exists(model_path):
             self.load_model()
@@ -35,10 +48,14 @@ class AIFraudDetector:
             random_state=42
         )
         self.scaler = StandardScaler()
+        self.set_forest(None)
     
     def load_model(self):
         """
         Load a pre-trained model from disk
+        
+        The compiled forest stored next to the pickle is used if it was built
+        from this exact pickle; otherwise the forest is compiled in memory.
         """
         try:
             model_data = joblib.load(self.model_path)
@@ -47,6 +64,99 @@ class AIFraudDetector:
         except Exception as e:
             print(f"Error loading model: {e}")
             self.initialize_model()
+            return
+        
+        digest = file_digest(self.model_path)
+        forest_path = compiled_path(self.model_path)
+        forest = None
+        if os.path.exists(forest_path):
+            try:
+                forest = CompiledForest.load(forest_path)
+                if forest.source_digest != digest:
+                    forest = None
+            except Exception as e:
+                print(f"Error loading compiled forest: {e}")
+        if forest is not None:
+            self.set_forest(forest)
+        else:
+            self.compile_forest(digest)
+        
+        # Screening model of the cascade, if one was distilled from this pickle
+        screen_path = screening_path(self.model_path)
+        if CASCADE_ENABLED and os.path.exists(screen_path):
+            try:
+                screen = ScreeningModel.load(screen_path)
+                if screen.source_digest == digest:
+                    self.screen = screen
+                else:
+                    print("Screening model was built for a different model file; cascade disabled")
+            except Exception as e:
+                print(f"Error loading screening model: {e}")
+    
+    def compile_forest(self, source_digest=""):
+        """
+        Build the flattened forest used for scoring from the trained model
+        
+        Args:
+            source_digest (str): Digest of the pickle the model was loaded from
+        """
+        if self.model is None or not hasattr(self.model, 'classes_'):
+            self.set_forest(None)
+            return
+        self.set_forest(CompiledForest.from_model(self.model, self.scaler, source_digest))
+    
+    def set_forest(self, forest):
+        """
+        Use a compiled forest for scoring
+        
+        The amount lookup tables are tied to the forest, so they start empty
+        again whenever the model changes.
+        
+        Args:
+            forest (CompiledForest): The forest, or None to score with the sklearn model
+        """
+        self.forest = forest
+        self.amount_tables = AmountLookupTables(forest) if forest is not None and LOOKUP_TABLES_ENABLED else None
+        self.screen = None
+    
+    def set_screening_model(self, screen):
+        """
+        Screen transactions with a cheap model and only call the forest when it is unsure
+        
+        Args:
+            screen (ScreeningModel): Model distilled from this forest, or None to always use the forest
+        """
+        self.screen = screen
+        self.screened = 0
+        self.escalated = 0
+    
+    def forest_probability(self, row):
+        """
+        Fraud probability of one raw feature row from the compiled forest
+        
+        Args:
+            row (list): Raw feature values
+            
+        Returns:
+            float: Fraud probability
+        """
+        if self.amount_tables is not None:
+            return self.amount_tables.fraud_probability(row)
+        return self.forest.score_row(row)
+    
+    def precompile_lookup_tables(self, transactions):
+        """
+        Build amount lookup tables for the feature combinations seen in transactions
+        
+        Args:
+            transactions (list): Transaction dictionaries, e.g. recent traffic
+            
+        Returns:
+            int: Number of tables built
+        """
+        if self.amount_tables is None:
+            return 0
+        return self.amount_tables.precompile(self.extract_features(t) for t in transactions)
     
     def save_model(self, path=None):
         """
@@ -62,39 +172,47 @@ class AIFraudDetector:
                 "scaler": self.scaler
             }
             joblib.dump(model_data, save_path)
+            
+            # Store the compiled forest next to the pickle
+            if self.model is not None and hasattr(self.model, 'classes_'):
+                self.compile_forest(file_digest(save_path))
+                self.forest.save(compiled_path(save_path))
     
-    def preprocess_transaction(self, transaction):
+    def extract_features(self, transaction):
         """
-        Preprocess a transaction for the model
+        Extract the raw (unscaled) feature values of a transaction
         
         Args:
             transaction (dict): The transaction data
             
         Returns:
-            numpy.ndarray: Preprocessed features
+            list: The 13 feature values
+        """
+        return extract_feature_row(transaction)
+    
+    def raw_features(self, transactions):
+        """
+        Unscaled feature matrix for several transactions
+        
+        Args:
+            transactions: List of transaction dictionaries or a DataFrame
+            
+        Returns:
+            numpy.ndarray: Raw features, one row per transaction
+        """
+        return extract_feature_matrix(transactions)
+    
+    def preprocess_batch(self, transactions):
+        """
+        Preprocess several transactions into one feature matrix
+        
+        Args:
+            transactions: List of transaction dictionaries or a DataFrame
+            
+        Returns:
+            numpy.ndarray: Preprocessed features, one row per transaction
         """
-        # Extract features from the transaction
-        features = [
-            transaction["amount"],
-            # One-hot encoding for payment_mode
-            1 if transaction["payment_mode"] == "credit_card" else 0,
-            1 if transaction["payment_mode"] == "debit_card" else 0,
-            1 if transaction["payment_mode"] == "bank_transfer" else 0,
-            1 if transaction["payment_mode"] == "digital_wallet" else 0,
-            # One-hot encoding for channel
-            1 if transaction["channel"] == "web" else 0,
-            1 if transaction["channel"] == "mobile_app" else 0,
-            1 if transaction["channel"] == "in_store" else 0,
-            1 if transaction["channel"] == "phone" else 0,
-            # Additional features to match the model's expected 13 features
-            transaction.get("amount", 0) / 1000,  # Normalized amount
-            len(transaction.get("payer_id", "")),  # Length of payer ID as a feature
-            len(transaction.get("payee_id", "")),  # Length of payee ID as a feature
-            1 if transaction.get("bank") else 0,  # Whether bank info is provided
-        ]
-        
-        # Convert to numpy array
-        features = np.array(features).reshape(1, -1)
+        features = self.raw_features(transactions)
         
         # Scale features if scaler is fitted
         if hasattr(self.scaler, 'mean_'):
@@ -102,16 +220,28 @@ class AIFraudDetector:
         
         return features
     
+    def preprocess_transaction(self, transaction):
+        """
+        Preprocess a transaction for the model
+        
+        Args:
+            transaction (dict): The transaction data
+            
+        Returns:
+            numpy.ndarray: Preprocessed features
+        """
+        return self.preprocess_batch([transaction])
+    
     def train(self, transactions, labels):
         """
         Train the model on a dataset
         
         Args:
-            transactions (list): List of transaction dictionaries
+            transactions: List of transaction dictionaries or a DataFrame
             labels (list): List of fraud labels (1 for fraud, 0 for non-fraud)
         """
-        # Preprocess all transactions
-        features = np.vstack([self.preprocess_transaction(t) for t in transactions])
+        # Extract the unscaled features of all transactions at once
+        features = self.raw_features(transactions)
         
         # Fit the scaler
         self.scaler.fit(features)
@@ -121,6 +251,7 @@ class AIFraudDetector:
         
         # Train the model
         self.model.fit(scaled_features, labels)
+        self.compile_forest()
     
     def predict(self, transaction):
         """
@@ -132,25 +263,96 @@ class AIFraudDetector:
         Returns:
             tuple: (is_fraudulent (bool), fraud_probability (float))
         """
+        return self.predict_batch([transaction])[0]
+    
+    def predict_batch(self, transactions):
+        """
+        Predict several transactions with a single predict_proba call
+        
+        Most of the cost of scoring one row with the forest is per-call
+        overhead, so stacking rows amortizes it. Each row gets the same
+        result as predict() would give it.
+        
+        Args:
+            transactions (list): List of transaction dictionaries
+            
+        Returns:
+            list: (is_fraudulent (bool), fraud_probability (float)) for each transaction
+        """
+        if not transactions:
+            return []
+        
         # If model is not trained, return a default prediction
         if self.model is None or not hasattr(self.model, 'classes_'):
-            # Apply basic heuristics for large transactions when model isn't available
-            amount = transaction.get("amount", 0)
-            if amount > 50000:
-                return True, 0.8
-            elif amount > 25000:
-                return True, 0.6
-            elif amount > 10000:
-                return False, 0.4
-            return False, 0.09
-        
-        # Preprocess the transaction
-        features = self.preprocess_transaction(transaction)
-        
-        # Get the probability of fraud
-        probabilities = self.model.predict_proba(features)[0]
-        fraud_probability = probabilities[1] if len(probabilities) > 1 else 0.0
+            return [self.heuristic_prediction(t.get("amount", 0)) for t in transactions]
+        
+        # Get the probability of fraud, from the lookup tables or compiled forest when available
+        if self.screen is not None:
+            fraud_probabilities = self.cascade_probabilities(transactions)
+        elif self.amount_tables is not None:
+            fraud_probabilities = [self.amount_tables.fraud_probability(self.extract_features(t))
+                                   for t in transactions]
+        elif self.forest is not None:
+            if len(transactions) > ROW_LOOP_MAX_ROWS:
+                features = self.raw_features(transactions)
+            else:
+                features = [self.extract_features(t) for t in transactions]
+            fraud_probabilities = self.forest.fraud_probability(features)
+        else:
+            probabilities = self.model.predict_proba(self.preprocess_batch(transactions))
+            fraud_probabilities = probabilities[:, 1] if probabilities.shape[1] > 1 else np.zeros(len(transactions))
+        
+        return [self.apply_amount_floor(transaction, fraud_probability)
+                for transaction, fraud_probability in zip(transactions, fraud_probabilities)]
+    
+    def cascade_probabilities(self, transactions):
+        """
+        Screening scores, replaced by the forest's score where the screen is unsure
+        
+        Args:
+            transactions (list): List of transaction dictionaries
+            
+        Returns:
+            list: Fraud probability for each transaction
+        """
+        probabilities = []
+        escalated = 0
+        for transaction in transactions:
+            row = self.extract_features(transaction)
+            probability = self.screen.score_row(row)
+            if self.screen.is_uncertain(probability):
+                probability = self.forest_probability(row)
+                escalated += 1
+            probabilities.append(probability)
+        self.screened += len(transactions)
+        self.escalated += escalated
+        return probabilities
+    
+    @classmethod
+    def score_bounds(cls, amount):
+        """
+        Lowest and highest fraud probability predict() can return for an amount
+        
+        Args:
+            amount (float): Transaction amount
+            
+        Returns:
+            tuple: (lowest (float), highest (float))
+        """
+        return cls.apply_amount_floor({"amount": amount}, 0.0)[1], 1.0
+    
+    @staticmethod
+    def apply_amount_floor(transaction, fraud_probability):
+        """
+        Raise the model's probability for large amounts and make the decision
         
+        Args:
+            transaction (dict): The transaction data
+            fraud_probability (float): Model probability
+            
+        Returns:
+            tuple: (is_fraudulent (bool), fraud_probability (float))
+        """
         # Adjust probability based on transaction amount for more sensitivity
         amount = transaction.get("amount", 0)
         if amount > 50000:
@@ -164,3 +366,22 @@ class AIFraudDetector:
         is_fraudulent = fraud_probability >= 0.5
         
         return is_fraudulent, fraud_probability
+    
+    @staticmethod
+    def heuristic_prediction(amount):
+        """
+        Basic heuristics for large transactions when the model isn't available
+        
+        Args:
+            amount (float): Transaction amount
+            
+        Returns:
+            tuple: (is_fraudulent (bool), fraud_probability (float))
+        """
+        if amount > 50000:
+            return True, 0.8
+        elif amount > 25000:
+            return True, 0.6
+        elif amount > 10000:
+            return False, 0.4
+        return False, 0.09
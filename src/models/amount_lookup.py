@@ -0,0 +1,179 @@
+import os
+import threading
+from bisect import bisect_left
+
+import numpy as np
+
+from .compiled_forest import largest_passing
+
+# Whether AI scores are served from per-combination amount tables
+LOOKUP_TABLES_ENABLED = os.getenv("AI_LOOKUP_TABLES", "true").lower() == "true"
+
+# Maximum number of discrete feature combinations with a table
+DEFAULT_MAX_TABLES = int(os.getenv("AI_LOOKUP_MAX_TABLES", "4096"))
+
+# Features derived from the amount: the amount itself and amount / 1000
+AMOUNT_FEATURE = 0
+AMOUNT_THOUSANDS_FEATURE = 9
+
+
+def discrete_key(row):
+    """
+    The discrete part of a feature row: one-hot flags, ID lengths and the bank flag
+
+    Args:
+        row (list): Raw feature values from AIFraudDetector.extract_features
+
+    Returns:
+        tuple: Every feature except the two amount features
+    """
+    return tuple(row[1:AMOUNT_THOUSANDS_FEATURE]) + tuple(row[AMOUNT_THOUSANDS_FEATURE + 1:])
+
+
+class AmountTable:
+    """
+    Fraud probability as a step function of the amount, for one discrete combination
+
+    values[i] applies to amounts in (breakpoints[i - 1], breakpoints[i]], and
+    the last value to amounts above the last breakpoint.
+    """
+
+    __slots__ = ("breakpoints", "values")
+
+    def __init__(self, breakpoints, values):
+        self.breakpoints = breakpoints
+        self.values = values
+
+    def lookup(self, amount):
+        if amount != amount:
+            # NaN fails every split test, like the largest amounts
+            return self.values[-1]
+        return self.values[bisect_left(self.breakpoints, amount)]
+
+
+class AmountLookupTables:
+    """
+    Exact AI scores from sorted amount breakpoints, one table per discrete feature combination
+
+    Apart from the amount (features 0 and 9), every model feature takes a few
+    discrete values, so for a fixed combination of them the forest's output
+    only changes at the amount split thresholds of the nodes that combination
+    can reach. A table evaluates the compiled forest once per interval
+    between consecutive breakpoints, at a point taking the same path through
+    every tree as any other amount in the interval, so lookups are
+    bit-identical to the forest. Tables are built for combinations passed to
+    precompile() and on the first miss, up to max_tables; further
+    combinations are scored by the forest directly.
+    """
+
+    def __init__(self, forest, max_tables=DEFAULT_MAX_TABLES):
+        """
+        Initialize the tables
+
+        Args:
+            forest (CompiledForest): Forest the tables are built from
+            max_tables (int): Maximum number of combinations with a table
+        """
+        self.forest = forest
+        self.max_tables = max_tables
+        self.source_digest = forest.source_digest
+        self.tables = {}
+        self._lock = threading.Lock()
+        # Amount breakpoint of every node testing an amount feature
+        amount_nodes = forest.feature == AMOUNT_FEATURE
+        thousands_nodes = forest.feature == AMOUNT_THOUSANDS_FEATURE
+        internal = forest.left != np.arange(len(forest.left))
+        self.is_amount_node = (amount_nodes | thousands_nodes) & internal
+        breakpoints = np.where(amount_nodes, forest.threshold, np.nan)
+        thousands = forest.threshold[thousands_nodes]
+        # amount / 1000 <= t holds up to the largest amount that still passes
+        with np.errstate(over="ignore"):
+            breakpoints[thousands_nodes] = largest_passing(lambda amount: amount / 1000 <= thousands,
+                                                           len(thousands))
+        self.node_breakpoints = breakpoints
+
+    def fraud_probability(self, row):
+        """
+        Fraud probability of one raw feature row
+
+        Args:
+            row (list): Raw feature values
+
+        Returns:
+            float: Same value as forest.score_row(row)
+        """
+        key = discrete_key(row)
+        table = self.tables.get(key)
+        if table is None:
+            table = self._build_on_miss(key, row)
+            if table is None:
+                return self.forest.score_row(row)
+        return table.lookup(row[AMOUNT_FEATURE])
+
+    def precompile(self, rows):
+        """
+        Build tables for the discrete combinations of the given feature rows
+
+        Args:
+            rows (iterable): Raw feature rows, e.g. from observed transactions
+
+        Returns:
+            int: Number of tables built
+        """
+        built = 0
+        for row in rows:
+            key = discrete_key(row)
+            if key not in self.tables and self._build_on_miss(key, row) is not None:
+                built += 1
+        return built
+
+    def _build_on_miss(self, key, row):
+        with self._lock:
+            table = self.tables.get(key)
+            if table is None and len(self.tables) < self.max_tables:
+                table = self.tables[key] = self.build_table(row)
+        return table
+
+    def _reachable_breakpoints(self, row):
+        """
+        Amount breakpoints of the nodes the discrete features of row can reach
+        """
+        forest = self.forest
+        row = np.asarray(row, dtype=np.float64)
+        frontier = forest.roots
+        found = []
+        while frontier.size:
+            frontier = frontier[forest.left[frontier] != frontier]
+            on_amount = self.is_amount_node[frontier]
+            amount_nodes = frontier[on_amount]
+            found.append(self.node_breakpoints[amount_nodes])
+            # Any amount can go either way at an amount split; elsewhere the row decides
+            other = frontier[~on_amount]
+            go_right = row[forest.feature[other]] > forest.threshold[other]
+            frontier = np.concatenate([forest.left[amount_nodes], forest.right[amount_nodes],
+                                       np.where(go_right, forest.right[other], forest.left[other])])
+        return np.unique(np.concatenate(found)) if found else np.empty(0)
+
+    def build_table(self, row):
+        """
+        Build the amount table for the discrete combination of row
+
+        Args:
+            row (list): Raw feature values; only the discrete features are used
+
+        Returns:
+            AmountTable: The table
+        """
+        breakpoints = self._reachable_breakpoints(row)
+        # One representative amount per interval: its upper breakpoint, and
+        # just above the last breakpoint for the open interval
+        last = np.nextafter(breakpoints[-1], np.inf) if breakpoints.size else 0.0
+        amounts = np.append(breakpoints, last)
+        samples = np.tile(np.asarray(row, dtype=np.float64), (len(amounts), 1))
+        samples[:, AMOUNT_FEATURE] = amounts
+        samples[:, AMOUNT_THOUSANDS_FEATURE] = amounts / 1000
+        values = self.forest.fraud_probability(samples)
+        # Merge neighbouring intervals with the same score
+        changes = values[:-1] != values[1:]
+        return AmountTable(breakpoints[changes].tolist(),
+                           np.append(values[:-1][changes], values[-1]).tolist())
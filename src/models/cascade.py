@@ -0,0 +1,238 @@
+import argparse
+import os
+import time
+
+import numpy as np
+from sklearn.tree import DecisionTreeRegressor
+
+from .compiled_forest import MMAP_ENABLED, fold_thresholds, load_npz, save_npz
+from .features import extract_feature_matrix
+
+# Whether AIFraudDetector screens transactions before calling the forest
+CASCADE_ENABLED = os.getenv("AI_CASCADE", "false").lower() == "true"
+
+# Screening scores inside [low, high] are escalated to the forest
+DEFAULT_BAND = tuple(float(bound) for bound in os.getenv("AI_CASCADE_BAND", "0.2,0.8").split(","))
+
+# Depth of the distilled screening tree
+DEFAULT_SCREEN_DEPTH = 6
+
+FORMAT_VERSION = 1
+
+
+def screening_path(model_path):
+    """
+    Path of the screening model stored next to a pickled model
+    """
+    return os.path.splitext(model_path)[0] + ".screen.npz"
+
+
+class ScreeningModel:
+    """
+    A shallow regression tree distilled from the forest's fraud probabilities
+
+    It is trained on the same features as the forest, with the forest's own
+    scores as targets, and evaluated in plain Python on a raw feature row.
+    Scores inside the uncertainty band [low, high] are sent on to the forest;
+    scores outside it are trusted as they are.
+    """
+
+    ARRAYS = ("feature", "threshold", "left", "right", "value")
+
+    def __init__(self, feature, threshold, left, right, value, low, high, source_digest=""):
+        """
+        Args:
+            feature (numpy.ndarray): Feature tested at each node
+            threshold (numpy.ndarray): Raw-value threshold at each node (go left if x <= threshold)
+            left (numpy.ndarray): Left child of each node (-1 for leaves)
+            right (numpy.ndarray): Right child of each node (-1 for leaves)
+            value (numpy.ndarray): Predicted fraud probability at each node
+            low (float): Lower bound of the uncertainty band
+            high (float): Upper bound of the uncertainty band
+            source_digest (str): Digest of the pickle the forest came from
+        """
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.low = float(low)
+        self.high = float(high)
+        self.source_digest = source_digest
+        self._nodes = list(zip(feature.tolist(), threshold.tolist(), left.tolist(), right.tolist()))
+        self._values = value.tolist()
+
+    @classmethod
+    def distill(cls, forest_probabilities, features, band=DEFAULT_BAND, max_depth=DEFAULT_SCREEN_DEPTH,
+                source_digest=""):
+        """
+        Fit a screening tree to the forest's scores
+
+        Args:
+            forest_probabilities (numpy.ndarray): Forest fraud probability of each row
+            features (numpy.ndarray): Raw feature matrix the probabilities were computed from
+            band (tuple): (low, high) uncertainty band
+            max_depth (int): Depth of the screening tree
+            source_digest (str): Digest of the pickle the forest came from
+
+        Returns:
+            ScreeningModel: The screening model
+        """
+        tree = DecisionTreeRegressor(max_depth=max_depth, random_state=42)
+        tree.fit(features, forest_probabilities)
+        nodes = tree.tree_
+        is_leaf = nodes.children_left == -1
+        feature = np.where(is_leaf, 0, nodes.feature).astype(np.intp)
+        # The tree compares float32 copies of the features; fold that into the thresholds
+        threshold = fold_thresholds(np.where(is_leaf, 0.0, nodes.threshold), feature)
+        return cls(feature, threshold, nodes.children_left.astype(np.intp), nodes.children_right.astype(np.intp),
+                   nodes.value[:, 0, 0].astype(np.float64), band[0], band[1], source_digest)
+
+    def score_row(self, row):
+        """
+        Screening score of one raw feature row
+
+        Args:
+            row (list): Raw feature values
+
+        Returns:
+            float: Approximate fraud probability
+        """
+        nodes = self._nodes
+        node = 0
+        while True:
+            feature, threshold, left, right = nodes[node]
+            if left == -1:
+                return self._values[node]
+            node = left if row[feature] <= threshold else right
+
+    def is_uncertain(self, score):
+        """
+        Whether a screening score has to be confirmed by the forest
+        """
+        return self.low <= score <= self.high
+
+    def save(self, path):
+        """
+        Write the screening model to an .npz file laid out for load_npz()
+
+        Args:
+            path (str): Destination path
+        """
+        save_npz(path, format_version=FORMAT_VERSION, low=self.low, high=self.high,
+                 source_digest=self.source_digest,
+                 **{name: getattr(self, name) for name in self.ARRAYS})
+
+    @classmethod
+    def load(cls, path, mmap=MMAP_ENABLED):
+        """
+        Read a screening model written by save()
+
+        Args:
+            path (str): Path of the .npz file
+            mmap (bool): Map the arrays from the file instead of reading them
+
+        Returns:
+            ScreeningModel: The model
+
+        Raises:
+            ValueError: If the file has an unsupported format version
+        """
+        data = load_npz(path, mmap=mmap)
+        if int(data["format_version"]) != FORMAT_VERSION:
+            raise ValueError(f"Unsupported screening model version {int(data['format_version'])}")
+        return cls(low=float(data["low"]), high=float(data["high"]), source_digest=str(data["source_digest"]),
+                   **{name: data[name] for name in cls.ARRAYS})
+
+
+def evaluate_cascade(detector, screen, transactions):
+    """
+    Compare the cascade with the forest alone on held-out transactions
+
+    Args:
+        detector (AIFraudDetector): Detector with a trained forest
+        screen (ScreeningModel): Screening model to evaluate
+        transactions (list): Held-out transaction dictionaries
+
+    Returns:
+        dict: Fraction escalated to the forest, agreement of the fraud
+            decisions with the forest alone, mean absolute score difference
+            and per-transaction timings in microseconds
+    """
+    rows = [detector.extract_features(t) for t in transactions]
+
+    start = time.perf_counter()
+    forest_scores = [detector.forest_probability(row) for row in rows]
+    forest_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    cascade_scores = []
+    escalated = 0
+    for row in rows:
+        score = screen.score_row(row)
+        if screen.is_uncertain(score):
+            score = detector.forest_probability(row)
+            escalated += 1
+        cascade_scores.append(score)
+    cascade_seconds = time.perf_counter() - start
+
+    forest_decisions = [detector.apply_amount_floor(t, p)[0] for t, p in zip(transactions, forest_scores)]
+    cascade_decisions = [detector.apply_amount_floor(t, p)[0] for t, p in zip(transactions, cascade_scores)]
+    n = len(transactions)
+    return {
+        "transactions": n,
+        "escalated_fraction": escalated / n,
+        "decision_agreement": sum(a == b for a, b in zip(forest_decisions, cascade_decisions)) / n,
+        "mean_abs_score_difference": float(np.mean(np.abs(np.subtract(forest_scores, cascade_scores)))),
+        "forest_us_per_transaction": forest_seconds / n * 1e6,
+        "cascade_us_per_transaction": cascade_seconds / n * 1e6,
+    }
+
+
+def build_cascade(detector, transactions, band=DEFAULT_BAND, max_depth=DEFAULT_SCREEN_DEPTH, holdout=0.2):
+    """
+    Distill a screening model from a detector's forest and evaluate it
+
+    Args:
+        detector (AIFraudDetector): Detector with a trained forest
+        transactions (list): Transaction dictionaries; the forest labels them, so no fraud labels are needed
+        band (tuple): (low, high) uncertainty band
+        max_depth (int): Depth of the screening tree
+        holdout (float): Fraction of transactions kept for the evaluation
+
+    Returns:
+        tuple: (ScreeningModel, evaluation report (dict))
+    """
+    split = int(len(transactions) * (1 - holdout))
+    train, test = transactions[:split], transactions[split:]
+    features = extract_feature_matrix(train)
+    forest_probabilities = np.array([detector.forest_probability(row) for row in features.tolist()])
+    screen = ScreeningModel.distill(forest_probabilities, features, band, max_depth,
+                                    detector.forest.source_digest)
+    return screen, evaluate_cascade(detector, screen, test)
+
+
+if __name__ == "__main__":
+    from ..utils.generate_test_data import generate_transaction
+    from .ai_model import AIFraudDetector
+
+    parser = argparse.ArgumentParser(description="Distill and evaluate the screening model of the AI cascade")
+    parser.add_argument("--model", default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                        "trained", "fraud_model.pkl"))
+    parser.add_argument("--samples", type=int, default=50000, help="Synthetic transactions to distill from")
+    parser.add_argument("--low", type=float, default=DEFAULT_BAND[0])
+    parser.add_argument("--high", type=float, default=DEFAULT_BAND[1])
+    parser.add_argument("--depth", type=int, default=DEFAULT_SCREEN_DEPTH)
+    parser.add_argument("--save", action="store_true", help="Store the screening model next to the pickle")
+    args = parser.parse_args()
+
+    detector = AIFraudDetector(model_path=args.model)
+    if detector.forest is None:
+        raise SystemExit("The model is not trained")
+    transactions = [generate_transaction() for _ in range(args.samples)]
+    screen, report = build_cascade(detector, transactions, (args.low, args.high), args.depth)
+    for key, value in report.items():
+        print(f"{key}: {value:.4f}" if isinstance(value, float) else f"{key}: {value}")
+    if args.save:
+        screen.save(screening_path(args.model))
+        print(f"Saved screening model to {screening_path(args.model)}")
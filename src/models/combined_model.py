@@ -1,12 +1,33 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
 from .rule_based import RuleBasedFraudDetector
 from .ai_model import AIFraudDetector
+from .inference_queue import InferenceBatcher
+
+def decision_threshold(transaction):
+    """
+    Fraud threshold used by the API for a transaction
+    
+    High-value transactions are flagged at a much lower score.
+    
+    Args:
+        transaction (dict): The transaction data
+        
+    Returns:
+        float: The threshold
+    """
+    return 0.05 if transaction.get("amount", 0) > 10000 else 0.5
 
 class CombinedFraudDetector:
     """
     A combined fraud detection model that uses both rule-based and AI approaches
     """
     
-    def __init__(self, rule_config=None, custom_rules=None, ai_model_path=None, ai_weight=0.7):
+    def __init__(self, rule_config=None, custom_rules=None, ai_model_path=None, ai_weight=0.7, early_exit=False,
+                 batch_ai=False, skip_decided_ai=False, audit_skipped_ai=False, audit_callback=None, velocity=True):
         """
         Initialize the combined detector
         
@@ -15,21 +36,62 @@ class CombinedFraudDetector:
             custom_rules (list): List of custom rules from the database
             ai_model_path (str): Path to the pre-trained AI model
             ai_weight (float): Weight given to the AI model's prediction (between 0 and 1)
+            early_exit (bool): Stop evaluating custom rules once the rule score saturates at 1.0
+            batch_ai (bool): Coalesce concurrent AI predictions into batched predict_proba calls
+            skip_decided_ai (bool): Skip the AI model when the verdict cannot depend on its score
+            audit_skipped_ai (bool): Still score skipped transactions, in a background thread
+            audit_callback (callable): Called as audit_callback(transaction, ai_score, combined_score,
+                is_fraudulent) with the full result of every audited transaction
+            velocity (bool): Apply the velocity checks (see RuleBasedFraudDetector)
         """
-        self.rule_detector = RuleBasedFraudDetector(config=rule_config, custom_rules=custom_rules)
+        self.rule_detector = RuleBasedFraudDetector(config=rule_config, custom_rules=custom_rules, velocity=velocity)
         self.ai_detector = AIFraudDetector(model_path=ai_model_path)
         self.ai_weight = ai_weight
+        self.early_exit = early_exit
+        self.ai_batcher = InferenceBatcher(self.ai_detector) if batch_ai else None
+        self.skip_decided_ai = skip_decided_ai
+        self.audit_skipped_ai = audit_skipped_ai
+        self.audit_callback = audit_callback
+        self._audit_executor = None
+        self._stats_lock = threading.Lock()
+        self.ai_skipped = 0
+        self.audited = 0
+        self.audit_mismatches = 0
+        # Context compiled by rules_for() for a snapshot the detector is not on
+        self._pinned_rules = None
     
-    def set_custom_rules(self, custom_rules):
+    def set_custom_rules(self, custom_rules, version=None):
         """
         Update the custom rules for the rule-based detector
         
         Args:
             custom_rules (list): List of custom rules
+            version (int): Version of the rule snapshot the rules came from, if any
+        """
+        self.rule_detector.set_custom_rules(custom_rules, version)
+    
+    def rules_for(self, snapshot):
+        """
+        Get the compiled rules of a rule snapshot, to pin them for a call
+        
+        Each snapshot version is compiled once: the detector's current rules
+        are reused when they come from the same version, and so is the last
+        context compiled here. The detector's own rules are not changed.
+        
+        Args:
+            snapshot (RuleSnapshot): Versioned custom rules
+            
+        Returns:
+            RuleContext: Rules to pass to detect_fraud / detect_fraud_batch
         """
-        self.rule_detector.set_custom_rules(custom_rules)
+        for context in (self.rule_detector.context, self._pinned_rules):
+            if context is not None and context.version == snapshot.version:
+                return context
+        context = self.rule_detector.build_context(list(snapshot.rules), snapshot.version)
+        self._pinned_rules = context
+        return context
     
-    def detect_fraud(self, transaction, transaction_history=None, threshold=0.5):
+    def detect_fraud(self, transaction, transaction_history=None, threshold=0.5, rules=None):
         """
         Detect fraud using both rule-based and AI approaches
         
@@ -37,22 +99,190 @@ class CombinedFraudDetector:
             transaction (dict): The transaction data
             transaction_history (list): Optional list of previous transactions
             threshold (float): The threshold for considering a transaction fraudulent
+            rules (RuleContext): Rules to use (default: the detector's current rules)
             
         Returns:
-            tuple: (is_fraudulent (bool), combined_score (float), rule_score (float), ai_score (float), reasons (dict))
+            tuple: (is_fraudulent (bool), combined_score (float), rule_score (float), ai_score (float), reasons (dict));
+                ai_score is None when the verdict was decided without the AI model
         """
-        # Get rule-based prediction
-        rule_is_fraud, rule_score, rule_reason = self.rule_detector.is_fraudulent(
+        # Get rule-based score; the combined score needs the exact rule score,
+        # so early exit only stops once the rule score has saturated
+        rule_evaluation = self.rule_detector.evaluate(
             transaction, 
             transaction_history, 
-            threshold
+            early_exit=self.early_exit,
+            context=rules
         )
+        rule_score = rule_evaluation.score
         
-        # Get AI prediction
-        ai_is_fraud, ai_score = self.ai_detector.predict(transaction)
-        
-        # Adjust weights based on transaction amount
         amount = transaction.get("amount", 0)
+        
+        # Get AI prediction, unless the rule score and amount floors already decide the verdict
+        decided = self.decided_verdict(amount, rule_score, threshold) if self.skip_decided_ai else None
+        if decided is None:
+            ai_is_fraud, ai_score = (self.ai_batcher or self.ai_detector).predict(transaction)
+            combined_score, adjusted_ai_weight = self.combine_scores(amount, rule_score, ai_score)
+        else:
+            # No AI score to report; the combined score uses the lowest one
+            # the model could have given, which yields the same verdict
+            ai_score = None
+            combined_score, adjusted_ai_weight = self.combine_scores(
+                amount, rule_score, self.ai_detector.score_bounds(amount)[0])
+            with self._stats_lock:
+                self.ai_skipped += 1
+            if self.audit_skipped_ai:
+                self._submit_audit(transaction, rule_score, threshold, decided)
+        
+        # Determine if transaction is fraudulent based on combined score
+        is_fraudulent = combined_score >= threshold
+        
+        # Prepare reasons; rule_reason is an Explanation that is only rendered
+        # to text when a caller asks for it (str(reasons["rule_reason"]))
+        reasons = {
+            "rule_reason": rule_evaluation.explanation,
+            "ai_weight": adjusted_ai_weight,
+            "rule_weight": 1 - adjusted_ai_weight,
+            "amount_threshold_applied": amount > 10000
+        }
+        if self.early_exit:
+            reasons["skipped_rules"] = [rule.name for rule in rule_evaluation.skipped_rules]
+        if decided is not None:
+            reasons["ai_skipped"] = True
+        
+        return is_fraudulent, combined_score, rule_score, ai_score, reasons
+    
+    def count_velocity(self, transactions, rules=None):
+        """
+        Record transactions in this detector's velocity counters and return their counts
+        
+        Used to score a batch in another process (see detect_fraud_batch)
+        while the counters stay in this one.
+        
+        Args:
+            transactions (list): Transaction dictionaries, in the order they are scored
+            rules (RuleContext): Rules whose velocity windows are counted (default: the detector's current rules)
+            
+        Returns:
+            list: Velocity counts for each transaction
+        """
+        return self.rule_detector.count_velocity(transactions, rules)
+    
+    def detect_fraud_batch(self, transactions, thresholds=0.5, rules=None, velocity_counts=None):
+        """
+        Detect fraud for a batch of transactions
+        
+        The rules are evaluated against one rule set for the whole batch, the
+        AI model scores every transaction that needs it in a single call, and
+        the scores are combined as arrays. Each transaction gets the same
+        result as detect_fraud() would give it, in batch order.
+        
+        Args:
+            transactions (list): Transaction dictionaries
+            thresholds: One threshold for all transactions, or one per transaction
+            rules (RuleContext): Rules to use (default: the detector's current rules)
+            velocity_counts (list): Counts from count_velocity() with the same rules, used
+                instead of this detector's velocity counters
+            
+        Returns:
+            list: (is_fraudulent, combined_score, rule_score, ai_score, reasons) for each transaction
+        """
+        n = len(transactions)
+        if n == 0:
+            return []
+        thresholds = np.broadcast_to(np.asarray(thresholds, dtype=np.float64), (n,))
+        evaluations = self.rule_detector.evaluate_batch(transactions, early_exit=self.early_exit, context=rules,
+                                                        velocity_counts=velocity_counts)
+        amounts = np.fromiter((t.get("amount", 0) for t in transactions), dtype=np.float64, count=n)
+        rule_scores = np.fromiter((evaluation.score for evaluation in evaluations), dtype=np.float64, count=n)
+        
+        # Only score the transactions whose verdict depends on the AI model
+        decided = [None] * n
+        if self.skip_decided_ai:
+            decided = [self.decided_verdict(amount, rule_score, threshold) for amount, rule_score, threshold
+                       in zip(amounts.tolist(), rule_scores.tolist(), thresholds.tolist())]
+        ai_scores = np.empty(n)
+        pending = [i for i in range(n) if decided[i] is None]
+        if pending:
+            predictions = self.ai_detector.predict_batch([transactions[i] for i in pending])
+            ai_scores[pending] = [ai_score for _, ai_score in predictions]
+        for i in range(n):
+            if decided[i] is not None:
+                # Only used for the combined score, as in detect_fraud
+                ai_scores[i] = self.ai_detector.score_bounds(transactions[i].get("amount", 0))[0]
+                if self.audit_skipped_ai:
+                    self._submit_audit(transactions[i], evaluations[i].score, float(thresholds[i]), decided[i])
+        if len(pending) < n:
+            with self._stats_lock:
+                self.ai_skipped += n - len(pending)
+        
+        combined_scores, ai_weights = self.combine_score_arrays(amounts, rule_scores, ai_scores)
+        is_fraudulent = combined_scores >= thresholds
+        
+        results = []
+        for i, evaluation in enumerate(evaluations):
+            reasons = {
+                "rule_reason": evaluation.explanation,
+                "ai_weight": float(ai_weights[i]),
+                "rule_weight": 1 - float(ai_weights[i]),
+                "amount_threshold_applied": bool(amounts[i] > 10000)
+            }
+            if self.early_exit:
+                reasons["skipped_rules"] = [rule.name for rule in evaluation.skipped_rules]
+            if decided[i] is not None:
+                reasons["ai_skipped"] = True
+            results.append((bool(is_fraudulent[i]), float(combined_scores[i]), evaluation.score,
+                            float(ai_scores[i]) if decided[i] is None else None, reasons))
+        return results
+    
+    def describe_reason(self, transaction, rule_score, ai_score, reasons, rules=None):
+        """
+        Render the source and reason of a fraud decision
+        
+        Args:
+            transaction (dict): Transaction data
+            rule_score (float): Rule-based score
+            ai_score (float): AI model score, or None if the model was skipped
+            reasons (dict): Reasons returned by detect_fraud
+            rules (RuleContext): Rules the decision was made with (default: the detector's current rules)
+            
+        Returns:
+            tuple: (fraud_source (str), fraud_reason (str))
+        """
+        # Without an AI score the rules and amount floors made the decision
+        fraud_source = "model" if ai_score is not None and ai_score > rule_score else "rule"
+        config = (rules or self.rule_detector.context).config
+        
+        # Generate fraud reason based on source
+        if fraud_source == "rule":
+            if reasons and isinstance(reasons, dict) and "rule_reason" in reasons:
+                fraud_reason = str(reasons["rule_reason"])
+            elif reasons and isinstance(reasons, list) and len(reasons) > 0:
+                fraud_reason = str(reasons[0])
+            elif transaction.get("amount", 0) > config["amount_threshold"]:
+                fraud_reason = "High transaction amount"
+            elif transaction.get("channel") in config["high_risk_channels"]:
+                fraud_reason = "High-risk channel"
+            elif transaction.get("payment_mode") in config["high_risk_payment_modes"]:
+                fraud_reason = "High-risk payment mode"
+            else:
+                fraud_reason = "Multiple risk factors"
+        else:
+            fraud_reason = "AI model detection"
+        
+        return fraud_source, fraud_reason
+    
+    def combine_scores(self, amount, rule_score, ai_score):
+        """
+        Combine the rule and AI scores and apply the amount floors
+        
+        Args:
+            amount (float): Transaction amount
+            rule_score (float): Rule-based score
+            ai_score (float): AI model score
+            
+        Returns:
+            tuple: (combined_score (float), ai_weight (float) used)
+        """
         adjusted_ai_weight = self.ai_weight
         
         # For large transactions, give more weight to rule-based detection
@@ -70,15 +300,81 @@ class CombinedFraudDetector:
         elif amount > 10000:
             combined_score = max(combined_score, 0.3)
         
-        # Determine if transaction is fraudulent based on combined score
-        is_fraudulent = combined_score >= threshold
+        return combined_score, adjusted_ai_weight
+    
+    def combine_score_arrays(self, amounts, rule_scores, ai_scores):
+        """
+        Array version of combine_scores, with the same arithmetic per element
         
-        # Prepare reasons
-        reasons = {
-            "rule_reason": rule_reason,
-            "ai_weight": adjusted_ai_weight,
-            "rule_weight": 1 - adjusted_ai_weight,
-            "amount_threshold_applied": amount > 10000
-        }
+        Args:
+            amounts (numpy.ndarray): Transaction amounts
+            rule_scores (numpy.ndarray): Rule-based scores
+            ai_scores (numpy.ndarray): AI model scores
+            
+        Returns:
+            tuple: (combined scores (numpy.ndarray), AI weights used (numpy.ndarray))
+        """
+        ai_weights = np.where(amounts > 25000, 0.4, self.ai_weight)
+        combined_scores = (ai_weights * ai_scores) + ((1 - ai_weights) * rule_scores)
+        floors = np.select([amounts > 50000, amounts > 25000, amounts > 10000], [0.7, 0.5, 0.3], -np.inf)
+        combined_scores = np.where(amounts > 10000, np.maximum(combined_scores, floors), combined_scores)
+        return combined_scores, ai_weights
+    
+    def decided_verdict(self, amount, rule_score, threshold):
+        """
+        Check whether the verdict is known without the AI score
         
-        return is_fraudulent, combined_score, rule_score, ai_score, reasons
+        The combined score never decreases as the AI score grows (and float
+        rounding keeps that true), so evaluating combine_scores at the lowest
+        and highest score the model can return for this amount bounds every
+        possible outcome exactly.
+        
+        Args:
+            amount (float): Transaction amount
+            rule_score (float): Rule-based score
+            threshold (float): The threshold for considering a transaction fraudulent
+            
+        Returns:
+            bool: The verdict if every possible AI score gives the same one, otherwise None
+        """
+        ai_low, ai_high = self.ai_detector.score_bounds(amount)
+        if self.combine_scores(amount, rule_score, ai_low)[0] >= threshold:
+            return True
+        if self.combine_scores(amount, rule_score, ai_high)[0] < threshold:
+            return False
+        return None
+    
+    def _submit_audit(self, transaction, rule_score, threshold, decided):
+        if self._audit_executor is None:
+            with self._stats_lock:
+                if self._audit_executor is None:
+                    self._audit_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ai-audit")
+        self._audit_executor.submit(self._audit, dict(transaction), rule_score, threshold, decided)
+    
+    def _audit(self, transaction, rule_score, threshold, decided):
+        """
+        Score a transaction whose AI call was skipped and check the verdict
+        """
+        try:
+            _, ai_score = self.ai_detector.predict(transaction)
+            combined_score, _ = self.combine_scores(transaction.get("amount", 0), rule_score, ai_score)
+            is_fraudulent = combined_score >= threshold
+            with self._stats_lock:
+                self.audited += 1
+                if is_fraudulent != decided:
+                    self.audit_mismatches += 1
+            if is_fraudulent != decided:
+                print(f"AI audit: verdict for {transaction.get('transaction_id')} would have been {is_fraudulent}")
+            if self.audit_callback is not None:
+                self.audit_callback(transaction, ai_score, combined_score, is_fraudulent)
+        except Exception as e:
+            print(f"Error auditing skipped AI call: {e}")
+    
+    def close(self):
+        """
+        Wait for pending audits and stop the background threads
+        """
+        if self._audit_executor is not None:
+            self._audit_executor.shutdown(wait=True)
+        if self.ai_batcher is not None:
+            self.ai_batcher.close()
@@ -0,0 +1,120 @@
+class ReasonTemplate:
+    """
+    A built-in check that can render its own reason text
+
+    The template is formatted with str.format(value) only when the reason is
+    rendered, never on the scoring path.
+    """
+
+    __slots__ = ("code", "template")
+
+    def __init__(self, code, template):
+        """
+        Args:
+            code (str): Stable identifier of the check
+            template (str): Format string taking the matched value as {0}
+        """
+        self.code = code
+        self.template = template
+
+    def render_reason(self, value):
+        if isinstance(value, tuple):
+            return self.template.format(*value)
+        return self.template.format(value)
+
+
+HIGH_RISK_CHANNEL = ReasonTemplate("high_risk_channel", "High-risk channel: {0}")
+HIGH_RISK_PAYMENT_MODE = ReasonTemplate("high_risk_payment_mode", "High-risk payment mode: {0}")
+PAYER_VELOCITY = ReasonTemplate("payer_velocity", "Velocity: {0} transactions from payer {1} in {2} minutes")
+
+
+class Explanation:
+    """
+    Lazily rendered explanation of a rule decision
+
+    Scoring only records cheap (source, matched value) references, where the
+    source is a compiled custom rule, an amount tier or a ReasonTemplate. The
+    text is built on the first call to render() / str() and then cached.
+    """
+
+    __slots__ = ("references", "_text")
+
+    def __init__(self, references=None):
+        """
+        Args:
+            references (list): (source, value) pairs in the order they triggered
+        """
+        self.references = references if references is not None else []
+        self._text = None
+
+    def add(self, source, value=None):
+        """
+        Record a triggered check
+
+        Args:
+            source: Object with a render_reason(value) method
+            value: The transaction value that triggered it
+        """
+        self.references.append((source, value))
+        self._text = None
+
+    def lines(self):
+        """
+        Render every reason separately
+
+        Returns:
+            list: Reason strings
+        """
+        return [source.render_reason(value) for source, value in self.references]
+
+    def render(self):
+        """
+        Render all reasons as one string
+
+        Returns:
+            str: Reasons joined with "; ", or "No rules triggered"
+        """
+        if self._text is None:
+            self._text = "; ".join(self.lines()) if self.references else "No rules triggered"
+        return self._text
+
+    def to_list(self):
+        """
+        Structured form of the references, without rendering any text
+
+        Returns:
+            list: Dicts with the rule id (custom rules) or check code, and the matched value
+        """
+        items = []
+        for source, value in self.references:
+            rule_id = getattr(source, "rule_id", None)
+            if rule_id is not None:
+                items.append({"rule_id": rule_id, "value": value})
+            else:
+                items.append({"check": getattr(source, "code", type(source).__name__), "value": value})
+        return items
+
+    def __str__(self):
+        return self.render()
+
+    def __len__(self):
+        return len(self.references)
+
+    def __bool__(self):
+        return bool(self.references)
+
+    def __iter__(self):
+        return iter(self.lines())
+
+    def __eq__(self, other):
+        if isinstance(other, Explanation):
+            return self.render() == other.render()
+        if isinstance(other, str):
+            return self.render() == other
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.render())
+
+    def __repr__(self):
+        return f"Explanation({len(self.references)} reasons)"
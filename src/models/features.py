@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+
+# One-hot encoded categorical columns, in feature order
+ONE_HOT_FEATURES = (
+    ("payment_mode", ("credit_card", "debit_card", "bank_transfer", "digital_wallet")),
+    ("channel", ("web", "mobile_app", "in_store", "phone")),
+)
+
+# Names of the 13 model features, in the order the model expects them
+FEATURE_NAMES = (
+    ["amount"]
+    + [f"{column}_{value}" for column, values in ONE_HOT_FEATURES for value in values]
+    + [
+        "amount_thousands",  # Normalized amount
+        "payer_id_length",  # Length of payer ID as a feature
+        "payee_id_length",  # Length of payee ID as a feature
+        "has_bank",  # Whether bank info is provided
+    ]
+)
+
+N_FEATURES = len(FEATURE_NAMES)
+
+
+def extract_feature_row(transaction):
+    """
+    Build the raw (unscaled) feature values of a single transaction
+
+    Plain Python, for the single-row scoring path; gives the same values as
+    a row of extract_feature_matrix().
+
+    Args:
+        transaction (dict): The transaction data
+
+    Returns:
+        list: The 13 feature values
+    """
+    amount = transaction["amount"]
+    row = [amount]
+    for column, values in ONE_HOT_FEATURES:
+        category = transaction[column]
+        row.extend(1 if category == value else 0 for value in values)
+    row.append(amount / 1000)
+    row.append(len(transaction.get("payer_id") or ""))
+    row.append(len(transaction.get("payee_id") or ""))
+    row.append(1 if transaction.get("bank") else 0)
+    return row
+
+
+def _columns(transactions):
+    """
+    Column arrays from a DataFrame or a list of transaction dicts
+    """
+    columns = {}
+    if isinstance(transactions, pd.DataFrame):
+        frame = transactions
+        columns["amount"] = frame["amount"].to_numpy(dtype=np.float64)
+        for column, _ in ONE_HOT_FEATURES:
+            columns[column] = frame[column].to_numpy(dtype=object)
+        for name in ("payer_id", "payee_id"):
+            if name in frame:
+                columns[name] = frame[name].fillna("").astype(str).str.len().to_numpy()
+            else:
+                columns[name] = np.zeros(len(frame))
+        columns["bank"] = (frame["bank"].fillna("").to_numpy(dtype=object) != "") if "bank" in frame \
+            else np.zeros(len(frame), dtype=bool)
+        return columns
+
+    n = len(transactions)
+    columns["amount"] = np.fromiter((t["amount"] for t in transactions), dtype=np.float64, count=n)
+    for column, _ in ONE_HOT_FEATURES:
+        columns[column] = np.array([t[column] for t in transactions], dtype=object)
+    for name in ("payer_id", "payee_id"):
+        columns[name] = np.fromiter((len(t.get(name) or "") for t in transactions), dtype=np.float64, count=n)
+    columns["bank"] = np.fromiter((bool(t.get("bank")) for t in transactions), dtype=bool, count=n)
+    return columns
+
+
+def extract_feature_matrix(transactions):
+    """
+    Build the raw (unscaled) feature matrix for many transactions with array operations
+
+    Args:
+        transactions: List of transaction dicts, or a DataFrame with the
+            columns of the fraud_detection table (extra columns are ignored)
+
+    Returns:
+        numpy.ndarray: float64 matrix of shape (n_transactions, 13)
+    """
+    columns = _columns(transactions)
+    amount = columns["amount"]
+    features = np.empty((len(amount), N_FEATURES), dtype=np.float64)
+    features[:, 0] = amount
+    index = 1
+    for column, values in ONE_HOT_FEATURES:
+        categories = columns[column]
+        for value in values:
+            features[:, index] = categories == value
+            index += 1
+    features[:, index] = amount / 1000
+    features[:, index + 1] = columns["payer_id"]
+    features[:, index + 2] = columns["payee_id"]
+    features[:, index + 3] = columns["bank"]
+    return features
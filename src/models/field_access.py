@@ -0,0 +1,108 @@
+import json
+import re
+from functools import lru_cache
+from json.decoder import scanstring
+
+# Returned by accessors when a field is not present
+MISSING = object()
+
+_decoder = json.JSONDecoder()
+_whitespace = re.compile(r"[ \t\n\r]*")
+
+
+def extract_json_member(text, key):
+    """
+    Read one top-level member of a JSON object without decoding the rest
+
+    The object is scanned member by member with the json module's C scanner,
+    stopping at the requested key, so rows whose additional_data is stored as
+    JSON text do not have to be fully parsed. If a key is repeated, the first
+    occurrence wins.
+
+    Args:
+        text (str): JSON text of an object
+        key (str): Member name
+
+    Returns:
+        The decoded member value, or MISSING if absent or the text is not a JSON object
+    """
+    try:
+        idx = _whitespace.match(text, 0).end()
+        if text[idx] != "{":
+            return MISSING
+        idx = _whitespace.match(text, idx + 1).end()
+        if text[idx] == "}":
+            return MISSING
+        while True:
+            if text[idx] != '"':
+                return MISSING
+            name, idx = scanstring(text, idx + 1)
+            idx = _whitespace.match(text, idx).end()
+            if text[idx] != ":":
+                return MISSING
+            idx = _whitespace.match(text, idx + 1).end()
+            value, idx = _decoder.raw_decode(text, idx)
+            if name == key:
+                return value
+            idx = _whitespace.match(text, idx).end()
+            if text[idx] != ",":
+                return MISSING
+            idx = _whitespace.match(text, idx + 1).end()
+    except (ValueError, IndexError):
+        return MISSING
+
+
+def _get(record, key):
+    # Transactions are usually dicts; DB rows (ORM objects) fall back to attributes
+    try:
+        return record.get(key, MISSING)
+    except AttributeError:
+        return getattr(record, key, MISSING)
+
+
+def _member(container, key):
+    if isinstance(container, dict):
+        return container.get(key, MISSING)
+    if isinstance(container, str):
+        return extract_json_member(container, key)
+    if container is None or container is MISSING:
+        return MISSING
+    return _get(container, key)
+
+
+@lru_cache(maxsize=None)
+def compile_accessor(path):
+    """
+    Build a function reading a (possibly dotted) field path from a transaction
+
+    "amount" reads a top-level key. "additional_data.device_id" reads the
+    device_id member of additional_data, which may be a dict (API requests)
+    or a JSON text blob (rows read back from the database). Accessors are
+    cached, so every rule on the same path shares one function.
+
+    Args:
+        path (str): Field name or dotted path
+
+    Returns:
+        callable: Function taking a transaction (dict or row object) and
+            returning the value or MISSING
+    """
+    if not isinstance(path, str) or "." not in path:
+        def get_field(record):
+            return _get(record, path)
+        return get_field
+
+    root, *rest = path.split(".")
+
+    def get_path(record):
+        # A literal top-level key containing dots takes precedence
+        value = _get(record, path)
+        if value is not MISSING:
+            return value
+        value = _get(record, root)
+        for key in rest:
+            value = _member(value, key)
+            if value is MISSING:
+                break
+        return value
+    return get_path
@@ -0,0 +1,144 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+# Largest number of transactions scored in one predict_proba call
+DEFAULT_MAX_BATCH_SIZE = int(os.getenv("AI_BATCH_MAX_SIZE", "64"))
+
+# How long the dispatcher waits for more requests after the first one arrives
+DEFAULT_MAX_WAIT_MS = float(os.getenv("AI_BATCH_MAX_WAIT_MS", "1.0"))
+
+
+class InferenceBatcher:
+    """
+    Coalesce concurrent AI predictions into vectorized predict_proba calls
+
+    Callers block in predict() while a single dispatcher thread collects the
+    requests that arrive within max_wait_ms of the first one (or until
+    max_batch_size rows are queued), scores them with one predict_batch()
+    call on the detector and hands every caller its own result. A caller
+    waits at most max_wait_ms plus the time to score one batch. Once the
+    batcher is closed, transactions are scored inline in the caller's thread.
+    """
+
+    def __init__(self, detector, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT_MS):
+        """
+        Initialize the batcher
+
+        Args:
+            detector (AIFraudDetector): Detector providing predict_batch()
+            max_batch_size (int): Maximum rows per batch
+            max_wait_ms (float): Maximum time to wait for a batch to fill up
+        """
+        self.detector = detector
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._closed = False
+        self.batches = 0
+        self.rows = 0
+
+    def submit(self, transaction):
+        """
+        Queue a transaction for scoring
+
+        After close() the transaction is scored right away instead, since no
+        dispatcher is left to pick it up.
+
+        Args:
+            transaction (dict): The transaction data
+
+        Returns:
+            Future: Resolves to (is_fraudulent (bool), fraud_probability (float))
+        """
+        future = Future()
+        # Checked and queued under the lock, so nothing is queued behind close()'s sentinel
+        with self._lock:
+            if not self._closed:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="inference-batcher", daemon=True)
+                    self._thread.start()
+                self._queue.put((transaction, future))
+                return future
+        try:
+            future.set_result(self.detector.predict(transaction))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def predict(self, transaction):
+        """
+        Score a transaction as part of the next batch
+
+        Drop-in replacement for AIFraudDetector.predict.
+
+        Args:
+            transaction (dict): The transaction data
+
+        Returns:
+            tuple: (is_fraudulent (bool), fraud_probability (float))
+        """
+        return self.submit(transaction).result()
+
+    def close(self):
+        """
+        Stop the dispatcher after the queued requests are scored
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+            if thread is not None:
+                self._queue.put(None)
+        if thread is not None:
+            thread.join()
+
+    def _collect(self):
+        """
+        Block for the first request, then gather more until the batch is full or the window ends
+        """
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            try:
+                # Take whatever is already queued without waiting
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if item is None:
+                # Shut down after scoring what was already collected
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            transactions = [transaction for transaction, _ in batch]
+            try:
+                results = self.detector.predict_batch(transactions)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.rows += len(batch)
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
@@ -1,36 +1,173 @@
+import copy
+from types import MappingProxyType
+
+import numpy as np
+
+from .rule_compiler import CompiledRule, CompiledRuleSet
+from .rule_index import AmountTier, TieredThresholds
+from .velocity import VelocityTracker
+from .field_access import MISSING
+from .explanation import Explanation, HIGH_RISK_CHANNEL, HIGH_RISK_PAYMENT_MODE, PAYER_VELOCITY
+
+# Safety margin used when deciding that the remaining rules cannot change a result
+_DECISION_MARGIN = 1e-9
+
+# Velocity counts not taken yet; _evaluate_rest then counts the transaction itself
+_NOT_COUNTED = object()
+
+class RuleEvaluation:
+    """
+    The outcome of evaluating the rules against one transaction
+    """
+    
+    __slots__ = ("score", "explanation", "skipped_rules")
+    
+    def __init__(self, score, explanation, skipped_rules=()):
+        """
+        Args:
+            score (float): Risk score between 0 and 1
+            explanation (Explanation): References to the triggered checks and rules
+            skipped_rules (tuple): Custom rules not evaluated in early-exit mode
+        """
+        self.score = score
+        self.explanation = explanation
+        self.skipped_rules = skipped_rules
+    
+    @property
+    def reason(self):
+        """
+        All reasons rendered into a single string
+        """
+        return self.explanation.render()
+
+def default_config():
+    """
+    Get the default configuration for the built-in rules
+    """
+    return {
+        "amount_threshold": 50000.0,  # Transactions above this amount are suspicious
+        "high_risk_channels": ["web", "mobile_app"],  # Channels with higher fraud risk
+        "high_risk_payment_modes": ["credit_card", "digital_wallet"],  # Payment modes with higher fraud risk
+        "suspicious_time_window": {  # Time window for suspicious activity (24-hour format)
+            "start": "00:00",
+            "end": "05:00"
+        },
+        "velocity_check": {  # Check for multiple transactions in a short time
+            "max_transactions": 5,
+            "time_window_minutes": 10,
+            "score": 0.2
+        }
+    }
+
+def build_amount_tiers(config):
+    """
+    Build the breakpoint table for the built-in amount scoring tiers
+    
+    Args:
+        config (dict): Rule configuration
+        
+    Returns:
+        TieredThresholds: Tiers in the order they take precedence
+    """
+    threshold = config["amount_threshold"]
+    return TieredThresholds([
+        # Higher score for exceeding the threshold
+        AmountTier(threshold, 0.5, f"Amount ({{amount}}) exceeds threshold ({threshold})"),
+        # Medium score for amounts above half the threshold
+        AmountTier(threshold / 2, 0.3, f"Amount ({{amount}}) exceeds half threshold ({threshold/2})"),
+        # Small score for amounts above 10,000
+        AmountTier(10000, 0.2, "Amount ({amount}) exceeds 10,000"),
+    ])
+
+class RuleContext:
+    """
+    Everything rule evaluation reads, compiled once and never modified
+    
+    A detector swaps in a new context when its rules or configuration
+    change, and a caller can pin one context for a whole request. Scoring
+    against a context never writes to it, so any number of threads can
+    share it without locking.
+    """
+    
+    __slots__ = ("version", "config", "custom_rules", "rule_set", "amount_tiers", "velocity_config",
+                 "payer_window", "velocity_windows")
+    
+    def __init__(self, config, custom_rules=(), version=None):
+        """
+        Args:
+            config (dict): Rule configuration (copied into a read-only mapping)
+            custom_rules (iterable): Custom rules (ORM rows or mappings)
+            version (int): Version of the rule snapshot the rules came from, if any
+        """
+        config = copy.deepcopy(dict(config))
+        custom_rules = tuple(custom_rules)
+        rule_set = CompiledRuleSet(custom_rules)
+        velocity_config = config.get("velocity_check")
+        windows = set(rule_set.velocity_windows)
+        payer_window = None
+        if velocity_config:
+            payer_window = ("payer_id", velocity_config["time_window_minutes"] * 60.0)
+            windows.add(payer_window)
+        for name, value in (("version", version), ("config", MappingProxyType(config)), ("custom_rules", custom_rules),
+                            ("rule_set", rule_set), ("amount_tiers", build_amount_tiers(config)),
+                            ("velocity_config", velocity_config), ("payer_window", payer_window),
+                            ("velocity_windows", frozenset(windows))):
+            object.__setattr__(self, name, value)
+    
+    def __setattr__(self, name, value):
+        raise AttributeError("RuleContext is immutable")
+
 class RuleBasedFraudDetector:
     """
     A rule-based fraud detection model that applies configurable rules to transactions
     """
     
-    def __init__(self, config=None, custom_rules=None):
+    def __init__(self, config=None, custom_rules=None, velocity=True):
         """
         Initialize the rule-based detector with configuration
         
         Args:
             config (dict): Configuration for the rules
             custom_rules (list): List of custom rules from the database
+            velocity (bool): Count recent transactions for the velocity checks; when
+                off, the payer velocity check and velocity rules never trigger
+        """
+        self.velocity = VelocityTracker() if velocity else None
+        self.context = RuleContext(config or self.get_default_config(), custom_rules or [])
+    
+    @property
+    def config(self):
+        """
+        Read-only configuration of the current rule context (see update_config)
+        """
+        return self.context.config
+    
+    @property
+    def custom_rules(self):
+        """
+        Custom rules of the current rule context
+        """
+        return self.context.custom_rules
+    
+    @property
+    def rule_set(self):
+        """
+        Compiled custom rules of the current rule context
         """
-        self.config = config or self.get_default_config()
-        self.custom_rules = custom_rules or []
+        return self.context.rule_set
+    
+    @property
+    def amount_tiers(self):
+        """
+        Amount tiers of the current rule context
+        """
+        return self.context.amount_tiers
     
     def get_default_config(self):
         """
         Get the default configuration for the rules
         """
-        return {
-            "amount_threshold": 50000.0,  # Transactions above this amount are suspicious
-            "high_risk_channels": ["web", "mobile_app"],  # Channels with higher fraud risk
-            "high_risk_payment_modes": ["credit_card", "digital_wallet"],  # Payment modes with higher fraud risk
-            "suspicious_time_window": {  # Time window for suspicious activity (24-hour format)
-                "start": "00:00",
-                "end": "05:00"
-            },
-            "velocity_check": {  # Check for multiple transactions in a short time
-                "max_transactions": 5,
-                "time_window_minutes": 10
-            }
-        }
+        return default_config()
     
     def update_config(self, new_config):
         """
@@ -39,16 +176,47 @@ class RuleBasedFraudDetector:
         Args:
             new_config (dict): New configuration values
         """
-        self.config.update(new_config)
+        config = dict(self.context.config)
+        config.update(new_config)
+        self.context = RuleContext(config, self.context.custom_rules, self.context.version)
+    
+    def build_amount_tiers(self):
+        """
+        Build the breakpoint table for the built-in amount scoring tiers
+        
+        Returns:
+            TieredThresholds: Tiers in the order they take precedence
+        """
+        return build_amount_tiers(self.config)
+    
+    def build_context(self, custom_rules, version=None):
+        """
+        Compile custom rules into a context with this detector's configuration
+        
+        The detector itself is left unchanged; pass the context to evaluate().
+        
+        Args:
+            custom_rules (list): List of custom rules
+            version (int): Version of the rule snapshot the rules came from, if any
+            
+        Returns:
+            RuleContext: The compiled rules
+        """
+        return RuleContext(self.context.config, custom_rules, version)
     
-    def set_custom_rules(self, custom_rules):
+    def set_custom_rules(self, custom_rules, version=None):
         """
         Set the custom rules from the database
         
+        The rules are compiled once here so that scoring does not have to
+        re-interpret them for every transaction. Evaluations already running
+        keep the context they started with.
+        
         Args:
             custom_rules (list): List of custom rules
+            version (int): Version of the rule snapshot the rules came from, if any
         """
-        self.custom_rules = custom_rules
+        self.context = self.build_context(custom_rules, version)
     
     def check_amount_threshold(self, transaction):
         """
@@ -79,137 +247,180 @@ class RuleBasedFraudDetector:
         Returns:
             tuple: (matches (bool), score (float), reason (str))
         """
-        # Handle both attribute-style access and dictionary-style access for rules
-        field = rule.field if hasattr(rule, 'field') else rule.get('field')
-        operator = rule.operator if hasattr(rule, 'operator') else rule.get('operator')
-        value = rule.value if hasattr(rule, 'value') else rule.get('value')
-        score = rule.score if hasattr(rule, 'score') else rule.get('score', 0.5)
-        
-        # If field doesn't exist in transaction, return False
-        if field not in transaction and field != "custom":
-            return False, 0.0, ""
-        
-        # For custom field type, use advanced_config
-        advanced_config = rule.advanced_config if hasattr(rule, 'advanced_config') else rule.get('advanced_config')
-        if field == "custom" and advanced_config:
-            # Implement custom logic based on advanced_config
-            return False, 0.0, ""
-        
-        # Extract transaction value
-        transaction_value = transaction.get(field)
-        
-        # Apply operator comparison
-        matches = False
-        reason = ""
-        
-        # Convert string value to appropriate type if needed
-        if operator in [">", "<", ">=", "<="]:
-            try:
-                value = float(value)
-                transaction_value = float(transaction_value) if transaction_value is not None else 0
-            except (ValueError, TypeError):
-                return False, 0.0, ""
-                
-        if operator == "==":
-            matches = str(transaction_value) == str(value)
-            reason = f"{field} equals {value}"
-        elif operator == "!=":
-            matches = str(transaction_value) != str(value)
-            reason = f"{field} not equals {value}"
-        elif operator == ">":
-            matches = transaction_value > value
-            reason = f"{field} greater than {value}"
-        elif operator == "<":
-            matches = transaction_value < value
-            reason = f"{field} less than {value}"
-        elif operator == ">=":
-            matches = transaction_value >= value
-            reason = f"{field} greater than or equal to {value}"
-        elif operator == "<=":
-            matches = transaction_value <= value
-            reason = f"{field} less than or equal to {value}"
-        elif operator == "in":
-            if isinstance(value, str):
-                try:
-                    value_list = value.split(",")
-                    matches = str(transaction_value) in [v.strip() for v in value_list]
-                    reason = f"{field} in list {value}"
-                except:
-                    matches = False
-            else:
-                matches = False
-        elif operator == "not_in":
-            if isinstance(value, str):
-                try:
-                    value_list = value.split(",")
-                    matches = str(transaction_value) not in [v.strip() for v in value_list]
-                    reason = f"{field} not in list {value}"
-                except:
-                    matches = False
-            else:
-                matches = False
-        elif operator == "contains":
-            matches = isinstance(transaction_value, str) and isinstance(value, str) and value in transaction_value
-            reason = f"{field} contains {value}"
-        elif operator == "not_contains":
-            matches = isinstance(transaction_value, str) and isinstance(value, str) and value not in transaction_value
-            reason = f"{field} does not contain {value}"
-        elif operator == "starts_with":
-            matches = isinstance(transaction_value, str) and isinstance(value, str) and transaction_value.startswith(value)
-            reason = f"{field} starts with {value}"
-        elif operator == "ends_with":
-            matches = isinstance(transaction_value, str) and isinstance(value, str) and transaction_value.endswith(value)
-            reason = f"{field} ends with {value}"
-        
-        return matches, score if matches else 0.0, reason if matches else ""
-    
-    def calculate_risk_score(self, transaction, transaction_history=None):
+        compiled = CompiledRule(rule)
+        matches = compiled.matches(transaction)
+        return matches, compiled.score if matches else 0.0, compiled.reason if matches else ""
+    
+    def calculate_risk_score(self, transaction, transaction_history=None, early_exit=False, threshold=None):
         """
         Calculate a risk score for the transaction based on rules
         
         Args:
             transaction (dict): The transaction data
             transaction_history (list): Optional list of previous transactions
+            early_exit (bool): Stop evaluating custom rules once the result is decided (see evaluate)
+            threshold (float): Decision threshold used by early_exit
             
         Returns:
             tuple: (score (float), reason (str))
         """
+        evaluation = self.evaluate(transaction, transaction_history, early_exit=early_exit, threshold=threshold)
+        return evaluation.score, evaluation.reason
+    
+    def evaluate(self, transaction, transaction_history=None, early_exit=False, threshold=None, context=None):
+        """
+        Evaluate all rules against a transaction
+        
+        In early-exit mode the custom rules are checked one by one in priority
+        order, and evaluation stops as soon as the remaining rules can no longer
+        change the result: the score has saturated at 1.0, or (when a threshold
+        is given) the remaining rules' best and worst case contributions fall on
+        the same side of the threshold. The decision is then exact, but the
+        returned score is only the score accumulated so far unless it saturated.
+        
+        Args:
+            transaction (dict): The transaction data
+            transaction_history (list): Optional list of previous transactions
+            early_exit (bool): Whether to stop once the result is decided
+            threshold (float): The threshold passed to is_fraudulent, if any
+            context (RuleContext): Rules to evaluate (default: the detector's current rules)
+            
+        Returns:
+            RuleEvaluation: Score, explanation and the custom rules that were skipped
+        """
+        context = context or self.context
         score = 0.0
-        reasons = []
+        explanation = Explanation()
         
         # Check amount threshold - add progressive scoring for large amounts
         amount = transaction["amount"]
-        if amount > self.config["amount_threshold"]:
-            score += 0.5  # Higher score for exceeding the threshold
-            reasons.append(f"Amount ({amount}) exceeds threshold ({self.config['amount_threshold']})")
-        elif amount > self.config["amount_threshold"] / 2:
-            score += 0.3  # Medium score for amounts above half the threshold
-            reasons.append(f"Amount ({amount}) exceeds half threshold ({self.config['amount_threshold']/2})")
-        elif amount > 10000:
-            score += 0.2  # Small score for amounts above 10,000
-            reasons.append(f"Amount ({amount}) exceeds 10,000")
+        tier = context.amount_tiers.lookup(amount)
+        if tier is not None:
+            score += tier.score
+            explanation.add(tier, amount)
         
         # Check high-risk channel
-        if self.check_high_risk_channel(transaction):
+        if transaction["channel"] in context.config["high_risk_channels"]:
             score += 0.2
-            reasons.append(f"High-risk channel: {transaction['channel']}")
+            explanation.add(HIGH_RISK_CHANNEL, transaction["channel"])
         
         # Check high-risk payment mode
-        if self.check_high_risk_payment_mode(transaction):
+        if transaction["payment_mode"] in context.config["high_risk_payment_modes"]:
             score += 0.2
-            reasons.append(f"High-risk payment mode: {transaction['payment_mode']}")
+            explanation.add(HIGH_RISK_PAYMENT_MODE, transaction["payment_mode"])
         
-        # Apply custom rules
+        return self._evaluate_rest(context, transaction, score, explanation, transaction_history,
+                                   early_exit, threshold)
+    
+    def count_velocity(self, transactions, context=None):
+        """
+        Record transactions in the velocity counters and return their counts
+        
+        Lets one process keep the counters while the rest of the evaluation
+        runs elsewhere: pass the result to evaluate_batch as velocity_counts.
+        
+        Args:
+            transactions (list): Transaction dictionaries, in the order they are scored
+            context (RuleContext): Rules whose velocity windows are counted (default: the
+                detector's current rules)
+            
+        Returns:
+            list: Counts by (field, window) for each transaction, or None where nothing is counted
+        """
+        windows = (context or self.context).velocity_windows
+        if not windows or self.velocity is None:
+            return [None] * len(transactions)
+        return [self.velocity.observe(transaction, windows) for transaction in transactions]
+    
+    def evaluate_batch(self, transactions, early_exit=False, context=None, velocity_counts=None):
+        """
+        Evaluate all rules against a batch of transactions
+        
+        The amount, channel and payment mode checks are computed as arrays
+        over the whole batch. Velocity counting and the custom rules then run
+        per transaction, in batch order, against one rule context, so a
+        concurrent rule update never splits a batch. Each transaction gets the
+        same result as evaluate() would give it.
+        
+        Args:
+            transactions (list): Transaction dictionaries
+            early_exit (bool): Whether to stop once the rule score saturates (see evaluate)
+            context (RuleContext): Rules to evaluate (default: the detector's current rules)
+            velocity_counts (list): Counts taken by count_velocity() with the same rules, used
+                instead of this detector's velocity counters
+            
+        Returns:
+            list: RuleEvaluation for each transaction
+        """
+        context = context or self.context
+        if velocity_counts is None:
+            velocity_counts = [_NOT_COUNTED] * len(transactions)
+        n = len(transactions)
+        amounts = np.fromiter((t["amount"] for t in transactions), dtype=np.float64, count=n)
+        tiers = context.amount_tiers.lookup_many(amounts)
+        high_risk_channel = np.isin(np.array([t["channel"] for t in transactions], dtype=object),
+                                    list(context.config["high_risk_channels"]))
+        high_risk_payment_mode = np.isin(np.array([t["payment_mode"] for t in transactions], dtype=object),
+                                         list(context.config["high_risk_payment_modes"]))
+        
+        # Same additions, in the same order, as evaluate() makes per transaction
+        scores = np.array([0.0 if tier is None else tier.score for tier in tiers])
+        scores += np.where(high_risk_channel, 0.2, 0.0)
+        scores += np.where(high_risk_payment_mode, 0.2, 0.0)
+        
+        evaluations = []
+        for i, transaction in enumerate(transactions):
+            explanation = Explanation()
+            if tiers[i] is not None:
+                explanation.add(tiers[i], transaction["amount"])
+            if high_risk_channel[i]:
+                explanation.add(HIGH_RISK_CHANNEL, transaction["channel"])
+            if high_risk_payment_mode[i]:
+                explanation.add(HIGH_RISK_PAYMENT_MODE, transaction["payment_mode"])
+            evaluations.append(self._evaluate_rest(context, transaction, float(scores[i]), explanation,
+                                                   early_exit=early_exit, velocity_counts=velocity_counts[i]))
+        return evaluations
+    
+    def _evaluate_rest(self, context, transaction, score, explanation, transaction_history=None,
+                       early_exit=False, threshold=None, velocity_counts=_NOT_COUNTED):
+        """
+        Add the velocity checks and custom rules to the built-in checks' score
+        """
+        # Count recent transactions per payer (and per velocity rule field)
+        rule_set = context.rule_set
+        velocity_config = context.velocity_config
+        payer_window = context.payer_window
+        windows = context.velocity_windows
+        if velocity_counts is _NOT_COUNTED:
+            velocity_counts = None
+            if windows and self.velocity is not None:
+                velocity_counts = self.velocity.observe(transaction, windows, transaction_history)
+        
+        # Check payer velocity
+        if velocity_config and velocity_counts is not None:
+            count = velocity_counts.get(payer_window, 0)
+            if count > velocity_config["max_transactions"]:
+                score += velocity_config.get("score", 0.2)
+                explanation.add(PAYER_VELOCITY, (count, transaction["payer_id"],
+                                                 velocity_config["time_window_minutes"]))
+        
+        # Apply custom rules (compiled in priority order by set_custom_rules)
         custom_score = 0.0
-        for rule in sorted(self.custom_rules, key=lambda x: x.priority if hasattr(x, 'priority') else x.get('priority', 1), reverse=True):
-            # Check if rule is active
-            is_active = rule.is_active if hasattr(rule, 'is_active') else rule.get('is_active', True)
-            if is_active:
-                matches, rule_score, reason = self.apply_custom_rule(rule, transaction)
-                if matches:
-                    custom_score += rule_score
-                    rule_name = rule.name if hasattr(rule, 'name') else rule.get('name', 'Unnamed rule')
-                    reasons.append(f"Custom rule '{rule_name}': {reason}")
+        skipped = ()
+        if early_exit:
+            memo = rule_set.condition_graph.new_memo() if rule_set.combination_rules else None
+            for position, rule in enumerate(rule_set.rules):
+                if self._is_decided(score + custom_score, rule_set.remaining_min[position],
+                                    rule_set.remaining_max[position], threshold):
+                    skipped = rule_set.rules[position:]
+                    break
+                if rule_set.rule_matches(rule, transaction, velocity_counts, memo):
+                    custom_score += rule.score
+                    explanation.add(rule, self._matched_value(rule, transaction))
+        else:
+            for rule in rule_set.match(transaction, velocity_counts):
+                custom_score += rule.score
+                explanation.add(rule, self._matched_value(rule, transaction))
         
         # Add custom rules score
         score += custom_score
@@ -217,9 +428,36 @@ class RuleBasedFraudDetector:
         # Normalize score to be between 0 and 1
         score = min(score, 1.0)
         
-        return score, "; ".join(reasons) if reasons else "No rules triggered"
+        return RuleEvaluation(score, explanation, skipped)
+    
+    @staticmethod
+    def _matched_value(rule, transaction):
+        """
+        Transaction value a custom rule matched on, for explanations
+        """
+        value = rule.get_value(transaction)
+        return None if value is MISSING else value
+    
+    @staticmethod
+    def _is_decided(score, remaining_min, remaining_max, threshold):
+        """
+        Check whether the rules still to be evaluated can change the result
+        """
+        # The final score is clamped at 1.0. With no negative rules left the
+        # score can only grow, so reaching 1.0 settles it without a margin
+        if remaining_min == 0.0:
+            if score >= 1.0:
+                return True
+        elif score + remaining_min - _DECISION_MARGIN >= 1.0:
+            return True
+        if threshold is None:
+            return False
+        # Small margin so that float rounding never flips a decision
+        lowest = min(score + remaining_min - _DECISION_MARGIN, 1.0)
+        highest = min(score + remaining_max + _DECISION_MARGIN, 1.0)
+        return lowest >= threshold or highest < threshold
     
-    def is_fraudulent(self, transaction, transaction_history=None, threshold=0.5):
+    def is_fraudulent(self, transaction, transaction_history=None, threshold=0.5, early_exit=False):
         """
         Determine if a transaction is fraudulent based on the risk score
         
@@ -227,9 +465,11 @@ class RuleBasedFraudDetector:
             transaction (dict): The transaction data
             transaction_history (list): Optional list of previous transactions
             threshold (float): The threshold for considering a transaction fraudulent
+            early_exit (bool): Stop evaluating custom rules once the decision is known
             
         Returns:
             tuple: (is_fraudulent (bool), risk_score (float), reason (str))
         """
-        risk_score, reason = self.calculate_risk_score(transaction, transaction_history)
+        risk_score, reason = self.calculate_risk_score(transaction, transaction_history,
+                                                       early_exit=early_exit, threshold=threshold)
         return risk_score >= threshold, risk_score, reason
@@ -0,0 +1,366 @@
+import operator as op
+from collections.abc import Mapping
+
+from .field_access import MISSING, compile_accessor
+from .rule_dag import ConditionGraph
+from .rule_index import FieldHashIndex, NumericRangeIndex, StringPatternIndex, by_position
+
+# Operators that compare numerically against a float constant
+NUMERIC_OPERATORS = {
+    ">": (op.gt, "greater than"),
+    "<": (op.lt, "less than"),
+    ">=": (op.ge, "greater than or equal to"),
+    "<=": (op.le, "less than or equal to"),
+}
+
+# Operators that compare a string field against a string pattern
+STRING_OPERATORS = {
+    "contains": "contains",
+    "not_contains": "does not contain",
+    "starts_with": "starts with",
+    "ends_with": "ends with",
+}
+
+# Window used by velocity rules that do not set time_window_minutes
+DEFAULT_VELOCITY_WINDOW_MINUTES = 10
+
+
+def rule_attr(rule, key, default=None):
+    """
+    Read a field from a rule given either as an ORM row or as a mapping
+    """
+    if isinstance(rule, Mapping):
+        return rule.get(key, default)
+    return getattr(rule, key, default)
+
+
+def _never(transaction_value):
+    return False
+
+
+def _compile_test(operator, value):
+    """
+    Build the value test for a single operator
+
+    Args:
+        operator (str): Rule operator
+        value: Rule value as stored on the rule
+
+    Returns:
+        tuple: (test (callable), constant, reason_text (str or None))
+    """
+    if operator == "==":
+        expected = str(value)
+        return (lambda tv: str(tv) == expected), expected, f"equals {value}"
+
+    if operator == "!=":
+        expected = str(value)
+        return (lambda tv: str(tv) != expected), expected, f"not equals {value}"
+
+    if operator in NUMERIC_OPERATORS:
+        compare, label = NUMERIC_OPERATORS[operator]
+        try:
+            constant = float(value)
+        except (ValueError, TypeError):
+            return _never, None, None
+
+        def numeric_test(tv):
+            if tv is None:
+                tv = 0
+            try:
+                return compare(float(tv), constant)
+            except (ValueError, TypeError):
+                return False
+        return numeric_test, constant, f"{label} {constant}"
+
+    if operator in ("in", "not_in"):
+        if not isinstance(value, str):
+            return _never, None, None
+        members = frozenset(v.strip() for v in value.split(","))
+        if operator == "in":
+            return (lambda tv: str(tv) in members), members, f"in list {value}"
+        return (lambda tv: str(tv) not in members), members, f"not in list {value}"
+
+    if operator in STRING_OPERATORS:
+        if not isinstance(value, str):
+            return _never, None, None
+        if operator == "contains":
+            test = lambda tv: isinstance(tv, str) and value in tv
+        elif operator == "not_contains":
+            test = lambda tv: isinstance(tv, str) and value not in tv
+        elif operator == "starts_with":
+            test = lambda tv: isinstance(tv, str) and tv.startswith(value)
+        else:
+            test = lambda tv: isinstance(tv, str) and tv.endswith(value)
+        return test, value, f"{STRING_OPERATORS[operator]} {value}"
+
+    # Unknown operators never match
+    return _never, None, None
+
+
+class CompiledRule:
+    """
+    A custom rule turned into a pre-typed predicate
+
+    All parsing (numeric constants, comma separated lists, attribute lookups)
+    happens once in the constructor; matches() only runs the comparison.
+    """
+
+    __slots__ = ("rule_id", "name", "rule_type", "priority", "score", "field", "operator", "value",
+                 "constant", "test", "get_value", "position", "window_seconds", "condition", "_graph", "_root",
+                 "_reason_text", "_reason")
+
+    def __init__(self, rule, position=0):
+        """
+        Compile a custom rule
+
+        Args:
+            rule: models.CustomRule instance or rule dictionary
+            position (int): Position of the rule in priority order
+        """
+        self.rule_id = rule_attr(rule, "id")
+        self.name = rule_attr(rule, "name", "Unnamed rule")
+        self.rule_type = rule_attr(rule, "rule_type")
+        priority = rule_attr(rule, "priority", 1)
+        self.priority = 1 if priority is None else priority
+        self.score = rule_attr(rule, "score", 0.5)
+        self.field = rule_attr(rule, "field")
+        # Dotted paths such as additional_data.device_id resolve through a precompiled accessor
+        self.get_value = compile_accessor(self.field)
+        self.operator = rule_attr(rule, "operator")
+        self.value = rule_attr(rule, "value")
+        self.position = position
+        self.window_seconds = None
+        self.condition = None
+        self._graph = None
+        self._root = None
+        self._reason = None
+
+        advanced_config = rule_attr(rule, "advanced_config")
+        condition = advanced_config.get("condition") if isinstance(advanced_config, Mapping) else None
+        if condition is not None and (self.rule_type == "combination" or self.field == "custom"):
+            # Boolean condition tree, evaluated through a ConditionGraph
+            self.condition = condition
+            self.test, self.constant, self._reason_text = _never, None, None
+        elif self.field == "custom" and advanced_config:
+            # Other custom logic from advanced_config is not supported
+            self.test, self.constant, self._reason_text = _never, None, None
+        else:
+            self.test, self.constant, self._reason_text = _compile_test(self.operator, self.value)
+
+        if self.rule_type == "velocity":
+            # The operator compares the number of recent transactions sharing
+            # this rule's field value (e.g. payer_id) against the rule value
+            advanced_config = rule_attr(rule, "advanced_config") or {}
+            try:
+                minutes = float(advanced_config.get("time_window_minutes", DEFAULT_VELOCITY_WINDOW_MINUTES))
+            except (ValueError, TypeError):
+                minutes = DEFAULT_VELOCITY_WINDOW_MINUTES
+            self.window_seconds = minutes * 60
+
+    def bind_condition(self, graph):
+        """
+        Compile the rule's condition tree into a (possibly shared) graph
+
+        Args:
+            graph (ConditionGraph): Graph the condition is added to
+
+        Raises:
+            ValueError: If the condition is malformed
+        """
+        self._root = graph.add(self.condition)
+        self._graph = graph
+
+    def matches(self, transaction):
+        """
+        Check whether the rule matches a transaction
+
+        Args:
+            transaction (dict): Transaction data
+
+        Returns:
+            bool: True if the rule matches
+        """
+        if self.condition is not None:
+            if self._graph is None:
+                try:
+                    self.bind_condition(ConditionGraph())
+                except ValueError:
+                    return False
+            return self._graph.evaluate(self._root, transaction, self._graph.new_memo())
+        transaction_value = self.get_value(transaction)
+        if transaction_value is MISSING:
+            if self.field != "custom":
+                return False
+            transaction_value = None
+        return self.test(transaction_value)
+
+    @property
+    def reason(self):
+        """
+        Human readable description of the condition, formatted on first use
+        """
+        if self._reason is None:
+            if self._graph is not None:
+                self._reason = self._graph.describe(self._root)
+            elif not self._reason_text:
+                self._reason = ""
+            elif self.window_seconds is not None:
+                self._reason = (f"transactions per {self.field} in {self.window_seconds / 60:g} minutes "
+                                f"{self._reason_text}")
+            else:
+                self._reason = f"{self.field} {self._reason_text}"
+        return self._reason
+
+    def describe(self):
+        """
+        Reason line used in risk score explanations
+        """
+        return f"Custom rule '{self.name}': {self.reason}"
+
+    def render_reason(self, value):
+        """
+        Render this rule's reason for an Explanation
+        """
+        return self.describe()
+
+
+def compile_rules(custom_rules):
+    """
+    Compile the active custom rules in priority order (highest first)
+
+    Args:
+        custom_rules (list): models.CustomRule instances or rule dictionaries
+
+    Returns:
+        tuple: CompiledRule instances
+    """
+    active = [r for r in custom_rules if rule_attr(r, "is_active", True)]
+    ordered = sorted(active, key=lambda r: rule_attr(r, "priority", 1) or 1, reverse=True)
+    return tuple(CompiledRule(rule, position) for position, rule in enumerate(ordered))
+
+
+class CompiledRuleSet:
+    """
+    The compiled form of a list of custom rules
+
+    Equality and membership rules on the common transaction fields are kept
+    in a hash index, numeric threshold rules in sorted breakpoint arrays and
+    substring / prefix / suffix rules in per-field automata, so a transaction
+    only touches the rules that could match it. Everything else is scanned in
+    priority order. Velocity rules are matched against the window counts
+    passed in by the caller, and combination rules share one ConditionGraph.
+    """
+
+    def __init__(self, custom_rules=None):
+        """
+        Compile and index a list of custom rules
+
+        Args:
+            custom_rules (list): models.CustomRule instances or rule dictionaries
+        """
+        self.rules = compile_rules(custom_rules or [])
+        self.hash_index = FieldHashIndex()
+        numeric_rules = []
+        string_rules = []
+        scan_rules = []
+        velocity_rules = []
+        combination_rules = []
+        self.condition_graph = ConditionGraph()
+        for rule in self.rules:
+            if rule.condition is not None:
+                try:
+                    rule.bind_condition(self.condition_graph)
+                except ValueError as e:
+                    print(f"Error compiling condition of rule '{rule.name}': {e}")
+                    continue
+                combination_rules.append(rule)
+                continue
+            if rule.window_seconds is not None:
+                velocity_rules.append(rule)
+                continue
+            if self.hash_index.add(rule):
+                continue
+            if rule.operator in NUMERIC_OPERATORS and rule.field != "custom":
+                # Rules whose constant is not a number can never match
+                if rule.constant is not None and rule.constant == rule.constant:
+                    numeric_rules.append(rule)
+                continue
+            if rule.operator in STRING_OPERATORS and rule.field != "custom":
+                # Non-string patterns can never match
+                if isinstance(rule.constant, str):
+                    string_rules.append(rule)
+                continue
+            scan_rules.append(rule)
+        self.range_index = NumericRangeIndex(numeric_rules)
+        self.string_index = StringPatternIndex(string_rules)
+        self.scan_rules = tuple(scan_rules)
+        self.velocity_rules = tuple(velocity_rules)
+        self.combination_rules = tuple(combination_rules)
+
+        # remaining_max[i] / remaining_min[i] bound what rules[i:] can still add
+        self.remaining_max = [0.0] * (len(self.rules) + 1)
+        self.remaining_min = [0.0] * (len(self.rules) + 1)
+        for i in range(len(self.rules) - 1, -1, -1):
+            rule_score = self.rules[i].score or 0.0
+            self.remaining_max[i] = self.remaining_max[i + 1] + max(rule_score, 0.0)
+            self.remaining_min[i] = self.remaining_min[i + 1] + min(rule_score, 0.0)
+        self.velocity_windows = frozenset((rule.field, rule.window_seconds) for rule in velocity_rules)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def match(self, transaction, velocity_counts=None):
+        """
+        Find the rules matching a transaction
+
+        Args:
+            transaction (dict): Transaction data
+            velocity_counts (dict): (field, window_seconds) -> recent transaction count
+
+        Returns:
+            list: Matching CompiledRule instances in priority order
+        """
+        matched = [rule for rule in self.scan_rules if rule.matches(transaction)]
+        scanned = len(matched)
+        self.hash_index.lookup(transaction, matched)
+        self.range_index.lookup(transaction, matched)
+        self.string_index.lookup(transaction, matched)
+        if velocity_counts:
+            for rule in self.velocity_rules:
+                count = velocity_counts.get((rule.field, rule.window_seconds))
+                if count is not None and rule.test(count):
+                    matched.append(rule)
+        if self.combination_rules:
+            graph = self.condition_graph
+            memo = graph.new_memo()
+            for rule in self.combination_rules:
+                if graph.evaluate(rule._root, transaction, memo):
+                    matched.append(rule)
+        if len(matched) > scanned:
+            # Index hits from several fields interleave with the scanned rules
+            matched.sort(key=by_position)
+        return matched
+
+    def rule_matches(self, rule, transaction, velocity_counts=None, memo=None):
+        """
+        Check a single rule of this set, without using the indexes
+
+        Args:
+            rule (CompiledRule): A rule from self.rules
+            transaction (dict): Transaction data
+            velocity_counts (dict): (field, window_seconds) -> recent transaction count
+            memo (list): Condition graph cache from condition_graph.new_memo()
+
+        Returns:
+            bool: True if the rule matches
+        """
+        if rule.window_seconds is not None:
+            count = velocity_counts.get((rule.field, rule.window_seconds)) if velocity_counts else None
+            return count is not None and rule.test(count)
+        if rule.condition is not None:
+            # Rules whose condition failed to compile are not bound to the graph
+            if rule._graph is not self.condition_graph:
+                return False
+            return self.condition_graph.evaluate(rule._root, transaction, memo)
+        return rule.matches(transaction)
@@ -0,0 +1,137 @@
+from collections.abc import Mapping
+
+# Node kinds
+LEAF = 0
+AND = 1
+OR = 2
+NOT = 3
+
+_LABELS = {AND: " AND ", OR: " OR "}
+
+
+class ConditionGraph:
+    """
+    Boolean conditions of all combination rules compiled into one DAG
+
+    Identical leaf predicates and identical sub-expressions are hash-consed
+    into a single node, so a condition such as channel == "web" that appears
+    in dozens of rules is evaluated once per transaction.
+
+    Conditions are nested dictionaries::
+
+        {"and": [{"field": "channel", "operator": "==", "value": "web"},
+                 {"not": {"field": "bank", "operator": "in", "value": "Chase,Citibank"}}]}
+
+    with "and" / "or" taking a list of sub-conditions and "not" a single one.
+    """
+
+    def __init__(self):
+        self.nodes = []
+        self._ids = {}
+        self.leaf_references = 0
+
+    def _intern(self, key, node):
+        node_id = self._ids.get(key)
+        if node_id is None:
+            node_id = self._ids[key] = len(self.nodes)
+            self.nodes.append(node)
+        return node_id
+
+    def add(self, condition):
+        """
+        Compile a condition into the graph
+
+        Args:
+            condition (dict): Condition tree
+
+        Returns:
+            int: Id of the root node
+
+        Raises:
+            ValueError: If the condition is malformed
+        """
+        # Imported here to avoid a circular import with rule_compiler
+        from .rule_compiler import CompiledRule
+
+        if not isinstance(condition, Mapping):
+            raise ValueError(f"Condition must be an object, got {condition!r}")
+
+        if "and" in condition or "or" in condition:
+            kind = AND if "and" in condition else OR
+            children = condition["and" if kind == AND else "or"]
+            if not isinstance(children, list) or not children:
+                raise ValueError("'and' / 'or' need a non-empty list of conditions")
+            # Keep the written order for evaluation, but key on the sorted
+            # children so that "a AND b" and "b AND a" share one node
+            child_ids = tuple(dict.fromkeys(self.add(child) for child in children))
+            if len(child_ids) == 1:
+                return child_ids[0]
+            return self._intern((kind, tuple(sorted(child_ids))), (kind, child_ids))
+
+        if "not" in condition:
+            child_id = self.add(condition["not"])
+            return self._intern((NOT, child_id), (NOT, child_id))
+
+        if "field" not in condition or "operator" not in condition:
+            raise ValueError(f"Leaf condition needs 'field' and 'operator': {condition!r}")
+        self.leaf_references += 1
+        value = condition.get("value")
+        # The type is part of the key: 1, 1.0 and True are equal as dictionary
+        # keys but not as predicates ("==" compares str(value))
+        key = (LEAF, condition["field"], condition["operator"], type(value),
+               value if isinstance(value, (str, int, float, bool, type(None))) else repr(value))
+        node_id = self._ids.get(key)
+        if node_id is None:
+            leaf = CompiledRule({"field": condition["field"], "operator": condition["operator"],
+                                 "value": value})
+            node_id = self._intern(key, (LEAF, leaf))
+        return node_id
+
+    def new_memo(self):
+        """
+        Per-transaction cache of node results
+        """
+        return [None] * len(self.nodes)
+
+    def evaluate(self, node_id, transaction, memo):
+        """
+        Evaluate a node, reusing results already computed for this transaction
+
+        Args:
+            node_id (int): Node to evaluate
+            transaction (dict): Transaction data
+            memo (list): Cache from new_memo(), shared by all rules for one transaction
+
+        Returns:
+            bool: Value of the node
+        """
+        result = memo[node_id]
+        if result is None:
+            kind, arg = self.nodes[node_id]
+            if kind == LEAF:
+                result = arg.matches(transaction)
+            elif kind == AND:
+                result = all(self.evaluate(child, transaction, memo) for child in arg)
+            elif kind == OR:
+                result = any(self.evaluate(child, transaction, memo) for child in arg)
+            else:
+                result = not self.evaluate(arg, transaction, memo)
+            memo[node_id] = result
+        return result
+
+    def describe(self, node_id):
+        """
+        Render a node as text for explanations
+
+        Args:
+            node_id (int): Node to render
+
+        Returns:
+            str: Human readable condition
+        """
+        kind, arg = self.nodes[node_id]
+        if kind == LEAF:
+            return arg.reason
+        if kind == NOT:
+            return f"NOT ({self.describe(arg)})"
+        return "(" + _LABELS[kind].join(self.describe(child) for child in arg) + ")"
@@ -0,0 +1,375 @@
+from bisect import bisect_left, bisect_right
+from operator import attrgetter
+
+import numpy as np
+
+from .field_access import MISSING, compile_accessor
+from .string_matcher import AhoCorasick, PrefixTrie
+
+# Transaction fields whose equality / membership rules are kept in hash maps
+INDEXED_FIELDS = ("payment_mode", "channel", "bank", "payer_id", "payee_id",
+                  "additional_data.ip_address", "additional_data.device_id")
+
+by_position = attrgetter("position")
+
+
+class FieldHashIndex:
+    """
+    Hash maps from a field value to the "==" and "in" rules it satisfies
+
+    A transaction only looks up its own value for each indexed field, so the
+    cost does not grow with the number of equality rules.
+    """
+
+    def __init__(self, fields=INDEXED_FIELDS):
+        """
+        Initialize an empty index
+
+        Args:
+            fields (tuple): Fields eligible for hash indexing
+        """
+        self.fields = fields
+        self.tables = {}
+        self.accessors = {}
+
+    def add(self, rule):
+        """
+        Add a compiled rule to the index if its operator and field allow it
+
+        Args:
+            rule (CompiledRule): The compiled rule
+
+        Returns:
+            bool: True if the rule was indexed
+        """
+        if rule.field not in self.fields:
+            return False
+        if rule.operator == "==":
+            keys = (rule.constant,)
+        elif rule.operator == "in" and rule.constant is not None:
+            keys = rule.constant
+        else:
+            return False
+
+        if rule.field not in self.tables:
+            self.tables[rule.field] = {}
+            self.accessors[rule.field] = rule.get_value
+        table = self.tables[rule.field]
+        for key in keys:
+            table.setdefault(key, []).append(rule)
+        return True
+
+    def lookup(self, transaction, out):
+        """
+        Append the rules matched by a transaction to a list
+
+        Args:
+            transaction (dict): Transaction data
+            out (list): List the matching rules are appended to
+        """
+        for field, table in self.tables.items():
+            transaction_value = self.accessors[field](transaction)
+            if transaction_value is MISSING:
+                continue
+            hits = table.get(str(transaction_value))
+            if hits:
+                out.extend(hits)
+
+    def __len__(self):
+        return sum(len(rules) for table in self.tables.values() for rules in table.values())
+
+
+class _SortedThresholds:
+    """
+    Rules of a single comparison operator on one field, sorted by constant
+    """
+
+    __slots__ = ("constants", "rules", "prefix_scores")
+
+    def __init__(self, rules):
+        rules = sorted(rules, key=attrgetter("constant"))
+        self.constants = [rule.constant for rule in rules]
+        self.rules = rules
+        # prefix_scores[i] is the summed score of rules[:i]
+        self.prefix_scores = [0.0]
+        for rule in rules:
+            self.prefix_scores.append(self.prefix_scores[-1] + rule.score)
+
+
+class FieldThresholdIndex:
+    """
+    Sorted breakpoint arrays for the >, <, >= and <= rules on one numeric field
+
+    For a value x the matching ">" rules are exactly those whose constant is
+    below x, i.e. a prefix of the sorted constants, and the matching "<" rules
+    are a suffix. A bisect therefore finds all matches (and their summed score
+    through prefix sums) in O(log n) regardless of how many bands exist.
+    """
+
+    def __init__(self, field, rules):
+        """
+        Build the index
+
+        Args:
+            field (str): Transaction field the rules apply to
+            rules (list): Compiled numeric rules on this field
+        """
+        self.field = field
+        self.get_value = compile_accessor(field)
+        grouped = {">": [], ">=": [], "<": [], "<=": []}
+        for rule in rules:
+            grouped[rule.operator].append(rule)
+        self.gt = _SortedThresholds(grouped[">"])
+        self.ge = _SortedThresholds(grouped[">="])
+        self.lt = _SortedThresholds(grouped["<"])
+        self.le = _SortedThresholds(grouped["<="])
+
+    def _bounds(self, x):
+        # (end of matching ">" prefix, end of ">=" prefix,
+        #  start of matching "<" suffix, start of "<=" suffix)
+        return (bisect_left(self.gt.constants, x), bisect_right(self.ge.constants, x),
+                bisect_right(self.lt.constants, x), bisect_left(self.le.constants, x))
+
+    def match_value(self, x, out):
+        """
+        Append the rules matched by a numeric value to a list
+
+        Args:
+            x (float): Field value
+            out (list): List the matching rules are appended to
+        """
+        gt_end, ge_end, lt_start, le_start = self._bounds(x)
+        out.extend(self.gt.rules[:gt_end])
+        out.extend(self.ge.rules[:ge_end])
+        out.extend(self.lt.rules[lt_start:])
+        out.extend(self.le.rules[le_start:])
+
+    def score_value(self, x):
+        """
+        Summed score of all rules matched by a numeric value
+
+        Args:
+            x (float): Field value
+
+        Returns:
+            float: Total score of the matching rules
+        """
+        if x != x:
+            return 0.0
+        gt_end, ge_end, lt_start, le_start = self._bounds(x)
+        return (self.gt.prefix_scores[gt_end] + self.ge.prefix_scores[ge_end]
+                + self.lt.prefix_scores[-1] - self.lt.prefix_scores[lt_start]
+                + self.le.prefix_scores[-1] - self.le.prefix_scores[le_start])
+
+
+class NumericRangeIndex:
+    """
+    Threshold indexes for every numeric field referenced by a rule set
+    """
+
+    def __init__(self, rules):
+        """
+        Build per-field threshold indexes
+
+        Args:
+            rules (list): Compiled rules with a numeric operator and a valid constant
+        """
+        by_field = {}
+        for rule in rules:
+            by_field.setdefault(rule.field, []).append(rule)
+        self.fields = {field: FieldThresholdIndex(field, field_rules)
+                       for field, field_rules in by_field.items()}
+
+    def lookup(self, transaction, out):
+        """
+        Append the rules matched by a transaction to a list
+
+        Args:
+            transaction (dict): Transaction data
+            out (list): List the matching rules are appended to
+        """
+        for index in self.fields.values():
+            transaction_value = index.get_value(transaction)
+            if transaction_value is MISSING:
+                continue
+            try:
+                x = float(transaction_value) if transaction_value is not None else 0.0
+            except (ValueError, TypeError):
+                continue
+            if x == x:
+                index.match_value(x, out)
+
+    def __len__(self):
+        return sum(len(i.gt.rules) + len(i.ge.rules) + len(i.lt.rules) + len(i.le.rules)
+                   for i in self.fields.values())
+
+
+class AmountTier:
+    """
+    One built-in amount band: a strict lower bound with a score and reason
+    """
+
+    __slots__ = ("threshold", "score", "reason_template")
+
+    code = "amount_threshold"
+
+    def __init__(self, threshold, score, reason_template):
+        self.threshold = threshold
+        self.score = score
+        self.reason_template = reason_template
+
+    def reason(self, amount):
+        return self.reason_template.format(amount=amount)
+
+    render_reason = reason
+
+
+class TieredThresholds:
+    """
+    Mutually exclusive "amount > threshold" tiers resolved with one bisect
+
+    Tiers are given in precedence order (as in an if/elif chain). Between two
+    consecutive breakpoints the winning tier never changes, so it is resolved
+    once per interval when the table is built.
+    """
+
+    def __init__(self, tiers):
+        """
+        Build the breakpoint table
+
+        Args:
+            tiers (list): AmountTier instances in precedence order
+        """
+        self.breakpoints = sorted({tier.threshold for tier in tiers})
+        # winners[i] applies to values with exactly i breakpoints below them
+        self.winners = [None]
+        for i in range(1, len(self.breakpoints) + 1):
+            upper = self.breakpoints[i - 1]
+            self.winners.append(next((t for t in tiers if t.threshold <= upper), None))
+
+    def lookup(self, amount):
+        """
+        Find the tier an amount falls into
+
+        Args:
+            amount (float): Transaction amount
+
+        Returns:
+            AmountTier: The winning tier, or None if no tier applies
+        """
+        return self.winners[bisect_left(self.breakpoints, amount)]
+
+    def lookup_many(self, amounts):
+        """
+        Find the tier of every amount in an array
+
+        Args:
+            amounts (numpy.ndarray): Transaction amounts
+
+        Returns:
+            list: The winning tier (or None) of each amount
+        """
+        positions = np.searchsorted(self.breakpoints, amounts, side="left")
+        # bisect_left places NaN before every breakpoint, searchsorted after them
+        positions[np.isnan(amounts)] = 0
+        winners = self.winners
+        return [winners[position] for position in positions.tolist()]
+
+
+class FieldStringIndex:
+    """
+    Automata answering all contains / not_contains / starts_with / ends_with
+    rules on one field in a single pass over the field value
+    """
+
+    def __init__(self, field, rules):
+        """
+        Build the automata
+
+        Args:
+            field (str): Transaction field the rules apply to
+            rules (list): Compiled string rules on this field
+        """
+        self.field = field
+        self.get_value = compile_accessor(field)
+        contains = [r for r in rules if r.operator in ("contains", "not_contains")]
+        prefixes = [r for r in rules if r.operator == "starts_with"]
+        suffixes = [r for r in rules if r.operator == "ends_with"]
+
+        self._contains_patterns, self._contains_rules = self._group(contains)
+        contains_ids = {pattern: i for i, pattern in enumerate(self._contains_patterns)}
+        self._not_contains = [(contains_ids[r.constant], r) for r in contains
+                              if r.operator == "not_contains"]
+        self._prefix_patterns, self._prefix_rules = self._group(prefixes)
+        self._suffix_patterns, self._suffix_rules = self._group(suffixes)
+
+        self.contains = AhoCorasick(self._contains_patterns)
+        self.prefixes = PrefixTrie(self._prefix_patterns)
+        self.suffixes = PrefixTrie(self._suffix_patterns, suffix=True)
+
+    @staticmethod
+    def _group(rules):
+        # Deduplicate patterns, remembering the "contains"/prefix/suffix rules per pattern id
+        pattern_ids = {}
+        grouped = []
+        for rule in rules:
+            pattern_id = pattern_ids.get(rule.constant)
+            if pattern_id is None:
+                pattern_id = pattern_ids[rule.constant] = len(grouped)
+                grouped.append([])
+            if rule.operator != "not_contains":
+                grouped[pattern_id].append(rule)
+        return list(pattern_ids), grouped
+
+    def match_value(self, text, out):
+        """
+        Append the rules matched by a string value to a list
+
+        Args:
+            text (str): Field value
+            out (list): List the matching rules are appended to
+        """
+        found = self.contains.search(text) if self._contains_patterns else ()
+        for pattern_id in found:
+            out.extend(self._contains_rules[pattern_id])
+        for pattern_id, rule in self._not_contains:
+            if pattern_id not in found:
+                out.append(rule)
+        if self._prefix_patterns:
+            for pattern_id in self.prefixes.search(text):
+                out.extend(self._prefix_rules[pattern_id])
+        if self._suffix_patterns:
+            for pattern_id in self.suffixes.search(text):
+                out.extend(self._suffix_rules[pattern_id])
+
+
+class StringPatternIndex:
+    """
+    String pattern indexes for every field referenced by string rules
+    """
+
+    def __init__(self, rules):
+        """
+        Build per-field automata
+
+        Args:
+            rules (list): Compiled rules with a string operator and a string constant
+        """
+        by_field = {}
+        for rule in rules:
+            by_field.setdefault(rule.field, []).append(rule)
+        self.fields = {field: FieldStringIndex(field, field_rules)
+                       for field, field_rules in by_field.items()}
+
+    def lookup(self, transaction, out):
+        """
+        Append the rules matched by a transaction to a list
+
+        Args:
+            transaction (dict): Transaction data
+            out (list): List the matching rules are appended to
+        """
+        for index in self.fields.values():
+            transaction_value = index.get_value(transaction)
+            if isinstance(transaction_value, str):
+                index.match_value(transaction_value, out)
@@ -0,0 +1,430 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from collections import deque
+
+from ..api import schemas
+from .combined_model import CombinedFraudDetector
+from .scoring_pool import DEFAULT_CHUNK_SIZE, ScoringPool, score_transactions
+
+FILE_FORMATS = ("jsonl", "csv", "parquet")
+
+# Columns of the result files, one row per input row
+OUTPUT_FIELDS = ("line", "transaction_id", "is_fraud_predicted", "fraud_score", "rule_score", "ai_score",
+                 "fraud_source", "fraud_reason", "error")
+
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "trained", "fraud_model.pkl")
+
+
+def file_format(path):
+    """
+    Guess the format of a transaction file from its extension
+
+    Args:
+        path (str): File path
+
+    Returns:
+        str: "jsonl", "csv" or "parquet"
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".csv", ".parquet"):
+        return extension[1:]
+    return "jsonl"
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("Parquet files need pyarrow (pip install pyarrow)")
+    return pyarrow
+
+
+def read_rows(path, input_format):
+    """
+    Read the rows of a transaction file one at a time
+
+    Args:
+        path (str): Input file
+        input_format (str): "jsonl", "csv" or "parquet"
+
+    Yields:
+        tuple: (line or row number, transaction dict or an error message), skipping blank rows
+    """
+    if input_format == "parquet":
+        pyarrow = _import_pyarrow()
+        row_number = 0
+        for batch in pyarrow.parquet.ParquetFile(path).iter_batches():
+            for row in batch.to_pylist():
+                row_number += 1
+                row = {key: value for key, value in row.items() if value is not None}
+                if row:
+                    yield row_number, row
+        return
+
+    for line_number, row, _ in read_rows_from(path, input_format):
+        yield line_number, row
+
+
+def read_rows_from(path, input_format, position=(0, 0)):
+    """
+    Read the rows of a JSONL or CSV file from a position returned with an earlier row
+
+    Lets a reader stop after any row and later continue from there without
+    reading the rows before it again.
+
+    Args:
+        path (str): Input file
+        input_format (str): "jsonl" or "csv"
+        position (tuple): (byte offset, lines read) to start at; (0, 0) for the start of the file
+
+    Yields:
+        tuple: (line number, transaction dict or an error message, position after the row),
+            skipping blank rows
+    """
+    offset, lines_read = position
+    with open(path, "rb") as f:
+        if input_format == "csv":
+            # Rows are decoded one line at a time, so that the offset of the
+            # lines the CSV reader has taken is known after every row
+            consumed = [offset]
+
+            def decoded_lines():
+                for line in f:
+                    consumed[0] += len(line)
+                    yield line.decode("utf-8")
+
+            fieldnames = None
+            if offset:
+                fieldnames = next(csv.reader(decoded_lines()), None)
+                f.seek(offset)
+                consumed[0] = offset
+            reader = csv.DictReader(decoded_lines(), fieldnames=fieldnames)
+            for row in reader:
+                line_number = lines_read + reader.line_num
+                # Empty cells are missing values
+                row = {key: value for key, value in row.items() if key and value not in (None, "")}
+                if not row:
+                    continue
+                if "additional_data" in row:
+                    try:
+                        row["additional_data"] = json.loads(row["additional_data"])
+                    except ValueError:
+                        yield line_number, "additional_data is not valid JSON", (consumed[0], line_number)
+                        continue
+                yield line_number, row, (consumed[0], line_number)
+            return
+
+        f.seek(offset)
+        for line_number, line in enumerate(f, lines_read + 1):
+            offset += len(line)
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_number, f"Invalid JSON: {str(e)}", (offset, line_number)
+                continue
+            if not isinstance(row, dict):
+                yield line_number, "Expected a JSON object", (offset, line_number)
+                continue
+            yield line_number, row, (offset, line_number)
+
+
+def validate_rows(rows):
+    """
+    Check rows against the API's transaction schema
+
+    Args:
+        rows (list): (line number, transaction dict or error message) from read_rows()
+
+    Returns:
+        tuple: (rows with invalid transactions replaced by an error message,
+            the valid transaction dicts in order)
+    """
+    items = []
+    transaction_dicts = []
+    for line_number, row in rows:
+        if isinstance(row, dict):
+            try:
+                row = schemas.TransactionBase.parse_obj(row).dict()
+                transaction_dicts.append(row)
+            except ValueError as e:
+                row = str(e)
+        items.append((line_number, row))
+    return items, transaction_dicts
+
+
+def result_rows(items, scored, explain=False):
+    """
+    Pair validated rows with their scores
+
+    Args:
+        items (list): Rows returned by validate_rows()
+        scored (list): score_transactions() results for the valid rows, in order
+        explain (bool): Include the reason for each decision
+
+    Returns:
+        list: One result dict per row; invalid rows only have "line" and "error"
+    """
+    scored = iter(scored)
+    results = []
+    for line_number, row in items:
+        if not isinstance(row, dict):
+            results.append({"line": line_number, "error": row})
+            continue
+        is_fraud, fraud_score, rule_score, ai_score, fraud_source, fraud_reason, _ = next(scored)
+        result = {
+            "line": line_number,
+            "transaction_id": row["transaction_id"],
+            "is_fraud_predicted": is_fraud,
+            "fraud_score": fraud_score,
+            "rule_score": rule_score,
+            "ai_score": ai_score,
+            "fraud_source": fraud_source,
+        }
+        if explain:
+            result["fraud_reason"] = fraud_reason
+        results.append(result)
+    return results
+
+
+class ResultWriter:
+    """
+    Append result rows to a JSONL, CSV or Parquet file
+    """
+
+    def __init__(self, path, output_format):
+        """
+        Args:
+            path (str): Output file, replaced if it exists
+            output_format (str): "jsonl", "csv" or "parquet"
+        """
+        self.output_format = output_format
+        self._parquet = None
+        if output_format == "parquet":
+            self._pyarrow = _import_pyarrow()
+            self._schema = self._pyarrow.schema([
+                ("line", self._pyarrow.int64()),
+                ("transaction_id", self._pyarrow.string()),
+                ("is_fraud_predicted", self._pyarrow.bool_()),
+                ("fraud_score", self._pyarrow.float64()),
+                ("rule_score", self._pyarrow.float64()),
+                ("ai_score", self._pyarrow.float64()),
+                ("fraud_source", self._pyarrow.string()),
+                ("fraud_reason", self._pyarrow.string()),
+                ("error", self._pyarrow.string()),
+            ])
+            self._parquet = self._pyarrow.parquet.ParquetWriter(path, self._schema)
+            return
+        self._file = open(path, "w", newline="")
+        if output_format == "csv":
+            self._csv = csv.DictWriter(self._file, fieldnames=OUTPUT_FIELDS)
+            self._csv.writeheader()
+
+    def write(self, results):
+        """
+        Write result dicts from result_rows()
+        """
+        if self._parquet is not None:
+            self._parquet.write_table(self._pyarrow.Table.from_pylist(results, schema=self._schema))
+        elif self.output_format == "csv":
+            self._csv.writerows(results)
+        else:
+            self._file.write("".join(json.dumps(result) + "\n" for result in results))
+
+    def close(self):
+        """
+        Finish and close the output file
+        """
+        if self._parquet is not None:
+            self._parquet.close()
+        else:
+            self._file.close()
+
+
+def load_rules(rules_path=None):
+    """
+    Load the active custom rules the API would use
+
+    Args:
+        rules_path (str): JSON export of the rules (a list of rules, as returned
+            by GET /api/rules, or {"rules": [...]}); by default the rules are
+            read from the custom_rules table
+
+    Returns:
+        list: Active rule dicts, highest priority first
+    """
+    if rules_path is None:
+        from ..database import crud
+        from ..database.database import SessionLocal
+        from ..database.rule_cache import freeze_rule
+
+        db = SessionLocal()
+        try:
+            return [dict(freeze_rule(rule)) for rule in crud.get_all_custom_rules(db, limit=None, active_only=True)]
+        finally:
+            db.close()
+
+    with open(rules_path) as f:
+        rules = json.load(f)
+    if isinstance(rules, dict):
+        rules = rules["rules"]
+    # Stored the way crud.create_custom_rule stores them
+    rules = [dict(rule, value=str(rule["value"]), score=float(rule["score"]))
+             for rule in rules if rule.get("is_active", True)]
+    rules.sort(key=lambda rule: (-rule.get("priority", 1), rule.get("id") or 0))
+    return rules
+
+
+def score_file(input_path, output_path, rules, workers=0, chunk_size=DEFAULT_CHUNK_SIZE, explain=False,
+               model_path=None, input_format=None, output_format=None, **detector_options):
+    """
+    Score a transaction file chunk by chunk and write one result row per input row
+
+    Chunks are read while earlier ones are being scored: with workers > 0,
+    up to two chunks per worker process are in flight, and results are
+    written in input order as they complete.
+
+    Velocity checks are not applied: they count by arrival time in each
+    process, so they would make the results depend on the number of
+    workers and on when the file is scored. Every run of the same file and
+    rules gives the same results.
+
+    Args:
+        input_path (str): Transaction file
+        output_path (str): Result file
+        rules (list): Custom rules, e.g. from load_rules()
+        workers (int): Scoring processes (0 scores in this process)
+        chunk_size (int): Rows per chunk
+        explain (bool): Include the reason for each decision
+        model_path (str): Path to the pre-trained AI model
+        input_format (str): Format of the input (default: from its extension)
+        output_format (str): Format of the output (default: from its extension)
+        **detector_options: Extra CombinedFraudDetector arguments
+
+    Returns:
+        dict: rows, invalid_rows, seconds and the seconds spent per stage
+    """
+    input_format = input_format or file_format(input_path)
+    output_format = output_format or file_format(output_path)
+    timings = {"startup": 0.0, "read": 0.0, "validate": 0.0, "score": 0.0, "write": 0.0}
+    rows = 0
+    invalid_rows = 0
+
+    start_time = time.perf_counter()
+    stage_start = start_time
+    # Opened first, so that a missing Parquet library fails before any process starts
+    writer = ResultWriter(output_path, output_format)
+    pool = None
+    detector = None
+    if workers > 0:
+        pool = ScoringPool(workers, model_path, chunk_size, velocity=False, **detector_options)
+        pool.update_rules(1, rules)
+        pool.warm_up()
+    else:
+        detector = CombinedFraudDetector(ai_model_path=model_path, custom_rules=rules, velocity=False,
+                                         **detector_options)
+    timings["startup"] = time.perf_counter() - stage_start
+
+    def finish(items, scored):
+        stage_start = time.perf_counter()
+        writer.write(result_rows(items, scored, explain))
+        timings["write"] += time.perf_counter() - stage_start
+
+    try:
+        source = read_rows(input_path, input_format)
+        in_flight = deque()
+        while True:
+            stage_start = time.perf_counter()
+            chunk = []
+            for row in source:
+                chunk.append(row)
+                if len(chunk) >= chunk_size:
+                    break
+            timings["read"] += time.perf_counter() - stage_start
+            if not chunk:
+                break
+
+            stage_start = time.perf_counter()
+            items, transaction_dicts = validate_rows(chunk)
+            timings["validate"] += time.perf_counter() - stage_start
+            rows += len(items)
+            invalid_rows += len(items) - len(transaction_dicts)
+
+            stage_start = time.perf_counter()
+            if pool is None:
+                scored = score_transactions(detector, transaction_dicts, explain)
+                timings["score"] += time.perf_counter() - stage_start
+                finish(items, scored)
+                continue
+            in_flight.append((items, pool.submit(transaction_dicts, explain)))
+            # Keep the workers busy while bounding memory
+            while len(in_flight) >= 2 * pool.workers:
+                items, future = in_flight.popleft()
+                scored = future.result()
+                timings["score"] += time.perf_counter() - stage_start
+                finish(items, scored)
+                stage_start = time.perf_counter()
+            timings["score"] += time.perf_counter() - stage_start
+
+        while in_flight:
+            stage_start = time.perf_counter()
+            items, future = in_flight.popleft()
+            scored = future.result()
+            timings["score"] += time.perf_counter() - stage_start
+            finish(items, scored)
+    finally:
+        writer.close()
+        if pool is not None:
+            pool.close()
+        elif detector is not None:
+            detector.close()
+
+    return {
+        "rows": rows,
+        "invalid_rows": invalid_rows,
+        "seconds": time.perf_counter() - start_time,
+        "timings": timings,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score a JSONL, CSV or Parquet file of transactions offline")
+    parser.add_argument("input", help="Transaction file (.jsonl, .csv or .parquet)")
+    parser.add_argument("output", help="Result file (.jsonl, .csv or .parquet)")
+    parser.add_argument("--rules", help="JSON export of the custom rules (default: the custom_rules table)")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Scoring processes (0 scores in this process; default: number of CPUs)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--explain", action="store_true", help="Include the reason for each decision")
+    parser.add_argument("--input-format", choices=FILE_FORMATS)
+    parser.add_argument("--output-format", choices=FILE_FORMATS)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.input):
+        print(f"Error: Input file {args.input} does not exist.")
+        sys.exit(1)
+
+    rules = load_rules(args.rules)
+    print(f"Loaded {len(rules)} active custom rules")
+    # Same AI options as the API (see src/api/endpoints.py)
+    try:
+        result = score_file(args.input, args.output, rules, workers=args.workers, chunk_size=args.chunk_size,
+                            explain=args.explain, model_path=args.model if os.path.exists(args.model) else None,
+                            input_format=args.input_format, output_format=args.output_format,
+                            skip_decided_ai=os.getenv("AI_SKIP_DECIDED", "false").lower() == "true")
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    print(f"Scored {result['rows']} rows ({result['invalid_rows']} invalid) in {result['seconds']:.2f}s: "
+          f"{result['rows'] / result['seconds']:.0f} rows/sec")
+    print(f"{'stage':<10} {'seconds':>9} {'share':>7}")
+    for stage, seconds in result["timings"].items():
+        print(f"{stage:<10} {seconds:>9.2f} {seconds / result['seconds']:>6.1%}")
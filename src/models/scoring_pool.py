@@ -0,0 +1,301 @@
+import argparse
+import multiprocessing
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from .combined_model import CombinedFraudDetector, decision_threshold
+
+# Number of scoring processes started by the API (0 disables the pool)
+SCORING_POOL_WORKERS = int(os.getenv("SCORING_POOL_WORKERS", "0"))
+
+# Transactions sent to a worker process per task
+DEFAULT_CHUNK_SIZE = int(os.getenv("SCORING_POOL_CHUNK_SIZE", "1000"))
+
+# Seconds warm_up() waits for every worker process to start
+WARM_UP_TIMEOUT = 300
+
+# State of each worker process, set up by _init_worker
+_detector = None
+_rules_version = None
+_warm_up_barrier = None
+
+
+def score_transactions(detector, transactions, explain=False, rules=None, velocity_counts=None):
+    """
+    Score a batch of transactions with a detector using the API's threshold policy
+
+    Args:
+        detector (CombinedFraudDetector): The detector
+        transactions (list): Transaction dictionaries
+        explain (bool): Whether to render the reason for each decision
+        rules (RuleContext): Rules to use (default: the detector's current rules)
+        velocity_counts (list): Velocity counts taken by another detector's
+            count_velocity(), used instead of this detector's counters
+
+    Returns:
+        list: (is_fraud, fraud_score, rule_score, ai_score, fraud_source,
+            fraud_reason, prediction_time_ms) per transaction; ai_score is
+            None where the AI model was skipped, and fraud_reason is None
+            unless explain is set
+    """
+    if not transactions:
+        return []
+    start_time = time.time()
+    detections = detector.detect_fraud_batch(transactions, [decision_threshold(t) for t in transactions],
+                                            rules=rules, velocity_counts=velocity_counts)
+    # Each transaction is charged an equal share of the batch's scoring time
+    prediction_time_ms = int((time.time() - start_time) * 1000 / len(transactions))
+    results = []
+    for transaction, (is_fraud, fraud_score, rule_score, ai_score, reasons) in zip(transactions, detections):
+        fraud_source = "model" if ai_score is not None and ai_score > rule_score else "rule"
+        fraud_reason = None
+        if explain:
+            fraud_source, fraud_reason = detector.describe_reason(transaction, rule_score, ai_score, reasons, rules)
+        results.append((is_fraud, fraud_score, rule_score, ai_score, fraud_source, fraud_reason,
+                        prediction_time_ms))
+    return results
+
+
+def _init_worker(model_path, detector_options, warm_up_barrier):
+    global _detector, _rules_version, _warm_up_barrier
+    _detector = CombinedFraudDetector(ai_model_path=model_path, **detector_options)
+    _rules_version = None
+    _warm_up_barrier = warm_up_barrier
+
+
+def _wait_for_workers_task(_):
+    # Each call blocks until one is running in every worker process, so no
+    # process can take two of them
+    try:
+        _warm_up_barrier.wait(WARM_UP_TIMEOUT)
+    except threading.BrokenBarrierError:
+        pass
+
+
+def _score_chunk(rules_version, rules_path, transactions, explain, velocity_counts):
+    global _rules_version
+    if rules_version != _rules_version:
+        # Rule snapshots are shared through a file so that they are not
+        # pickled into every task
+        if rules_path is not None:
+            with open(rules_path, "rb") as f:
+                _detector.set_custom_rules(pickle.load(f), rules_version)
+        _rules_version = rules_version
+    return score_transactions(_detector, transactions, explain, velocity_counts=velocity_counts)
+
+
+class ScoringPool:
+    """
+    Long-lived worker processes, each holding a warm CombinedFraudDetector
+
+    Rule evaluation and tree traversal are CPU-bound Python, so threads
+    serialize on the GIL; separate processes score chunks of a batch in
+    parallel. Each rule snapshot is written to a file once and only its
+    version travels with each task; a worker reloads the rules when the
+    version changes, so every chunk is scored with the snapshot the caller
+    pinned.
+
+    The workers keep no velocity counters: split across processes, each
+    would only see part of the traffic. Callers count velocity in their own
+    process (CombinedFraudDetector.count_velocity) and pass the counts
+    along; without them the velocity checks do not trigger.
+    """
+
+    def __init__(self, workers=None, model_path=None, chunk_size=DEFAULT_CHUNK_SIZE, **detector_options):
+        """
+        Start the pool
+
+        Args:
+            workers (int): Number of processes (default: number of CPUs)
+            model_path (str): Path to the pre-trained AI model
+            chunk_size (int): Transactions per task
+            **detector_options: Extra CombinedFraudDetector arguments
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self._dir = tempfile.mkdtemp(prefix="scoring-pool-")
+        self._lock = threading.Lock()
+        self._rules_version = 0
+        self._rules_path = None
+        # Snapshot file of each rule version written so far
+        self._rules_paths = {}
+        # Spawned rather than forked: the API process runs threads
+        context = multiprocessing.get_context("spawn")
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(model_path, dict(detector_options, velocity=False), context.Barrier(self.workers)),
+        )
+
+    def update_rules(self, version, rules):
+        """
+        Publish a new rule snapshot to the workers
+
+        Args:
+            version (int): Snapshot version
+            rules (iterable): Custom rules (dicts or mappings)
+        """
+        path = self._snapshot_path(version, rules)
+        with self._lock:
+            # Tasks already queued keep reading the previous file
+            self._rules_version = version
+            self._rules_path = path
+
+    def _snapshot_path(self, version, rules):
+        """
+        Path of the snapshot file of a rule version, written on first use
+        """
+        with self._lock:
+            path = self._rules_paths.get(version)
+        if path is None:
+            path = os.path.join(self._dir, f"rules-{version}.pkl")
+            with open(path + ".tmp", "wb") as f:
+                pickle.dump([dict(rule) for rule in rules], f)
+            os.replace(path + ".tmp", path)
+            with self._lock:
+                self._rules_paths[version] = path
+        return path
+
+    def _task_rules(self, rules):
+        """
+        Version and snapshot path sent with tasks scored with the given rules
+        """
+        if rules is None:
+            with self._lock:
+                return self._rules_version, self._rules_path
+        if rules.version is None:
+            raise ValueError("The scoring pool needs rules from a versioned snapshot")
+        return rules.version, self._snapshot_path(rules.version, rules.custom_rules)
+
+    def warm_up(self):
+        """
+        Make every worker process start and load its model now
+
+        One task per process waits on a barrier shared by the processes, so
+        the call only returns once all of them have run their initializer.
+        """
+        list(self._executor.map(_wait_for_workers_task, range(self.workers)))
+
+    def submit(self, transactions, explain=False, rules=None, velocity_counts=None):
+        """
+        Score transactions as one task, without waiting for the result
+
+        Args:
+            transactions (list): Transaction dictionaries
+            explain (bool): Whether to render the reason for each decision
+            rules (RuleContext): Rules of a versioned snapshot to score with
+                (default: the snapshot last published with update_rules)
+            velocity_counts (list): Velocity counts for each transaction, from
+                CombinedFraudDetector.count_velocity() with the same rules
+
+        Returns:
+            concurrent.futures.Future: Resolves to the results, as returned by score_transactions()
+        """
+        version, path = self._task_rules(rules)
+        return self._executor.submit(_score_chunk, version, path, transactions, explain, velocity_counts)
+
+    def score(self, transactions, explain=False, chunk_size=None, rules=None, velocity_counts=None):
+        """
+        Score transactions across the worker processes
+
+        Args:
+            transactions (list): Transaction dictionaries
+            explain (bool): Whether to render the reason for each decision
+            chunk_size (int): Transactions per task (default: the pool's chunk size)
+            rules (RuleContext): Rules of a versioned snapshot to score with
+                (default: the snapshot last published with update_rules)
+            velocity_counts (list): Velocity counts for each transaction, from
+                CombinedFraudDetector.count_velocity() with the same rules
+
+        Returns:
+            list: Results in input order, as returned by score_transactions()
+        """
+        chunk_size = chunk_size or self.chunk_size
+        version, path = self._task_rules(rules)
+        futures = [
+            self._executor.submit(_score_chunk, version, path, transactions[i:i + chunk_size], explain,
+                                  None if velocity_counts is None else velocity_counts[i:i + chunk_size])
+            for i in range(0, len(transactions), chunk_size)
+        ]
+        results = []
+        for future in futures:
+            results.extend(future.result())
+        return results
+
+    def close(self):
+        """
+        Stop the worker processes and remove the snapshot files
+        """
+        self._executor.shutdown(wait=True)
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+
+def benchmark(transactions, worker_counts, model_path=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Time in-process scoring against pools of different sizes
+
+    Args:
+        transactions (list): Transaction dictionaries
+        worker_counts (list): Pool sizes to measure
+        model_path (str): Path to the pre-trained AI model
+        chunk_size (int): Transactions per task
+
+    Returns:
+        list: (label, seconds, transactions per second) per configuration
+    """
+    rows = []
+    detector = CombinedFraudDetector(ai_model_path=model_path)
+    start = time.perf_counter()
+    score_transactions(detector, transactions)
+    seconds = time.perf_counter() - start
+    rows.append(("in-process", seconds, len(transactions) / seconds))
+
+    for workers in worker_counts:
+        pool = ScoringPool(workers, model_path, chunk_size)
+        try:
+            # Start-up and model loading are not part of the measurement
+            pool.warm_up()
+            start = time.perf_counter()
+            pool.score(transactions)
+            seconds = time.perf_counter() - start
+        finally:
+            pool.close()
+        rows.append((f"{workers} process(es)", seconds, len(transactions) / seconds))
+    return rows
+
+
+if __name__ == "__main__":
+    from ..utils.generate_test_data import generate_transaction
+
+    parser = argparse.ArgumentParser(description="Benchmark the scoring process pool against in-process scoring")
+    parser.add_argument("--model", default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                        "trained", "fraud_model.pkl"))
+    parser.add_argument("--transactions", type=int, default=100000)
+    parser.add_argument("--workers", type=int, nargs="+",
+                        help="Pool sizes to measure (default: 1, 2, 4, ... up to the number of CPUs)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    worker_counts = args.workers
+    if not worker_counts:
+        cpus = os.cpu_count() or 1
+        worker_counts = [1]
+        while worker_counts[-1] * 2 <= cpus:
+            worker_counts.append(worker_counts[-1] * 2)
+        if worker_counts[-1] != cpus:
+            worker_counts.append(cpus)
+
+    model_path = args.model if os.path.exists(args.model) else None
+    transactions = [generate_transaction() for _ in range(args.transactions)]
+    results = benchmark(transactions, worker_counts, model_path, args.chunk_size)
+    baseline = results[0][1]
+    print(f"{len(transactions)} transactions on {os.cpu_count()} CPU(s)")
+    print(f"{'configuration':<16} {'seconds':>9} {'tx/s':>10} {'speedup':>8}")
+    for label, seconds, rate in results:
+        print(f"{label:<16} {seconds:>9.2f} {rate:>10.0f} {baseline / seconds:>7.2f}x")
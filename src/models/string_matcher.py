@@ -0,0 +1,120 @@
+from collections import deque
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick automaton reporting every pattern contained in a text
+
+    The automaton is built once per pattern set; searching is a single pass
+    over the text regardless of the number of patterns.
+    """
+
+    def __init__(self, patterns):
+        """
+        Build the automaton
+
+        Args:
+            patterns (list): Strings to search for; their list index is the pattern id
+        """
+        self.patterns = list(patterns)
+        goto = [{}]
+        outputs = [[]]
+
+        # Build the trie of all patterns
+        for pattern_id, pattern in enumerate(self.patterns):
+            node = 0
+            for char in pattern:
+                next_node = goto[node].get(char)
+                if next_node is None:
+                    next_node = len(goto)
+                    goto[node][char] = next_node
+                    goto.append({})
+                    outputs.append([])
+                node = next_node
+            outputs[node].append(pattern_id)
+
+        # Breadth-first pass computing failure links and merged outputs
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in goto[node].items():
+                queue.append(child)
+                state = fail[node]
+                while state and char not in goto[state]:
+                    state = fail[state]
+                fail[child] = goto[state].get(char, 0)
+                outputs[child] = outputs[child] + outputs[fail[child]]
+
+        self._goto = goto
+        self._fail = fail
+        self._outputs = [tuple(o) for o in outputs]
+
+    def search(self, text):
+        """
+        Find the patterns occurring anywhere in a text
+
+        Args:
+            text (str): Text to scan
+
+        Returns:
+            set: Ids of the patterns found
+        """
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        found = set(outputs[0])
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if outputs[node]:
+                found.update(outputs[node])
+        return found
+
+
+class PrefixTrie:
+    """
+    Trie reporting every pattern that is a prefix (or, reversed, a suffix) of a text
+    """
+
+    def __init__(self, patterns, suffix=False):
+        """
+        Build the trie
+
+        Args:
+            patterns (list): Strings to match; their list index is the pattern id
+            suffix (bool): Match patterns against the end of the text instead
+        """
+        self.patterns = list(patterns)
+        self.suffix = suffix
+        self._root = {}
+        self._root_ids = []
+        for pattern_id, pattern in enumerate(self.patterns):
+            if not pattern:
+                self._root_ids.append(pattern_id)
+                continue
+            node = self._root
+            for char in (reversed(pattern) if suffix else pattern):
+                node = node.setdefault(char, {})
+            node.setdefault(None, []).append(pattern_id)
+
+    def search(self, text):
+        """
+        Find the patterns the text starts (or ends) with
+
+        Args:
+            text (str): Text to match
+
+        Returns:
+            list: Ids of the matching patterns
+        """
+        found = list(self._root_ids)
+        node = self._root
+        for char in (reversed(text) if self.suffix else text):
+            node = node.get(char)
+            if node is None:
+                break
+            ids = node.get(None)
+            if ids:
+                found.extend(ids)
+        return found
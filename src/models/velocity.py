@@ -0,0 +1,351 @@
+"""
+Sliding-window event counts for velocity checks
+
+Counts are kept per process and per window, in tables of at most max_keys
+keys (VELOCITY_MAX_KEYS): about 36 bytes per key with the default 10
+buckets, so the default of about 2 million keys takes up to 75 MB per window.
+Within that bound counts are exact at bucket granularity, apart from keys
+whose 64-bit hashes collide (vanishingly rare) and per-bucket counts, which
+saturate at 65535. Once a window's table is full, a new key takes the slot
+of the key in its two candidate sets whose last event is oldest; that key's count restarts
+from zero, so its velocity rules can under-count. Such evictions are
+counted in SlidingWindowCounter.evicted (VelocityTracker.evicted in total)
+and the first one is logged.
+"""
+import os
+import threading
+import time
+from collections.abc import Mapping
+from datetime import datetime
+
+import numpy as np
+
+from ..utils.helpers import parse_timestamp
+from .field_access import MISSING, compile_accessor
+
+# Default number of buckets a velocity window is split into
+DEFAULT_BUCKETS = 10
+
+# Default cap on the number of keys (e.g. payer IDs) tracked per window in
+# each process; a key takes 16 + 2 * buckets bytes
+DEFAULT_MAX_KEYS = int(os.getenv("VELOCITY_MAX_KEYS", "2000000"))
+
+# Slots per set; a new key only competes with the keys of its two sets
+WAYS = 8
+
+# Sets of a new table, which doubles as it fills up to max_keys
+_INITIAL_SETS = 256
+
+# Newest bucket of a free slot
+_FREE = np.iinfo(np.int64).min
+
+# Per-bucket counts saturate here
+_MAX_COUNT = 65535
+
+
+# Latest time a datetime can hold (year 9999), in epoch seconds
+MAX_TIMESTAMP = 253402300800.0
+
+
+def event_time(value):
+    """
+    Convert a transaction timestamp to epoch seconds
+
+    Timestamps come from clients, so one that cannot be read (or lies
+    outside the range of datetime) counts as now, like a missing one.
+
+    Args:
+        value: datetime, epoch seconds, ISO 8601 string or None (meaning now)
+
+    Returns:
+        float: Seconds since the epoch
+    """
+    try:
+        if isinstance(value, datetime):
+            return value.timestamp()
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            seconds = float(value)
+            if abs(seconds) <= MAX_TIMESTAMP:
+                return seconds
+        elif value is not None:
+            return parse_timestamp(str(value)).timestamp()
+    except (ValueError, TypeError, OverflowError, OSError):
+        pass
+    return time.time()
+
+
+def _read_timestamp(row):
+    if isinstance(row, Mapping):
+        return row.get("timestamp")
+    return getattr(row, "timestamp", None)
+
+
+class SlidingWindowCounter:
+    """
+    Per-key event counts over a sliding time window
+
+    Each key keeps a small ring of bucket counters instead of individual
+    timestamps, in a fixed-layout table of NumPy arrays: a key takes one slot
+    of 16 + 2 * buckets bytes (36 bytes with 10 buckets) and no Python
+    objects. Keys are identified by their 64-bit hash, which picks two of
+    the table's sets of WAYS slots; a new key takes a free slot of either
+    set, or one whose window has passed. The table doubles whenever both
+    sets are full of active keys, up to max_keys slots. Counts are exact at bucket
+    granularity (window / buckets).
+
+    Only the window ending at a key's newest bucket is kept, so a late event
+    is counted against the part of its own window that is still held: events
+    older than the kept window are no longer known.
+    """
+
+    def __init__(self, window_seconds, buckets=DEFAULT_BUCKETS, max_keys=DEFAULT_MAX_KEYS):
+        """
+        Initialize the counter
+
+        Args:
+            window_seconds (float): Length of the window
+            buckets (int): Number of buckets the window is split into
+            max_keys (int): Maximum number of keys kept in memory (rounded up
+                to a power of two times WAYS)
+        """
+        self.window_seconds = window_seconds
+        self.buckets = buckets
+        self.bucket_seconds = window_seconds / buckets
+        self.max_sets = _INITIAL_SETS
+        while self.max_sets * WAYS < max_keys:
+            self.max_sets *= 2
+        self.max_keys = self.max_sets * WAYS
+        # Active keys that lost their counts to a new key because the table was full
+        self.evicted = 0
+        self._keys_held = 0
+        self._zero_row = memoryview(np.zeros(buckets, dtype=np.uint16)).cast("B").cast("H")
+        self._lock = threading.Lock()
+        self._set_arrays(np.zeros(_INITIAL_SETS * WAYS, dtype=np.int64),
+                         np.full(_INITIAL_SETS * WAYS, _FREE, dtype=np.int64),
+                         np.zeros(_INITIAL_SETS * WAYS * buckets, dtype=np.uint16))
+
+    def _set_arrays(self, keys, newest, counts):
+        """
+        Install the table arrays; key hash, newest bucket and bucket counts per slot
+        """
+        self._sets = len(keys) // WAYS
+        self._arrays = (keys, newest, counts)
+        # Python-level views, whose items are read and written as plain ints
+        self._key_view = memoryview(keys).cast("B").cast("q")
+        self._newest_view = memoryview(newest).cast("B").cast("q")
+        self._count_view = memoryview(counts).cast("B").cast("H")
+
+    def add(self, key, timestamp):
+        """
+        Record an event and return the number of events in the window
+
+        Args:
+            key: Grouping key, e.g. a payer ID
+            timestamp (float): Event time in epoch seconds
+
+        Returns:
+            int: Events for this key in the window ending at timestamp, including this one;
+                for a late event, only events still inside the kept window count
+        """
+        key_hash = hash(key) or 1
+        bucket = int(timestamp // self.bucket_seconds)
+        buckets = self.buckets
+        with self._lock:
+            slot = self._find(key_hash)
+            if slot < 0:
+                slot = self._claim(key_hash, bucket)
+                self._count_view[slot * buckets + bucket % buckets] = 1
+                return 1
+            counts = self._count_view
+            base = slot * buckets
+            newest = self._newest_view[slot]
+            if bucket > newest:
+                # Clear the slots of the buckets that rolled out of the window
+                if bucket - newest >= buckets:
+                    counts[base:base + buckets] = self._zero_row
+                else:
+                    for b in range(newest + 1, bucket + 1):
+                        counts[base + b % buckets] = 0
+                self._newest_view[slot] = newest = bucket
+            elif bucket <= newest - buckets:
+                # Late event that is already outside the kept window
+                return 1
+            position = base + bucket % buckets
+            if counts[position] < _MAX_COUNT:
+                counts[position] += 1
+            if bucket == newest:
+                return sum(counts[base:base + buckets])
+            # Late event: leave out the buckets after its own
+            return sum(counts[base + b % buckets] for b in range(newest - buckets + 1, bucket + 1))
+
+    def count(self, key, timestamp):
+        """
+        Number of events for a key in the window ending at timestamp
+
+        Args:
+            key: Grouping key
+            timestamp (float): End of the window in epoch seconds
+
+        Returns:
+            int: Number of events
+        """
+        bucket = int(timestamp // self.bucket_seconds)
+        buckets = self.buckets
+        with self._lock:
+            slot = self._find(hash(key) or 1)
+            if slot < 0:
+                return 0
+            newest = self._newest_view[slot]
+            if bucket - newest >= buckets:
+                return 0
+            # Only the slots still inside the window ending at `bucket` count
+            base = slot * buckets
+            return sum(self._count_view[base + b % buckets] for b in range(bucket - buckets + 1, newest + 1))
+
+    def _bases(self, key_hash):
+        """
+        First slots of the two sets a key may be held in
+        """
+        mask = self._sets - 1
+        return (key_hash & mask) * WAYS, ((key_hash >> 32) & mask) * WAYS
+
+    def _find(self, key_hash):
+        """
+        Slot holding a key, or -1
+        """
+        for base in self._bases(key_hash):
+            try:
+                return base + self._key_view[base:base + WAYS].tolist().index(key_hash)
+            except ValueError:
+                pass
+        return -1
+
+    def _claim(self, key_hash, bucket):
+        """
+        Give a new key a slot, with empty counts and the given newest bucket
+        """
+        while True:
+            base, other_base = self._bases(key_hash)
+            ways = self._newest_view[base:base + WAYS].tolist()
+            other = self._newest_view[other_base:other_base + WAYS].tolist()
+            # A free or expired slot of the emptier set, else the key whose last event is oldest
+            expired = bucket - self.buckets
+            vacant = sum(newest <= expired for newest in ways)
+            other_vacant = sum(newest <= expired for newest in other)
+            if vacant < other_vacant or (not vacant and min(other) < min(ways)):
+                base, ways = other_base, other
+            newest = min(ways)
+            slot = base + ways.index(newest)
+            if newest == _FREE or bucket - newest >= self.buckets:
+                break
+            if self._sets < self.max_sets:
+                self._grow()
+                continue
+            self.evicted += 1
+            if self.evicted == 1:
+                print(f"Velocity window of {self.window_seconds}s holds {self.max_keys} keys; active keys "
+                      f"now lose their counts to new ones (raise VELOCITY_MAX_KEYS)")
+            break
+        if newest == _FREE:
+            self._keys_held += 1
+        self._key_view[slot] = key_hash
+        self._newest_view[slot] = bucket
+        self._count_view[slot * self.buckets:(slot + 1) * self.buckets] = self._zero_row
+        return slot
+
+    def _grow(self):
+        """
+        Double the number of sets
+
+        A key's set is taken from its hash modulo the number of sets, so after
+        doubling each key either stays in its set or moves to the set that
+        many positions up, keeping its way.
+        """
+        sets = self._sets
+        keys, newest, counts = (array.reshape(sets, WAYS, -1) for array in self._arrays)
+        # Which of its two hashes placed each key in its set
+        placed_by = np.where((keys & (sets - 1)) == np.arange(sets).reshape(sets, 1, 1), keys, keys >> 32)
+        moved = ((placed_by & sets) != 0) & (newest != _FREE)
+        self._set_arrays(
+            np.concatenate([np.where(moved, 0, keys), np.where(moved, keys, 0)]).ravel(),
+            np.concatenate([np.where(moved, _FREE, newest), np.where(moved, newest, _FREE)]).ravel(),
+            np.concatenate([np.where(moved, 0, counts), np.where(moved, counts, 0)]).astype(np.uint16).ravel(),
+        )
+
+    def __len__(self):
+        return self._keys_held
+
+
+class VelocityTracker:
+    """
+    Sliding window counters for every (field, window) pair used by velocity checks
+
+    The tracker outlives rule set reloads, so counts are kept when the custom
+    rules change.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, max_keys=DEFAULT_MAX_KEYS):
+        """
+        Initialize the tracker
+
+        Args:
+            buckets (int): Buckets per window
+            max_keys (int): Maximum keys tracked per window
+        """
+        self.buckets = buckets
+        self.max_keys = max_keys
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    @property
+    def evicted(self):
+        """
+        Active keys dropped for new ones across all windows
+        """
+        return sum(counter.evicted for counter in list(self._counters.values()))
+
+    def _counter(self, window_seconds):
+        counter = self._counters.get(window_seconds)
+        if counter is None:
+            with self._lock:
+                counter = self._counters.get(window_seconds)
+                if counter is None:
+                    counter = SlidingWindowCounter(window_seconds, self.buckets, self.max_keys)
+                    self._counters[window_seconds] = counter
+        return counter
+
+    def observe(self, transaction, windows, transaction_history=None):
+        """
+        Count recent transactions sharing a field value with this one
+
+        Without a transaction history the transaction is recorded in the
+        in-memory counters. With a history the counts are computed from it
+        and the counters are left untouched.
+
+        Args:
+            transaction (dict): The transaction data
+            windows (iterable): (field, window_seconds) pairs to count
+            transaction_history (list): Optional list of previous transactions
+
+        Returns:
+            dict: (field, window_seconds) -> number of transactions in the window,
+                including this one; pairs whose field is missing are omitted
+        """
+        now = event_time(transaction.get("timestamp"))
+        counts = {}
+        for field, window_seconds in windows:
+            get_key = compile_accessor(field)
+            key = get_key(transaction)
+            if key is None or key is MISSING:
+                continue
+            if transaction_history is not None:
+                counts[(field, window_seconds)] = 1 + sum(
+                    1 for row in transaction_history
+                    if get_key(row) == key
+                    and 0 <= now - event_time(_read_timestamp(row)) < window_seconds
+                )
+            else:
+                if not isinstance(key, (str, int, float, bool)):
+                    key = str(key)
+                counts[(field, window_seconds)] = self._counter(window_seconds).add((field, key), now)
+        return counts
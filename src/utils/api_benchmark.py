@@ -0,0 +1,153 @@
+import argparse
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+import uuid
+
+import httpx
+
+from .generate_test_data import generate_transaction
+
+API_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "api")
+
+# App modules (in src/api) of the two implementations
+APPS = {"sync": "main:app", "async": "async_main:app"}
+
+TRANSACTION_FIELDS = ("amount", "payer_id", "payee_id", "payment_mode", "channel", "bank")
+
+
+def percentile(values, fraction):
+    """
+    Nearest-rank percentile of a list of numbers
+    """
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+def start_server(app, port, database_path, timeout=60):
+    """
+    Start one uvicorn worker serving an app on a fresh SQLite database
+
+    Args:
+        app (str): "module:attribute" of the app in src/api
+        port (int): Port to bind
+        database_path (str): SQLite file for this server
+        timeout (float): Seconds to wait for the server to answer /health
+
+    Returns:
+        subprocess.Popen: The server process
+    """
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{database_path}")
+    env.pop("ASYNC_DATABASE_URL", None)
+    process = subprocess.Popen([sys.executable, "-m", "uvicorn", app, "--port", str(port), "--log-level", "warning"],
+                               cwd=API_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{app} exited during startup")
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1).read()
+            return process
+        except OSError:
+            time.sleep(0.5)
+    process.kill()
+    raise RuntimeError(f"Timed out waiting for {app}")
+
+
+async def run_load(url, concurrency, requests):
+    """
+    Send /api/detect requests from concurrent clients
+
+    Each client sends its next request as soon as the previous one is
+    answered, until the total number of requests has been sent.
+
+    Args:
+        url (str): Base URL of the server
+        concurrency (int): Number of concurrent clients
+        requests (int): Total number of requests
+
+    Returns:
+        dict: requests, errors, requests_per_second, p50_ms and p99_ms
+    """
+    remaining = [requests]
+    latencies = []
+    errors = [0]
+
+    async def client(http):
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            transaction = generate_transaction()
+            body = {field: transaction.get(field) for field in TRANSACTION_FIELDS}
+            body["transaction_id"] = uuid.uuid4().hex
+            start = time.perf_counter()
+            try:
+                response = await http.post("/api/detect", json=body)
+                if response.status_code != 200:
+                    errors[0] += 1
+            except httpx.HTTPError:
+                errors[0] += 1
+            latencies.append(time.perf_counter() - start)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=120) as http:
+        start = time.perf_counter()
+        await asyncio.gather(*(client(http) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "requests": len(latencies),
+        "errors": errors[0],
+        "requests_per_second": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def benchmark(apps, concurrency_levels, requests, port=8092):
+    """
+    Measure each app at each concurrency level
+
+    Every app gets its own server and database, warmed up before measuring.
+
+    Args:
+        apps (list): Names from APPS
+        concurrency_levels (list): Numbers of concurrent clients
+        requests (int): Requests per measurement
+        port (int): Port to use
+
+    Returns:
+        list: (app, concurrency, result dict) per measurement
+    """
+    rows = []
+    for name in apps:
+        database_path = os.path.join(tempfile.mkdtemp(prefix="api-benchmark-"), "benchmark.db")
+        process = start_server(APPS[name], port, database_path)
+        try:
+            url = f"http://127.0.0.1:{port}"
+            asyncio.run(run_load(url, 10, 200))
+            for concurrency in concurrency_levels:
+                rows.append((name, concurrency, asyncio.run(run_load(url, concurrency, requests))))
+        finally:
+            process.send_signal(signal.SIGTERM)
+            process.wait(timeout=30)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare requests/sec and latency of the sync and async APIs")
+    parser.add_argument("--apps", nargs="+", choices=sorted(APPS), default=["sync", "async"])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[50, 200, 1000],
+                        help="Numbers of concurrent clients")
+    parser.add_argument("--requests", type=int, default=5000, help="Requests per measurement")
+    parser.add_argument("--port", type=int, default=8092)
+    args = parser.parse_args()
+
+    print(f"{'app':<6} {'clients':>8} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for name, concurrency, result in benchmark(args.apps, args.concurrency, args.requests, args.port):
+        print(f"{name:<6} {concurrency:>8} {result['requests']:>9} {result['errors']:>7} "
+              f"{result['requests_per_second']:>8.0f} {result['p50_ms']:>8.1f} {result['p99_ms']:>8.1f}")
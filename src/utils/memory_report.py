@@ -0,0 +1,147 @@
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+# Fields of /proc/<pid>/smaps_rollup reported, in kB
+MEMORY_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+API_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "api")
+
+
+def process_memory(pid):
+    """
+    Read the memory usage of a process from /proc (Linux only)
+
+    Args:
+        pid (int): Process ID
+
+    Returns:
+        dict: rss, pss, shared and private memory in kB
+    """
+    values = dict.fromkeys(MEMORY_FIELDS, 0)
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            field = parts[0].rstrip(":")
+            if field in values:
+                values[field] += int(parts[1])
+    return {
+        "rss": values["Rss"],
+        "pss": values["Pss"],
+        "shared": values["Shared_Clean"] + values["Shared_Dirty"],
+        "private": values["Private_Clean"] + values["Private_Dirty"],
+    }
+
+
+def child_pids(pid):
+    """
+    Direct children of a process, e.g. the workers of a gunicorn master
+    """
+    children = []
+    for task in os.listdir(f"/proc/{pid}/task"):
+        with open(f"/proc/{pid}/task/{task}/children") as f:
+            children.extend(int(child) for child in f.read().split())
+    return sorted(children)
+
+
+def memory_report(master_pid):
+    """
+    Memory usage of a gunicorn master and its workers
+
+    PSS splits shared pages between the processes sharing them, so the total
+    PSS is the real footprint of the whole server, unlike the sum of RSS.
+
+    Args:
+        master_pid (int): PID of the gunicorn master
+
+    Returns:
+        list: (role, pid, memory dict) for the master and each worker
+    """
+    rows = [("master", master_pid, process_memory(master_pid))]
+    for pid in child_pids(master_pid):
+        rows.append(("worker", pid, process_memory(pid)))
+    return rows
+
+
+def print_report(title, rows):
+    """
+    Print a memory report as a table (values in MB)
+    """
+    print(f"\n{title}")
+    print(f"{'process':<8} {'pid':>8} {'RSS':>9} {'PSS':>9} {'shared':>9} {'private':>9}")
+    for role, pid, memory in rows:
+        print(f"{role:<8} {pid:>8} " + " ".join(f"{memory[key] / 1024:>9.1f}"
+                                                  for key in ("rss", "pss", "shared", "private")))
+    total_pss = sum(memory["pss"] for _, _, memory in rows)
+    total_rss = sum(memory["rss"] for _, _, memory in rows)
+    print(f"{'total':<8} {'':>8} {total_rss / 1024:>9.1f} {total_pss / 1024:>9.1f}")
+    return total_pss
+
+
+def _wait_for_workers(process, port, workers, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("gunicorn exited during startup")
+        try:
+            if len(child_pids(process.pid)) >= workers:
+                urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1).read()
+                return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError("Timed out waiting for the gunicorn workers")
+
+
+def measure_server(preload, workers=4, port=8091, warmup_requests=20, timeout=120):
+    """
+    Start the API under gunicorn, warm it up and measure its memory
+
+    Args:
+        preload (bool): Whether to run with PRELOAD_APP=true
+        workers (int): Number of workers
+        port (int): Port to bind
+        warmup_requests (int): Requests sent before measuring
+        timeout (float): Seconds to wait for the workers to start
+
+    Returns:
+        list: Rows as returned by memory_report()
+    """
+    env = dict(os.environ, PRELOAD_APP="true" if preload else "false",
+               WEB_CONCURRENCY=str(workers), PORT=str(port))
+    env.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.gettempdir(), 'memory_report.db')}")
+    process = subprocess.Popen([sys.executable, "-m", "gunicorn", "main:app", "-c", "gunicorn_conf.py"],
+                               cwd=API_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        _wait_for_workers(process, port, workers, timeout)
+        for _ in range(warmup_requests):
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=5).read()
+        time.sleep(1)
+        return memory_report(process.pid)
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report RSS/PSS of the API's gunicorn master and workers")
+    parser.add_argument("--pid", type=int, help="PID of a running gunicorn master to report on")
+    parser.add_argument("--workers", type=int, default=4, help="Workers to start when comparing")
+    parser.add_argument("--port", type=int, default=8091, help="Port to use when comparing")
+    args = parser.parse_args()
+
+    if args.pid:
+        print_report(f"gunicorn master {args.pid}", memory_report(args.pid))
+    else:
+        # Compare a server without and with the preloaded, shared model
+        before = print_report("PRELOAD_APP=false (each worker loads the model)",
+                              measure_server(False, args.workers, args.port))
+        after = print_report("PRELOAD_APP=true (model loaded once in the master)",
+                             measure_server(True, args.workers, args.port))
+        print(f"\nTotal PSS: {before / 1024:.1f} MB -> {after / 1024:.1f} MB "
+              f"({(before - after) / 1024:.1f} MB saved)")
@@ -5,9 +5,15 @@ python init_db.py
 
 # Determine which component to start based on the APP_TYPE environment variable
 if [ "$APP_TYPE" = "api" ]; then
-    # Start the API server
+    # Start the API server; the model is loaded once in the master and shared
+    # with the workers unless PRELOAD_APP=false (see src/api/gunicorn_conf.py).
+    # ASYNC_API=true serves the async variant of the API instead
     cd src/api
-    gunicorn main:app --bind 0.0.0.0:${PORT:-8001} --workers 4 --worker-class uvicorn.workers.UvicornWorker --timeout 120
+    if [ "$ASYNC_API" = "true" ]; then
+        gunicorn async_main:app -c gunicorn_conf.py
+    else
+        gunicorn main:app -c gunicorn_conf.py
+    fi
 elif [ "$APP_TYPE" = "dashboard" ]; then
     # Start the dashboard
     cd src/dashboard
@@ -0,0 +1,65 @@
+import os
+import random
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from src.database import models
+from src.models.ai_model import AIFraudDetector
+from src.utils.generate_test_data import generate_transaction
+
+MODEL_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                          "src", "models", "trained", "fraud_model.pkl")
+
+
+@pytest.fixture
+def model_path():
+    """
+    The trained model shipped with the API
+    """
+    return MODEL_PATH
+
+
+@pytest.fixture
+def transactions():
+    """
+    Reproducible generated transactions with fixed timestamps and repeat payers
+    """
+    random.seed(7)
+    result = []
+    for i in range(2000):
+        transaction = generate_transaction()
+        transaction["payer_id"] = f"P{i % 50}"
+        transaction["timestamp"] = 1_700_000_000 + i
+        if i % 7 == 0:
+            transaction["amount"] = random.choice([10000, 10000.5, 25000, 25001, 50000, 50001, 60000])
+        result.append(transaction)
+    return result
+
+
+@pytest.fixture
+def trained_detector(transactions):
+    """
+    Freshly trained detector, so the scaler is fitted and folded into the thresholds
+    """
+    detector = AIFraudDetector()
+    labels = [int(t["amount"] > 20000 or (t["channel"] == "web" and t["amount"] > 900)) for t in transactions]
+    detector.train(transactions, labels)
+    return detector
+
+
+@pytest.fixture
+def db():
+    """
+    Session on a fresh in-memory SQLite database
+    """
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    models.Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
@@ -0,0 +1,69 @@
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from src.models.amount_lookup import AMOUNT_FEATURE, AMOUNT_THOUSANDS_FEATURE, AmountLookupTables, discrete_key
+
+
+def with_amount(row, amount):
+    row = list(row)
+    row[AMOUNT_FEATURE] = amount
+    row[AMOUNT_THOUSANDS_FEATURE] = amount / 1000
+    return row
+
+
+def test_extreme_amounts_match_the_forest(trained_detector, transactions):
+    forest = trained_detector.forest
+    tables = AmountLookupTables(forest)
+    rows = trained_detector.raw_features(transactions[:100]).tolist()
+    amounts = [0.0, -0.0, -1.0, -1e12, 1e-300, 5e-324, 999.9999999999999, 1e15, 1.7e308,
+               math.inf, -math.inf, math.nan]
+    probes = [with_amount(row, amount) for row in rows for amount in amounts]
+    assert [tables.fraud_probability(row) for row in probes] == [forest.score_row(row) for row in probes]
+
+
+def test_amounts_between_thousands_breakpoints_match_the_forest(trained_detector, transactions):
+    forest = trained_detector.forest
+    tables = AmountLookupTables(forest)
+    row = trained_detector.raw_features(transactions[:1]).tolist()[0]
+    # amount / 1000 rounds, so the last passing amount of a thousands split is
+    # not simply 1000 times its threshold; probe a few ulps either side
+    probes = []
+    for breakpoint in tables._reachable_breakpoints(row):
+        amount = float(breakpoint)
+        for _ in range(3):
+            amount = np.nextafter(amount, -np.inf)
+        for _ in range(7):
+            probes.append(with_amount(row, float(amount)))
+            amount = np.nextafter(amount, np.inf)
+    assert probes
+    assert [tables.fraud_probability(probe) for probe in probes] == [forest.score_row(probe) for probe in probes]
+
+
+def test_table_count_is_capped(trained_detector, transactions):
+    forest = trained_detector.forest
+    tables = AmountLookupTables(forest, max_tables=3)
+    rows = trained_detector.raw_features(transactions).tolist()
+    assert len({discrete_key(row) for row in rows}) > 3
+    # Combinations beyond the cap are scored by the forest directly
+    assert [tables.fraud_probability(row) for row in rows] == [forest.score_row(row) for row in rows]
+    assert len(tables.tables) == 3
+
+
+def test_precompile_builds_each_combination_once(trained_detector, transactions):
+    tables = AmountLookupTables(trained_detector.forest)
+    rows = trained_detector.raw_features(transactions[:300]).tolist()
+    combinations = {discrete_key(row) for row in rows}
+    assert tables.precompile(rows) == len(combinations) == len(tables.tables)
+    assert tables.precompile(rows) == 0
+
+
+def test_concurrent_lookups_share_tables(trained_detector, transactions):
+    forest = trained_detector.forest
+    tables = AmountLookupTables(forest)
+    rows = trained_detector.raw_features(transactions[:400]).tolist()
+    with ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(tables.fraud_probability, rows * 4))
+    assert results == [forest.score_row(row) for row in rows] * 4
+    assert len(tables.tables) == len({discrete_key(row) for row in rows})
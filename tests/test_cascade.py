@@ -0,0 +1,84 @@
+import os
+import zipfile
+
+import numpy as np
+import pytest
+from sklearn.tree import DecisionTreeRegressor
+
+from src.models.ai_model import AIFraudDetector
+from src.models.cascade import DEFAULT_SCREEN_DEPTH, ScreeningModel, build_cascade
+from src.models.features import extract_feature_matrix
+
+
+@pytest.fixture
+def detector(model_path):
+    return AIFraudDetector(model_path=model_path)
+
+
+@pytest.fixture
+def screen(detector, transactions):
+    # The shipped forest scores nearly every generated transaction 0.0, so a
+    # narrow band is needed to see both outcomes
+    screen, _ = build_cascade(detector, transactions, band=(0.005, 1.0))
+    return screen
+
+
+def test_screen_scores_like_the_distilled_tree(detector, transactions):
+    features = extract_feature_matrix(transactions)
+    targets = np.array([detector.forest_probability(row) for row in features.tolist()])
+    screen = ScreeningModel.distill(targets, features)
+    tree = DecisionTreeRegressor(max_depth=DEFAULT_SCREEN_DEPTH, random_state=42).fit(features, targets)
+    # Bit-exact with the tree, including rows that sit on a float32 threshold
+    assert [screen.score_row(row) for row in features.tolist()] == tree.predict(features).tolist()
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_saved_screen_loads_with_the_same_scores(screen, transactions, tmp_path, mmap):
+    path = str(tmp_path / "fraud_model.screen.npz")
+    screen.save(path)
+    loaded = ScreeningModel.load(path, mmap=mmap)
+    assert (loaded.low, loaded.high, loaded.source_digest) == (screen.low, screen.high, screen.source_digest)
+    for name in ScreeningModel.ARRAYS:
+        assert np.array_equal(getattr(loaded, name), getattr(screen, name))
+        # Mapped in place, at aligned offsets, rather than copied
+        assert getattr(loaded, name).flags.owndata is not mmap
+        assert getattr(loaded, name).flags.aligned
+    rows = extract_feature_matrix(transactions[:300]).tolist()
+    assert [loaded.score_row(row) for row in rows] == [screen.score_row(row) for row in rows]
+    with zipfile.ZipFile(path) as archive:
+        assert all(info.compress_type == zipfile.ZIP_STORED for info in archive.infolist())
+
+
+def test_only_uncertain_scores_reach_the_forest(detector, screen, transactions):
+    sample = transactions[:500]
+    forest_only = detector.predict_batch(sample)
+    detector.set_screening_model(screen)
+    cascaded = detector.predict_batch(sample)
+    assert detector.screened == len(sample) and 0 < detector.escalated < len(sample)
+    for transaction, result, reference in zip(sample, cascaded, forest_only):
+        score = screen.score_row(detector.extract_features(transaction))
+        if screen.is_uncertain(score):
+            assert result == reference
+        else:
+            assert result == detector.apply_amount_floor(transaction, score)
+
+
+def test_full_band_always_escalates(detector, screen, transactions):
+    sample = transactions[:200]
+    forest_only = detector.predict_batch(sample)
+    screen.low, screen.high = 0.0, 1.0
+    detector.set_screening_model(screen)
+    assert detector.predict_batch(sample) == forest_only
+    assert detector.escalated == len(sample)
+
+
+def test_unsupported_format_version_is_rejected(screen, tmp_path):
+    path = str(tmp_path / "screen.npz")
+    screen.save(path)
+    with np.load(path) as data:
+        arrays = {name: data[name] for name in data.files}
+    arrays["format_version"] = np.array(99)
+    os.remove(path)
+    np.savez(path, **arrays)
+    with pytest.raises(ValueError):
+        ScreeningModel.load(path)
@@ -0,0 +1,61 @@
+import pytest
+
+from src.models.combined_model import CombinedFraudDetector, decision_threshold
+
+RULES = [
+    {"id": 1, "name": "Large amount", "rule_type": "threshold", "field": "amount", "operator": ">",
+     "value": "20000", "score": 0.3, "is_active": True, "priority": 1},
+    {"id": 2, "name": "Web channel", "rule_type": "pattern", "field": "channel", "operator": "==",
+     "value": "web", "score": 0.4, "is_active": True, "priority": 2},
+    {"id": 3, "name": "Busy payer", "rule_type": "velocity", "field": "payer_id", "operator": ">",
+     "value": "3", "score": 0.5, "is_active": True, "priority": 3,
+     "advanced_config": {"time_window_minutes": 5}},
+]
+
+
+def comparable(result):
+    """
+    A detection result with its rule explanation rendered to text
+    """
+    is_fraud, fraud_score, rule_score, ai_score, reasons = result
+    reasons = dict(reasons, rule_reason=str(reasons["rule_reason"]))
+    return is_fraud, fraud_score, rule_score, ai_score, reasons
+
+
+@pytest.mark.parametrize("options", [{}, {"skip_decided_ai": True}, {"early_exit": True}])
+def test_batch_matches_single_detection(transactions, model_path, options):
+    # Separate detectors, so both see the velocity counters from the start
+    single = CombinedFraudDetector(custom_rules=RULES, ai_model_path=model_path, **options)
+    batch = CombinedFraudDetector(custom_rules=RULES, ai_model_path=model_path, **options)
+    try:
+        thresholds = [decision_threshold(t) for t in transactions]
+        expected = [single.detect_fraud(t, threshold=threshold) for t, threshold in zip(transactions, thresholds)]
+        results = batch.detect_fraud_batch(transactions, thresholds)
+    finally:
+        single.close()
+        batch.close()
+    assert [comparable(r) for r in results] == [comparable(r) for r in expected]
+    # The velocity rule and both verdicts are exercised
+    assert any("Busy payer" in str(r[4]["rule_reason"]) for r in expected)
+    assert {r[0] for r in expected} == {True, False}
+
+
+def test_skipped_ai_is_not_reported_as_a_score(transactions, model_path):
+    full = CombinedFraudDetector(custom_rules=RULES, ai_model_path=model_path)
+    skipping = CombinedFraudDetector(custom_rules=RULES, ai_model_path=model_path, skip_decided_ai=True)
+    try:
+        thresholds = [decision_threshold(t) for t in transactions]
+        expected = full.detect_fraud_batch(transactions, thresholds)
+        results = skipping.detect_fraud_batch(transactions, thresholds)
+        sources = [skipping.describe_reason(t, r[2], r[3], r[4])[0] for t, r in zip(transactions, results)]
+    finally:
+        full.close()
+        skipping.close()
+    assert skipping.ai_skipped > 0
+    for result, reference, source in zip(results, expected, sources):
+        assert result[0] == reference[0]
+        if result[4].get("ai_skipped"):
+            assert result[3] is None
+            assert source == "rule"
+        else:
+            assert result[1:4] == reference[1:4]
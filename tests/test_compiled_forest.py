@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from src.models.amount_lookup import AMOUNT_FEATURE, AMOUNT_THOUSANDS_FEATURE, AmountLookupTables
+from src.models.compiled_forest import CompiledForest
+
+
+def expected_probabilities(detector, rows):
+    return detector.model.predict_proba(detector.scaler.transform(np.asarray(rows)))[:, 1]
+
+
+def test_forest_matches_predict_proba(trained_detector, transactions):
+    rows = trained_detector.raw_features(transactions)
+    expected = expected_probabilities(trained_detector, rows)
+    forest = trained_detector.forest
+    assert np.array_equal(forest.fraud_probability(rows), expected)
+    assert [forest.score_row(row) for row in rows.tolist()] == expected.tolist()
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_saved_forest_matches_predict_proba(trained_detector, transactions, tmp_path, mmap):
+    path = str(tmp_path / "forest.npz")
+    trained_detector.forest.save(path)
+    forest = CompiledForest.load(path, mmap=mmap)
+    rows = trained_detector.raw_features(transactions)
+    expected = expected_probabilities(trained_detector, rows)
+    assert forest.source_digest == trained_detector.forest.source_digest
+    assert np.array_equal(forest.fraud_probability(rows), expected)
+    assert [forest.score_row(row) for row in rows.tolist()] == expected.tolist()
+
+
+def test_amount_tables_match_predict_proba(trained_detector, transactions):
+    tables = AmountLookupTables(trained_detector.forest)
+    rows = trained_detector.raw_features(transactions[:200]).tolist()
+    # Amounts exactly at and just past every reachable split, where rounding matters most
+    probes = []
+    for row in rows[:20]:
+        for breakpoint in tables._reachable_breakpoints(row)[:50]:
+            for amount in (breakpoint, np.nextafter(breakpoint, np.inf)):
+                probe = list(row)
+                probe[AMOUNT_FEATURE] = float(amount)
+                probe[AMOUNT_THOUSANDS_FEATURE] = float(amount) / 1000
+                probes.append(probe)
+    rows.extend(probes)
+    expected = expected_probabilities(trained_detector, rows)
+    assert [tables.fraud_probability(row) for row in rows] == expected.tolist()
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.models.features import FEATURE_NAMES, extract_feature_matrix, extract_feature_row
+
+BASE = {"amount": 1234.5, "payer_id": "P12345", "payee_id": "M678", "payment_mode": "credit_card",
+        "channel": "web", "bank": "Chase"}
+
+EDGE_CASES = [
+    BASE,
+    dict(BASE, amount=0),
+    dict(BASE, amount=60000),
+    # Categories the one-hot columns do not know
+    dict(BASE, payment_mode="crypto", channel="atm"),
+    dict(BASE, payment_mode="", channel="WEB"),
+    dict(BASE, payment_mode=None, channel=None),
+    # Missing or empty optional fields
+    {key: value for key, value in BASE.items() if key not in ("payer_id", "payee_id", "bank")},
+    dict(BASE, payer_id=None, payee_id="", bank=None),
+    dict(BASE, bank=""),
+]
+
+
+def row(transaction):
+    return np.asarray(extract_feature_row(transaction), dtype=np.float64)
+
+
+@pytest.mark.parametrize("transaction", EDGE_CASES)
+def test_row_matches_the_matrix(transaction):
+    matrix = extract_feature_matrix([transaction])
+    assert matrix.shape == (1, len(FEATURE_NAMES))
+    assert np.array_equal(row(transaction), matrix[0])
+
+
+def test_unknown_categories_have_no_one_hot_column():
+    features = dict(zip(FEATURE_NAMES, row(dict(BASE, payment_mode="crypto", channel="atm"))))
+    assert not any(value for name, value in features.items()
+                   if name.startswith(("payment_mode_", "channel_")))
+
+
+def test_matrix_rows_match_single_rows(transactions):
+    sample = transactions[:300] + EDGE_CASES
+    expected = np.array([row(transaction) for transaction in sample])
+    assert np.array_equal(extract_feature_matrix(sample), expected)
+    # Training and batch callers may pass a DataFrame instead
+    assert np.array_equal(extract_feature_matrix(pd.DataFrame(sample)), expected)
@@ -0,0 +1,95 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import pytest
+
+from src.models.ai_model import AIFraudDetector
+from src.models.inference_queue import InferenceBatcher
+
+
+class Doubler:
+    """
+    Detector whose score is twice the amount; records the batch sizes it saw
+    """
+
+    def __init__(self):
+        self.batch_sizes = []
+        self.lock = threading.Lock()
+
+    def predict(self, transaction):
+        return self.predict_batch([transaction])[0]
+
+    def predict_batch(self, transactions):
+        if any(t["amount"] < 0 for t in transactions):
+            raise ValueError("negative amount")
+        with self.lock:
+            self.batch_sizes.append(len(transactions))
+        return [(False, 2.0 * t["amount"]) for t in transactions]
+
+
+def test_concurrent_requests_share_batches():
+    detector = Doubler()
+    batcher = InferenceBatcher(detector, max_batch_size=8, max_wait_ms=20)
+    try:
+        with ThreadPoolExecutor(16) as executor:
+            results = list(executor.map(lambda i: batcher.predict({"amount": i}), range(64)))
+    finally:
+        batcher.close()
+    assert results == [(False, 2.0 * i) for i in range(64)]
+    assert sum(detector.batch_sizes) == 64 == batcher.rows
+    assert max(detector.batch_sizes) <= 8 and batcher.batches < 64
+
+
+def test_batch_failure_reaches_every_caller_in_it():
+    batcher = InferenceBatcher(Doubler(), max_wait_ms=50)
+    try:
+        futures = [batcher.submit({"amount": amount}) for amount in (1, -1)]
+        for future in futures:
+            with pytest.raises(ValueError):
+                future.result(timeout=5)
+        # The dispatcher keeps serving later requests
+        assert batcher.predict({"amount": 3}) == (False, 6.0)
+    finally:
+        batcher.close()
+
+
+def test_submit_after_close_scores_inline():
+    detector = Doubler()
+    batcher = InferenceBatcher(detector)
+    assert batcher.predict({"amount": 1}) == (False, 2.0)
+    batcher.close()
+    future = batcher.submit({"amount": 2})
+    assert future.done() and future.result() == (False, 4.0)
+    with pytest.raises(ValueError):
+        batcher.predict({"amount": -1})
+
+
+def test_submissions_racing_close_all_resolve():
+    for _ in range(20):
+        batcher = InferenceBatcher(Doubler(), max_wait_ms=0.1)
+        start = threading.Barrier(9)
+
+        def submit_many(offset):
+            start.wait()
+            return [batcher.submit({"amount": offset + i}) for i in range(50)]
+
+        with ThreadPoolExecutor(8) as executor:
+            submitted = [executor.submit(submit_many, 100 * n) for n in range(8)]
+            start.wait()
+            batcher.close()
+            futures = [future for batch in submitted for future in batch.result()]
+        done, not_done = wait(futures, timeout=5)
+        assert not not_done
+        assert sorted(future.result()[1] for future in futures) == sorted(
+            2.0 * (100 * n + i) for n in range(8) for i in range(50))
+
+
+def test_batched_scores_match_the_detector(transactions, model_path):
+    detector = AIFraudDetector(model_path=model_path)
+    batcher = InferenceBatcher(detector, max_batch_size=16, max_wait_ms=5)
+    try:
+        with ThreadPoolExecutor(8) as executor:
+            results = list(executor.map(batcher.predict, transactions[:200]))
+    finally:
+        batcher.close()
+    assert results == [detector.predict(transaction) for transaction in transactions[:200]]
@@ -0,0 +1,61 @@
+from src.database import crud
+from src.database.rule_cache import RuleSnapshotCache
+
+RULE = {
+    "name": "Large amount",
+    "rule_type": "threshold",
+    "field": "amount",
+    "operator": ">",
+    "value": 20000,
+    "score": 0.3,
+}
+
+
+def names(snapshot):
+    return [rule["name"] for rule in snapshot.rules]
+
+
+def test_rule_crud_bumps_the_version(db):
+    assert crud.get_rule_version(db) == 0
+    rule = crud.create_custom_rule(db, RULE)
+    crud.update_custom_rule(db, rule.id, {"score": 0.4})
+    crud.activate_deactivate_rule(db, rule.id, False)
+    crud.delete_custom_rule(db, rule.id)
+    assert crud.get_rule_version(db) == 4
+
+
+def test_snapshot_follows_rule_crud(db):
+    cache = RuleSnapshotCache(poll_interval=0)
+    published = []
+    cache.subscribe(published.append)
+    assert names(cache.get_snapshot(db)) == []
+
+    rule = crud.create_custom_rule(db, RULE)
+    assert names(cache.get_snapshot(db)) == ["Large amount"]
+
+    crud.update_custom_rule(db, rule.id, {"score": 0.4, "value": 25000})
+    snapshot = cache.get_snapshot(db)
+    assert (snapshot.rules[0]["score"], snapshot.rules[0]["value"]) == (0.4, "25000")
+
+    crud.activate_deactivate_rule(db, rule.id, False)
+    assert names(cache.get_snapshot(db)) == []
+    crud.activate_deactivate_rule(db, rule.id, True)
+    assert names(cache.get_snapshot(db)) == ["Large amount"]
+
+    crud.delete_custom_rule(db, rule.id)
+    assert names(cache.get_snapshot(db)) == []
+    # One snapshot per version, and none while nothing changed
+    cache.get_snapshot(db)
+    assert [snapshot.version for snapshot in published] == [0, 1, 2, 3, 4, 5]
+
+
+def test_snapshot_is_reused_until_the_poll_interval_or_invalidate(db):
+    cache = RuleSnapshotCache(poll_interval=3600)
+    first = cache.get_snapshot(db)
+    crud.create_custom_rule(db, RULE)
+    assert cache.get_snapshot(db) is first
+
+    cache.invalidate()
+    snapshot = cache.get_snapshot(db)
+    assert snapshot.version == 1
+    assert names(snapshot) == ["Large amount"]
@@ -0,0 +1,171 @@
+import random
+
+import pytest
+
+from src.models.rule_based import RuleBasedFraudDetector, default_config
+
+FIELDS = ["amount", "payment_mode", "channel", "bank", "payer_id", "payee_id", "missing"]
+OPERATORS = ["==", "!=", ">", "<", ">=", "<=", "in", "not_in", "contains", "not_contains",
+             "starts_with", "ends_with", "bogus"]
+VALUES = {
+    "amount": ["100", "5000", "abc", "12000.5", "0", 100, 5000.0, True],
+    "payment_mode": ["credit_card", "debit_card", "credit_card, debit_card", "card", "wallet,upi"],
+}
+OTHER_VALUES = ["P1", "M1", "Chase", "P", "1", "P1,M2", "web", "C", "None", 1, 1.0]
+
+
+def reference_rule(rule, transaction):
+    """
+    Interpret one custom rule the way the evaluator did before rules were compiled
+
+    Returns:
+        tuple: (matches, reason)
+    """
+    field, operator, value = rule["field"], rule["operator"], rule["value"]
+    if field not in transaction:
+        return False, ""
+    transaction_value = transaction.get(field)
+    if operator in (">", "<", ">=", "<="):
+        try:
+            value = float(value)
+            transaction_value = float(transaction_value) if transaction_value is not None else 0
+        except (ValueError, TypeError):
+            return False, ""
+    if operator == "==":
+        return str(transaction_value) == str(value), f"{field} equals {value}"
+    if operator == "!=":
+        return str(transaction_value) != str(value), f"{field} not equals {value}"
+    if operator == ">":
+        return transaction_value > value, f"{field} greater than {value}"
+    if operator == "<":
+        return transaction_value < value, f"{field} less than {value}"
+    if operator == ">=":
+        return transaction_value >= value, f"{field} greater than or equal to {value}"
+    if operator == "<=":
+        return transaction_value <= value, f"{field} less than or equal to {value}"
+    if operator in ("in", "not_in"):
+        if not isinstance(value, str):
+            return False, ""
+        members = [v.strip() for v in value.split(",")]
+        if operator == "in":
+            return str(transaction_value) in members, f"{field} in list {value}"
+        return str(transaction_value) not in members, f"{field} not in list {value}"
+    string_tests = {
+        "contains": (lambda tv: value in tv, "contains"),
+        "not_contains": (lambda tv: value not in tv, "does not contain"),
+        "starts_with": (lambda tv: tv.startswith(value), "starts with"),
+        "ends_with": (lambda tv: tv.endswith(value), "ends with"),
+    }
+    if operator in string_tests:
+        test, label = string_tests[operator]
+        matches = isinstance(transaction_value, str) and isinstance(value, str) and test(transaction_value)
+        return matches, f"{field} {label} {value}"
+    return False, ""
+
+
+def reference_risk_score(config, rules, transaction):
+    """
+    Risk score and reason from the built-in rules and an uncompiled pass over the custom rules
+    """
+    score = 0.0
+    reasons = []
+    amount = transaction["amount"]
+    threshold = config["amount_threshold"]
+    if amount > threshold:
+        score += 0.5
+        reasons.append(f"Amount ({amount}) exceeds threshold ({threshold})")
+    elif amount > threshold / 2:
+        score += 0.3
+        reasons.append(f"Amount ({amount}) exceeds half threshold ({threshold / 2})")
+    elif amount > 10000:
+        score += 0.2
+        reasons.append(f"Amount ({amount}) exceeds 10,000")
+    if transaction["channel"] in config["high_risk_channels"]:
+        score += 0.2
+        reasons.append(f"High-risk channel: {transaction['channel']}")
+    if transaction["payment_mode"] in config["high_risk_payment_modes"]:
+        score += 0.2
+        reasons.append(f"High-risk payment mode: {transaction['payment_mode']}")
+
+    custom_score = 0.0
+    for rule in sorted(rules, key=lambda r: r["priority"], reverse=True):
+        if not rule["is_active"]:
+            continue
+        matches, reason = reference_rule(rule, transaction)
+        if matches:
+            custom_score += rule["score"]
+            reasons.append(f"Custom rule '{rule['name']}': {reason}")
+    score = min(score + custom_score, 1.0)
+    return score, "; ".join(reasons) if reasons else "No rules triggered"
+
+
+def random_rules(rng, count):
+    rules = []
+    for i in range(count):
+        field = rng.choice(FIELDS)
+        rules.append({
+            "id": i,
+            "name": f"rule {i}",
+            "rule_type": "threshold",
+            "field": field,
+            "operator": rng.choice(OPERATORS),
+            "value": rng.choice(VALUES.get(field, OTHER_VALUES)),
+            "score": rng.choice([0.05, 0.1, 0.2, 0.3]),
+            "priority": rng.randint(1, 5),
+            "is_active": rng.random() < 0.9,
+            "advanced_config": None,
+        })
+    return rules
+
+
+def random_transaction(rng):
+    return {
+        "amount": rng.choice([0, 50, 100, 5000, 10000, 12000.5, 25001, 30000, 60000]),
+        "payment_mode": rng.choice(["credit_card", "debit_card", "digital_wallet", "upi"]),
+        "channel": rng.choice(["web", "in_store", "mobile_app", "1"]),
+        "bank": rng.choice(["Chase", None, "Citi"]),
+        "payer_id": rng.choice(["P1", "P12", "XP1", 1]),
+        "payee_id": rng.choice(["M1", "M2", "M12"]),
+    }
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_compiled_rules_match_reference_evaluator(seed):
+    rng = random.Random(seed)
+    for _ in range(40):
+        rules = random_rules(rng, rng.randint(0, 40))
+        detector = RuleBasedFraudDetector(custom_rules=rules, velocity=False)
+        for _ in range(20):
+            transaction = random_transaction(rng)
+            assert detector.calculate_risk_score(transaction) == \
+                reference_risk_score(default_config(), rules, transaction)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_early_exit_keeps_the_verdict(seed):
+    rng = random.Random(seed)
+    for _ in range(40):
+        rules = random_rules(rng, rng.randint(0, 60))
+        detector = RuleBasedFraudDetector(custom_rules=rules, velocity=False)
+        for _ in range(20):
+            transaction = random_transaction(rng)
+            threshold = rng.choice([0.05, 0.3, 0.5, 0.8, 1.0])
+            full = detector.evaluate(transaction)
+            early = detector.evaluate(transaction, early_exit=True, threshold=threshold)
+            assert (early.score >= threshold) == (full.score >= threshold)
+            # Without a threshold only a saturated score stops evaluation
+            saturated = detector.evaluate(transaction, early_exit=True)
+            assert saturated.score == full.score
+
+
+def test_equal_values_of_different_types_stay_separate_conditions():
+    rules = [
+        {"id": i, "name": f"amount is {value!r}", "rule_type": "combination", "field": "amount",
+         "operator": "==", "value": value, "score": 0.1, "priority": 1, "is_active": True,
+         "advanced_config": {"condition": {"field": "amount", "operator": "==", "value": value}}}
+        for i, value in enumerate([1, 1.0, True])
+    ]
+    detector = RuleBasedFraudDetector(custom_rules=rules, velocity=False)
+    reason = detector.evaluate({"amount": 1.0, "channel": "in_store", "payment_mode": "upi"}).reason
+    assert reason.count("Custom rule") == 1
+    assert "amount is 1.0" in reason
@@ -0,0 +1,152 @@
+import csv
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from src.api import schemas
+from src.models.combined_model import CombinedFraudDetector
+from src.models.score_file import OUTPUT_FIELDS, load_rules, score_file
+from src.models.scoring_pool import score_transactions
+
+FIELDS = ("transaction_id", "amount", "payer_id", "payee_id", "payment_mode", "channel", "bank")
+
+RULES = [
+    {"id": 1, "name": "Web channel", "rule_type": "pattern", "field": "channel", "operator": "==",
+     "value": "web", "score": 0.4, "is_active": True, "priority": 1},
+    {"id": 2, "name": "Large amount", "rule_type": "threshold", "field": "amount", "operator": ">",
+     "value": 20000, "score": 0.3, "is_active": True, "priority": 5},
+    {"id": 3, "name": "Busy payer", "rule_type": "velocity", "field": "payer_id", "operator": ">",
+     "value": 3, "score": 0.5, "is_active": True, "priority": 3, "advanced_config": {"time_window_minutes": 5}},
+    {"id": 4, "name": "Retired", "rule_type": "pattern", "field": "channel", "operator": "==",
+     "value": "phone", "score": 0.9, "is_active": False, "priority": 9},
+]
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def rules_path(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps({"rules": RULES}))
+    return str(path)
+
+
+@pytest.fixture
+def input_path(tmp_path, transactions):
+    lines = [json.dumps({field: t[field] for field in FIELDS}) for t in transactions[:400]]
+    lines[10:10] = ["", "{broken", json.dumps({"transaction_id": "x", "amount": 5})]
+    path = tmp_path / "transactions.jsonl"
+    path.write_text("\n".join(lines) + "\n")
+    return str(path)
+
+
+def read_jsonl(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_rule_exports_load_like_the_api_stores_them(rules_path, tmp_path):
+    rules = load_rules(rules_path)
+    assert [rule["name"] for rule in rules] == ["Large amount", "Busy payer", "Web channel"]
+    assert rules[0]["value"] == "20000" and isinstance(rules[0]["score"], float)
+    # A plain list, as returned by GET /api/rules
+    plain = tmp_path / "plain.json"
+    plain.write_text(json.dumps(RULES))
+    assert load_rules(str(plain)) == rules
+
+
+def test_results_match_in_process_scoring(input_path, rules_path, tmp_path, model_path, transactions):
+    rules = load_rules(rules_path)
+    output = str(tmp_path / "results.jsonl")
+    summary = score_file(input_path, output, rules, chunk_size=64, explain=True, model_path=model_path)
+    assert (summary["rows"], summary["invalid_rows"]) == (402, 2)
+    assert set(summary["timings"]) >= {"read", "validate", "score", "write"}
+
+    results = read_jsonl(output)
+    # Blank lines are skipped but still counted
+    assert [result["line"] for result in results] == list(range(1, 11)) + list(range(12, 404))
+    assert "error" in results[10] and "error" in results[11]
+    # Validated the way the API validates a request body
+    valid = [schemas.TransactionBase.parse_obj({field: t[field] for field in FIELDS}).dict()
+             for t in transactions[:400]]
+    detector = CombinedFraudDetector(ai_model_path=model_path, custom_rules=rules, velocity=False)
+    try:
+        expected = score_transactions(detector, valid, explain=True)
+    finally:
+        detector.close()
+    scored = results[:10] + results[12:]
+    assert [(r["is_fraud_predicted"], r["fraud_score"], r["rule_score"], r["ai_score"], r["fraud_source"],
+             r["fraud_reason"]) for r in scored] == [result[:6] for result in expected]
+    # Velocity rules never fire offline
+    assert not any("Busy payer" in r["fraud_reason"] for r in scored)
+
+
+def test_results_do_not_depend_on_workers_or_chunks(input_path, rules_path, tmp_path, model_path):
+    rules = load_rules(rules_path)
+    outputs = []
+    for workers, chunk_size in ((0, 1000), (0, 7), (2, 50)):
+        output = str(tmp_path / f"results-{workers}-{chunk_size}.jsonl")
+        score_file(input_path, output, rules, workers=workers, chunk_size=chunk_size, model_path=model_path)
+        outputs.append(read_jsonl(output))
+    assert outputs[0] == outputs[1] == outputs[2]
+
+
+def test_csv_in_and_out(input_path, rules_path, tmp_path, model_path, transactions):
+    rules = load_rules(rules_path)
+    reference = str(tmp_path / "reference.jsonl")
+    score_file(input_path, reference, rules, model_path=model_path)
+    csv_input = str(tmp_path / "transactions.csv")
+    with open(csv_input, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows({field: t[field] for field in FIELDS} for t in transactions[:400])
+    output = str(tmp_path / "results.csv")
+    score_file(csv_input, output, rules, model_path=model_path)
+    with open(output, newline="") as f:
+        reader = csv.DictReader(f)
+        assert tuple(reader.fieldnames) == OUTPUT_FIELDS
+        rows = list(reader)
+    expected = [result for result in read_jsonl(reference) if "error" not in result]
+    assert [(row["transaction_id"], float(row["fraud_score"])) for row in rows] == \
+        [(result["transaction_id"], result["fraud_score"]) for result in expected]
+
+
+def test_parquet_needs_pyarrow(input_path, tmp_path):
+    try:
+        import pyarrow  # noqa: F401
+        pytest.skip("pyarrow is installed")
+    except ImportError:
+        pass
+    with pytest.raises(RuntimeError, match="pyarrow"):
+        score_file(input_path, str(tmp_path / "results.parquet"), [])
+
+
+def test_parquet_round_trip(input_path, rules_path, tmp_path, model_path):
+    pyarrow = pytest.importorskip("pyarrow")
+    import pyarrow.parquet
+    rules = load_rules(rules_path)
+    reference = str(tmp_path / "reference.jsonl")
+    score_file(input_path, reference, rules, model_path=model_path)
+    output = str(tmp_path / "results.parquet")
+    score_file(input_path, output, rules, model_path=model_path)
+    rows = pyarrow.parquet.read_table(output).to_pylist()
+    assert [{key: value for key, value in row.items() if value is not None} for row in rows] == \
+        read_jsonl(reference)
+
+
+def test_command_line(input_path, rules_path, tmp_path):
+    output = str(tmp_path / "results.jsonl")
+    command = [sys.executable, "-m", "src.models.score_file", input_path, output, "--rules", rules_path,
+               "--workers", "0", "--explain"]
+    completed = subprocess.run(command, cwd=PROJECT_ROOT, capture_output=True, text=True)
+    assert completed.returncode == 0, completed.stderr
+    assert "Loaded 3 active custom rules" in completed.stdout
+    assert "Scored 402 rows (2 invalid)" in completed.stdout
+    assert len(read_jsonl(output)) == 402
+
+    missing = subprocess.run(command[:3] + [str(tmp_path / "missing.jsonl")] + command[4:], cwd=PROJECT_ROOT,
+                             capture_output=True, text=True)
+    assert missing.returncode == 1 and "does not exist" in missing.stdout
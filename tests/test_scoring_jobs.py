@@ -0,0 +1,155 @@
+import csv
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.api import scoring_jobs
+from src.api.scoring_jobs import ScoringJobRunner
+from src.database import crud
+from src.models.combined_model import CombinedFraudDetector
+from src.models.score_file import read_rows, read_rows_from
+from src.models.scoring_pool import score_transactions
+
+FIELDS = ("transaction_id", "amount", "payer_id", "payee_id", "payment_mode", "channel", "bank")
+
+
+class Crash(BaseException):
+    """
+    Stands in for the worker process dying mid-chunk
+    """
+
+
+def write_jsonl(path, transactions):
+    lines = [json.dumps({field: t[field] for field in FIELDS}) for t in transactions]
+    # Blank and unreadable lines keep their place in the line numbering
+    lines[3:3] = ["", "not json", "[1, 2]"]
+    path.write_text("\n".join(lines) + "\n")
+
+
+def write_csv(path, transactions):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        for i, t in enumerate(transactions):
+            row = {field: t[field] for field in FIELDS}
+            if i % 10 == 0:
+                # Quoted values may span lines
+                row["bank"] = "First\nNational"
+            writer.writerow(row)
+            if i == 5:
+                f.write("\r\n")
+
+
+@pytest.fixture(params=["jsonl", "csv"])
+def input_file(request, tmp_path, transactions):
+    path = tmp_path / f"input.{request.param}"
+    (write_jsonl if request.param == "jsonl" else write_csv)(path, [
+        dict(t, transaction_id=f"t{i}") for i, t in enumerate(transactions[:230])])
+    return str(path), request.param
+
+
+@pytest.fixture
+def detector(model_path):
+    detector = CombinedFraudDetector(ai_model_path=model_path, velocity=False)
+    yield detector
+    detector.close()
+
+
+def test_reading_resumes_at_any_row(input_file):
+    path, input_format = input_file
+    rows = list(read_rows_from(path, input_format))
+    assert [(line_number, row) for line_number, row, _ in rows] == list(read_rows(path, input_format))
+    for i in (0, 1, 5, 6, 17, len(rows) - 1):
+        rest = [(line_number, row) for line_number, row, _ in read_rows_from(path, input_format, rows[i][2])]
+        assert rest == [(line_number, row) for line_number, row, _ in rows[i + 1:]]
+
+
+def create_job(db, tmp_path, input_file, job_id="job1"):
+    path, input_format = input_file
+    return crud.create_scoring_job(db, {
+        "id": job_id, "input_format": input_format, "explain": True, "input_path": path,
+        "output_path": str(tmp_path / f"{job_id}.results.jsonl"), "chunk_size": 40,
+        "total_rows": scoring_jobs.count_rows(path, input_format),
+    })
+
+
+def results(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def run_uninterrupted(db, tmp_path, input_file, score_chunk):
+    runner = ScoringJobRunner(score_chunk)
+    job = create_job(db, tmp_path, input_file, "reference")
+    runner._process(db, crud.claim_scoring_job(db, runner.worker, datetime.utcnow()))
+    return results(job.output_path)
+
+
+def test_stopped_job_resumes_after_its_last_chunk(db, tmp_path, input_file, detector, monkeypatch):
+    scored_ids = []
+
+    def score_chunk(transaction_dicts, explain):
+        scored_ids.extend(t["transaction_id"] for t in transaction_dicts)
+        if len(scored_ids) >= 100:
+            first._stop.set()
+        return score_transactions(detector, transaction_dicts, explain)
+
+    first = ScoringJobRunner(score_chunk)
+    job = create_job(db, tmp_path, input_file)
+    first._process(db, crud.claim_scoring_job(db, first.worker, datetime.utcnow()))
+    db.refresh(job)
+    assert job.status == "queued" and 0 < job.rows_done < job.total_rows and job.input_bytes > 0
+    resume_at = (job.input_bytes, job.input_lines)
+
+    positions = []
+
+    def spy(path, input_format, position=(0, 0)):
+        positions.append(position)
+        return read_rows_from(path, input_format, position)
+
+    monkeypatch.setattr(scoring_jobs, "read_rows_from", spy)
+    second = ScoringJobRunner(score_chunk)
+    second._process(db, crud.claim_scoring_job(db, second.worker, datetime.utcnow()))
+    db.refresh(job)
+    assert job.status == "completed" and job.rows_done == job.total_rows
+    # Continued from the recorded offset; every row was scored once
+    assert positions == [resume_at]
+    assert len(scored_ids) == len(set(scored_ids))
+    monkeypatch.undo()
+    assert results(job.output_path) == run_uninterrupted(db, tmp_path, input_file, score_chunk)
+
+
+def test_stale_job_is_taken_over_from_its_last_committed_chunk(db, tmp_path, input_file, detector):
+    chunks = []
+
+    def crashing(transaction_dicts, explain):
+        chunks.append(len(transaction_dicts))
+        if len(chunks) == 3:
+            raise Crash()
+        return score_transactions(detector, transaction_dicts, explain)
+
+    first = ScoringJobRunner(crashing)
+    job = create_job(db, tmp_path, input_file)
+    claimed = crud.claim_scoring_job(db, first.worker, datetime.utcnow())
+    first_attempt = claimed.attempt
+    with pytest.raises(Crash):
+        first._process(db, claimed)
+    # Half a line written before the crash, after the last committed chunk
+    with open(job.output_path, "a") as f:
+        f.write('{"line": 9')
+
+    db.refresh(job)
+    assert job.status == "running"
+    # Not taken over while the worker still counts as alive
+    assert crud.claim_scoring_job(db, "other", datetime.utcnow() - timedelta(seconds=60)) is None
+    second = ScoringJobRunner(lambda t, explain: score_transactions(detector, t, explain))
+    second._process(db, crud.claim_scoring_job(db, second.worker, datetime.utcnow() + timedelta(seconds=1)))
+    db.refresh(job)
+    assert job.status == "completed" and job.worker == second.worker
+    # The first worker's attempt can no longer record progress
+    assert not crud.update_scoring_job(db, job.id, first_attempt, {"rows_done": 0})
+    reference = run_uninterrupted(db, tmp_path, input_file,
+                                  lambda t, explain: score_transactions(detector, t, explain))
+    assert results(job.output_path) == reference
+    assert [result["line"] for result in reference] == [line for line, _ in read_rows(*input_file)]
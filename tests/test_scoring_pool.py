@@ -0,0 +1,66 @@
+import pytest
+
+from src.database.rule_cache import RuleSnapshot
+from src.models.combined_model import CombinedFraudDetector
+from src.models.scoring_pool import ScoringPool, score_transactions
+from tests.conftest import MODEL_PATH
+
+WEB = {"id": 1, "name": "Web channel", "rule_type": "pattern", "field": "channel", "operator": "==",
+       "value": "web", "score": 0.4, "is_active": True, "priority": 1}
+BUSY_PAYER = {"id": 2, "name": "Busy payer", "rule_type": "velocity", "field": "payer_id", "operator": ">",
+              "value": "3", "score": 0.5, "is_active": True, "priority": 2,
+              "advanced_config": {"time_window_minutes": 5}}
+LARGE = {"id": 3, "name": "Large amount", "rule_type": "threshold", "field": "amount", "operator": ">",
+         "value": "20000", "score": 0.3, "is_active": True, "priority": 3}
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = ScoringPool(2, MODEL_PATH, chunk_size=150)
+    pool.warm_up()
+    yield pool
+    pool.close()
+
+
+def rule_names(result):
+    return [name for name in ("Web channel", "Busy payer", "Large amount") if name in result[5]]
+
+
+def test_pool_matches_in_process_scoring(pool, transactions, model_path):
+    transactions = transactions[:600]
+    snapshot = RuleSnapshot(1, [WEB, BUSY_PAYER])
+    parent = CombinedFraudDetector(ai_model_path=model_path)
+    reference = CombinedFraudDetector(ai_model_path=model_path)
+    try:
+        rules = parent.rules_for(snapshot)
+        scored = pool.score(transactions, explain=True, rules=rules,
+                            velocity_counts=parent.count_velocity(transactions, rules))
+        expected = score_transactions(reference, transactions, explain=True, rules=reference.rules_for(snapshot))
+    finally:
+        parent.close()
+        reference.close()
+    # Timings aside, the same results; velocity counts span all chunks
+    assert [result[:6] for result in scored] == [result[:6] for result in expected]
+    assert all("Busy payer" in result[5] for result in scored[-150:])
+
+
+def test_pool_scores_with_the_pinned_snapshot(pool, transactions, model_path):
+    transactions = transactions[:300]
+    detector = CombinedFraudDetector(ai_model_path=model_path, velocity=False)
+    try:
+        pinned = detector.rules_for(RuleSnapshot(1, [WEB]))
+        # A newer snapshot is published while the request holds version 1
+        pool.update_rules(2, [LARGE])
+        scored = pool.score(transactions, explain=True, rules=pinned)
+        latest = pool.score(transactions, explain=True)
+    finally:
+        detector.close()
+    assert {name for result in scored for name in rule_names(result)} == {"Web channel"}
+    assert {name for result in latest for name in rule_names(result)} == {"Large amount"}
+
+
+def test_pool_workers_keep_no_velocity_counts(pool, transactions):
+    payer = [dict(transaction, payer_id="P1") for transaction in transactions[:50]]
+    pool.update_rules(3, [BUSY_PAYER])
+    scored = pool.score(payer, explain=True, chunk_size=10)
+    assert not any("Busy payer" in result[5] or "Velocity: " in result[5] for result in scored)
@@ -0,0 +1,79 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.api import endpoints
+from src.database import database, models
+
+FIELDS = ("amount", "payer_id", "payee_id", "payment_mode", "channel", "bank")
+
+
+async def byte_stream(chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+def lines_of(chunks):
+    async def collect():
+        return [line async for line in endpoints.iter_lines(byte_stream(chunks))]
+    return asyncio.run(collect())
+
+
+def test_lines_are_split_across_chunk_boundaries():
+    body = b'{"a": 1}\n{"b": 2}\n\n{"c": 3}'
+    expected = [b'{"a": 1}', b'{"b": 2}', b"", b'{"c": 3}']
+    assert lines_of([body]) == expected
+    # Any split of the body, down to one byte per chunk
+    for size in (1, 2, 3, 7):
+        assert lines_of([body[i:i + size] for i in range(0, len(body), size)]) == expected
+    assert lines_of([b"x\n", b"", b"y\n"]) == [b"x", b"y"]
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'fraud.db'}")
+    models.Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(database, "SessionLocal", sessionmaker(bind=engine))
+    monkeypatch.setattr(endpoints, "STREAM_CHUNK_SIZE", 4)
+    app = FastAPI()
+    app.include_router(endpoints.router, prefix="/api")
+    with TestClient(app) as client:
+        client.sessions = sessionmaker(bind=engine)
+        yield client
+    engine.dispose()
+
+
+def upload(transactions):
+    lines = [json.dumps(dict({field: t[field] for field in FIELDS}, transaction_id=f"s{i}"))
+             for i, t in enumerate(transactions)]
+    # Blank, unreadable and invalid lines among the transactions
+    lines[2:2] = ["", "not json", json.dumps(dict(json.loads(lines[0]), transaction_id="neg", amount=-5))]
+    return ("\n".join(lines) + "\n").encode()
+
+
+def test_stream_returns_one_line_per_input_line_in_order(client, transactions):
+    response = client.post("/api/batch-detect/stream?explain=true", content=upload(transactions[:15]),
+                           headers={"Content-Type": "application/x-ndjson"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert len(results) == 17
+    assert results[2] == {"line": 4, "error": results[2]["error"]}
+    assert results[3]["line"] == 5 and "Amount must be positive" in results[3]["error"]
+    scored = [result for result in results if "error" not in result]
+    assert [result["transaction_id"] for result in scored] == [f"s{i}" for i in range(15)]
+    assert all(result["fraud_reason"] for result in scored)
+    # Every valid transaction is stored
+    with client.sessions() as db:
+        stored = {row.transaction_id: row.fraud_score for row in db.query(models.Transaction)}
+    assert stored == {result["transaction_id"]: result["fraud_score"] for result in scored}
+
+
+def test_empty_stream_returns_no_lines(client):
+    response = client.post("/api/batch-detect/stream", content=b"\n\n")
+    assert response.status_code == 200 and response.text == ""
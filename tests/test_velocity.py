@@ -0,0 +1,104 @@
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+from src.models.rule_based import RuleBasedFraudDetector
+from src.models.velocity import SlidingWindowCounter, VelocityTracker, event_time
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("2024-01-01T00:00:00Z", 1704067200.0),
+    (datetime(2024, 1, 1, tzinfo=timezone.utc), 1704067200.0),
+    (1704067200, 1704067200.0),
+])
+def test_event_time_reads_timestamps(value, expected):
+    assert event_time(value) == expected
+
+
+@pytest.mark.parametrize("value", [None, "", "yesterday", "2024-13-45", float("nan"), float("inf"), 1e300,
+                                   True, [2024]])
+def test_unreadable_timestamps_count_as_now(value):
+    before = time.time()
+    assert before <= event_time(value) <= time.time()
+
+
+def test_malformed_timestamp_is_scored():
+    detector = RuleBasedFraudDetector()
+    transaction = {"amount": 100, "channel": "web", "payment_mode": "upi", "payer_id": "P1",
+                   "timestamp": "not a time"}
+    for _ in range(6):
+        score, reason = detector.calculate_risk_score(transaction)
+    assert "Velocity: 6 transactions from payer P1" in reason
+
+
+def test_window_counts_slide():
+    counter = SlidingWindowCounter(100)
+    assert [counter.add("k", t) for t in (0, 50, 95)] == [1, 2, 3]
+    assert counter.count("k", 120) == 2
+    assert counter.add("k", 150) == 2
+    assert counter.count("k", 300) == 0
+    assert counter.add("other", 150) == 1
+
+
+def test_late_events_count_at_their_own_time():
+    counter = SlidingWindowCounter(100)
+    for t in (0, 50, 95):
+        counter.add("k", t)
+    # The window ending at 40 holds the events at 0 and 40
+    assert counter.add("k", 40) == 2
+    # Older than the kept window: only the event itself is known
+    assert counter.add("k", -20) == 1
+    assert counter.add("k", 99) == 5
+
+
+def test_tracker_counts_per_field_and_window():
+    tracker = VelocityTracker()
+    windows = [("payer_id", 60), ("payer_id", 600), ("payee_id", 60)]
+    counts = None
+    for t in (0, 40, 90):
+        counts = tracker.observe({"payer_id": "P1", "payee_id": f"M{t}", "timestamp": t}, windows)
+    assert counts == {("payer_id", 60): 2, ("payer_id", 600): 3, ("payee_id", 60): 1}
+
+
+def test_counts_survive_table_growth():
+    counter = SlidingWindowCounter(100, max_keys=100000)
+    initial_slots = len(counter._arrays[0])
+    for t in (0, 10):
+        for i in range(5000):
+            counter.add(f"P{i}", t)
+    assert len(counter._arrays[0]) > initial_slots
+    assert len(counter) == 5000 and counter.evicted == 0
+    assert all(counter.count(f"P{i}", 20) == 2 for i in range(5000))
+
+
+def test_full_table_evicts_the_least_recently_seen_keys():
+    counter = SlidingWindowCounter(100, max_keys=1)
+    capacity = counter.max_keys
+    for i in range(capacity + 500):
+        counter.add(f"P{i}", i * 0.001)
+    assert counter.evicted > 0
+    assert len(counter) <= capacity
+    # The most recent keys are kept; evicted ones count from zero again
+    assert counter.count(f"P{capacity + 499}", 1) == 1
+    assert sum(counter.count(f"P{i}", 1) == 0 for i in range(capacity + 500)) == counter.evicted
+
+
+def test_expired_keys_free_their_slots():
+    counter = SlidingWindowCounter(100, max_keys=1)
+    for i in range(counter.max_keys):
+        counter.add(f"P{i}", 0)
+    evicted = counter.evicted
+    # Keys whose window has passed make room without evictions
+    for i in range(counter.max_keys // 2):
+        counter.add(f"Q{i}", 200)
+    assert counter.evicted == evicted
+    assert counter.count("P0", 200) == 0 and counter.count("Q0", 200) == 1
+
+
+def test_tracker_reports_evictions():
+    tracker = VelocityTracker(max_keys=1)
+    windows = [("payer_id", 60), ("payee_id", 60)]
+    for i in range(tracker._counter(60).max_keys + 100):
+        tracker.observe({"payer_id": f"P{i}", "payee_id": "M1", "timestamp": 0}, windows)
+    assert tracker.evicted == tracker._counter(60).evicted > 0
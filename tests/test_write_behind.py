@@ -0,0 +1,112 @@
+import json
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.database import models, write_behind
+from src.database.write_behind import TransactionWriter
+
+DECIDED_AT = datetime(2024, 1, 2, 3, 4, 5)
+
+
+def record(i):
+    return {
+        "transaction_id": f"t{i}", "timestamp": DECIDED_AT + timedelta(seconds=i), "amount": 100.0 + i,
+        "payer_id": "P1", "payee_id": "M1", "payment_mode": "upi", "channel": "web", "bank": None,
+        "additional_data": None, "is_fraud_predicted": False, "fraud_score": 0.1, "prediction_time_ms": 1,
+    }
+
+
+class Database:
+    """
+    File-backed database whose sessions fail while it is down
+    """
+
+    def __init__(self, path):
+        self.engine = create_engine(f"sqlite:///{path}")
+        models.Base.metadata.create_all(bind=self.engine)
+        self.sessions = sessionmaker(bind=self.engine)
+        self.unreachable = sessionmaker(bind=create_engine(f"sqlite:///{path}.missing/db"))
+        self.down = False
+
+    def __call__(self):
+        return self.unreachable() if self.down else self.sessions()
+
+    def rows(self):
+        with self.sessions() as db:
+            return {row.transaction_id: row.timestamp for row in db.query(models.Transaction)}
+
+
+@pytest.fixture
+def database(tmp_path):
+    database = Database(tmp_path / "fraud.db")
+    yield database
+    database.engine.dispose()
+
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(monkeypatch):
+    monkeypatch.setattr(write_behind, "RETRY_INTERVAL", 0.0)
+
+
+def test_rows_are_written_with_their_decision_time(database, tmp_path):
+    writer = TransactionWriter(session_factory=database, batch_size=4, spill_base=str(tmp_path / "spill"))
+    writer.start()
+    writer.submit([record(i) for i in range(10)])
+    writer.close()
+    assert database.rows() == {f"t{i}": record(i)["timestamp"] for i in range(10)}
+    assert writer.written == 10
+
+
+def test_rows_spilled_while_the_database_is_down_are_replayed(database, tmp_path):
+    writer = TransactionWriter(session_factory=database, spill_base=str(tmp_path / "spill"))
+    database.down = True
+    writer.start()
+    writer.submit([record(i) for i in range(5)])
+    writer.flush()
+    assert writer.spilled == 5 and database.rows() == {}
+
+    database.down = False
+    writer.submit([record(5)])
+    writer.close()
+    # Spilled rows go first and keep the time they were decided at
+    assert database.rows() == {f"t{i}": record(i)["timestamp"] for i in range(6)}
+    assert writer.replayed == 5
+    assert not os.path.exists(writer.spill_path)
+
+
+def test_orphaned_spill_files_are_replayed_on_start(database, tmp_path):
+    base = str(tmp_path / "spill")
+    # Left behind by two processes that no longer run; one died mid-write
+    for pid, ids in ((999991, range(0, 3)), (999992, range(3, 7))):
+        with open(f"{base}.{pid}.jsonl", "w") as f:
+            f.write("".join(write_behind._dump_record(record(i)) + "\n" for i in ids))
+    with open(f"{base}.999992.jsonl", "a") as f:
+        f.write('{"transaction_id": "t7", "amo')
+
+    writer = TransactionWriter(session_factory=database, spill_base=base)
+    writer.start()
+    writer.close()
+    assert database.rows() == {f"t{i}": record(i)["timestamp"] for i in range(7)}
+    assert writer.failed == 1
+    assert os.listdir(tmp_path) == ["fraud.db"]
+
+
+def test_rows_that_cannot_be_written_or_spilled_are_counted(database, tmp_path):
+    writer = TransactionWriter(session_factory=database, spill_base=str(tmp_path / "missing" / "spill"))
+    database.down = True
+    writer.start()
+    writer.submit([record(0), record(1)])
+    writer.flush()
+    assert writer.failed == 2
+    assert writer._thread.is_alive()
+    writer.close()
+
+
+def test_spill_lines_round_trip():
+    line = write_behind._dump_record(record(3))
+    assert json.loads(line)["timestamp"] == "2024-01-02T03:04:08"
+    assert write_behind._load_record(line) == record(3)